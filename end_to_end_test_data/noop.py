@@ -1,3 +1,7 @@
+import asyncio
+import threading
+import time
+
 import stl.lib
 
 
@@ -8,3 +12,64 @@ class NoOp(stl.lib.Event):
 
   def Wait(self, *args):
     return True
+
+
+class AsyncNoOp(stl.lib.AsyncEvent):
+
+  # Event loops the events ran in.
+  loops = set()
+
+  async def Fire(self, *args):
+    await asyncio.sleep(0)
+    AsyncNoOp.loops.add(asyncio.get_running_loop())
+    return True
+
+  async def Wait(self, *args):
+    return await self.Fire(*args)
+
+
+class Hang(stl.lib.Event):
+  """Never returns until cancelled, like a Wait for a message never sent."""
+
+  def Fire(self, context, *args):
+    context.cancelled.wait()
+    return True
+
+  def Wait(self, context, *args):
+    return self.Fire(context, *args)
+
+
+class Sleep(stl.lib.Event):
+  """Sleeps a little, counting how many events sleep at the same time."""
+
+  # Most events which slept at the same time.
+  most = 0
+  _sleeping = 0
+  _lock = threading.Lock()
+
+  def Fire(self, *args):
+    with Sleep._lock:
+      Sleep._sleeping += 1
+      Sleep.most = max(Sleep.most, Sleep._sleeping)
+    time.sleep(0.05)
+    with Sleep._lock:
+      Sleep._sleeping -= 1
+    return True
+
+  def Wait(self, *args):
+    return self.Fire(*args)
+
+
+class NoOpReset(stl.lib.Reset):
+
+  def Reset(self, roles):
+    return True
+
+
+class NoOpSnapshot(stl.lib.Snapshot):
+
+  def Snapshot(self, roles):
+    return object()
+
+  def Restore(self, roles, handle):
+    return True
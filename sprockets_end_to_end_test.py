@@ -3,6 +3,7 @@
 import os
 import shutil
 import tempfile
+import time
 import unittest
 
 import mock
@@ -17,6 +18,319 @@ class EndToEndTest(unittest.TestCase):
     self.assertTrue(test_driver.RunTest(
         'end_to_end_test_data/simple_example.test', {}))
 
+  def testSymmetricStates(self, mock_visualizer):
+    self.assertTrue(test_driver.RunTest(
+        'end_to_end_test_data/symmetric_example.test', {}))
+
+  def testInferSymmetry(self, mock_visualizer):
+    args = test_driver.ParseArgs(
+        ['--symmetry', 'end_to_end_test_data/simple_example.test'])
+    self.assertTrue(test_driver.RunTest(
+        'end_to_end_test_data/simple_example.test', {}, args))
+
+  def testReset(self, mock_visualizer):
+    self.assertTrue(test_driver.RunTest(
+        'end_to_end_test_data/reset_example.test', {}))
+
+  def testNoReset(self, mock_visualizer):
+    manifest = test_driver.LoadManifest(
+        'end_to_end_test_data/reset_example.test', {})
+    del manifest['reset']
+    with mock.patch('test_driver.LoadManifest', return_value=manifest):
+      with self.assertRaisesRegexp(RuntimeError, 'not strongly connected'):
+        test_driver.RunTest('end_to_end_test_data/reset_example.test', {})
+
+  def testParallel(self, mock_visualizer):
+    args = test_driver.ParseArgs(
+        ['--parallel', 'end_to_end_test_data/parallel_example.test'])
+    with mock.patch('test_driver.Report.Log', autospec=True) as mock_log:
+      self.assertTrue(test_driver.RunTest(
+          'end_to_end_test_data/parallel_example.test', {}, args))
+    report = mock_log.call_args[0][0]
+    self.assertEqual({'tConnectTls1': 2, 'tDisconnectTls1': 1,
+                      'tCloseTls1': 1}, dict(report.passed))
+    self.assertEqual(0, report.resets)
+
+  def testStrategy(self, mock_visualizer):
+    for strategy in ['smoke', 'weighted', 'online']:
+      args = test_driver.ParseArgs(
+          ['--strategy', strategy, 'end_to_end_test_data/reset_example.test'])
+      self.assertTrue(test_driver.RunTest(
+          'end_to_end_test_data/reset_example.test', {}, args))
+
+  def testBudget(self, mock_visualizer):
+    manifest = test_driver.LoadManifest(
+        'end_to_end_test_data/reset_example.test', {})
+    # Each transition is estimated at 100 ms from the cost_ms hint of
+    # tCloseTls, so only one fits.
+    manifest['strategy'] = {'name': 'budget', 'budget_ms': 150}
+    with mock.patch('test_driver.LoadManifest', return_value=manifest):
+      with mock.patch('test_driver.Report.Log', autospec=True) as mock_log:
+        self.assertTrue(test_driver.RunTest(
+            'end_to_end_test_data/reset_example.test', {}))
+    report = mock_log.call_args[0][0]
+    self.assertEqual({'tConnectTls1': 1}, dict(report.passed))
+    self.assertEqual({'tCloseTls1': 1, 'tDisconnectTls1': 1},
+                     dict(report.skipped))
+
+  def testSnapshot(self, mock_visualizer):
+    # tCloseTls cannot be undone, but a snapshot can be restored instead.
+    with mock.patch('test_driver.Report.Log', autospec=True) as mock_log:
+      self.assertTrue(test_driver.RunTest(
+          'end_to_end_test_data/snapshot_example.test', {}))
+    report = mock_log.call_args[0][0]
+    self.assertEqual(['tCloseTls1', 'tConnectTls1', 'tDisconnectTls1'],
+                     sorted(report.passed))
+    self.assertFalse(report.skipped)
+
+  def testSnapshotStrategyWithoutSnapshot(self, mock_visualizer):
+    args = test_driver.ParseArgs(
+        ['--strategy', 'snapshot', 'end_to_end_test_data/simple_example.test'])
+    with self.assertRaisesRegexp(RuntimeError, 'needs a snapshot'):
+      test_driver.RunTest('end_to_end_test_data/simple_example.test', {}, args)
+
+  def testHistory(self, mock_visualizer):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      history = os.path.join(tmpdir, 'history.json')
+      args = test_driver.ParseArgs(
+          ['--history', history, 'end_to_end_test_data/reset_example.test'])
+      with mock.patch('test_driver.Report.Log', autospec=True) as mock_log:
+        self.assertTrue(test_driver.RunTest(
+            'end_to_end_test_data/reset_example.test', {}, args))
+        # Only tCloseTls has a cost hint before any run is measured.
+        self.assertEqual(100, mock_log.call_args[0][0].estimated_ms)
+        self.assertTrue(test_driver.RunTest(
+            'end_to_end_test_data/reset_example.test', {}, args))
+        self.assertLess(mock_log.call_args[0][0].estimated_ms, 100)
+      self.assertEqual(
+          ['tCloseTls1', 'tConnectTls1', 'tDisconnectTls1'],
+          sorted(test_driver.stl.history.History(history).transitions))
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def testCostHintsWithoutHistory(self, mock_visualizer):
+    test_driver.AddManifestRootToPath('end_to_end_test_data/reset_example.test')
+    transitions, states, _, _, _ = test_driver.LoadTest(
+        test_driver.LoadManifest('end_to_end_test_data/reset_example.test', {}),
+        'end_to_end_test_data/reset_example.test')
+    [(transition_graph, _)] = test_driver.BuildTransitionGraphs(transitions,
+                                                                states)
+    weights = dict((attr['label'], attr['weight'])
+                   for _, _, attr in transition_graph.edges(data=True))
+    # Edges no longer weigh 1 each. Transitions without a hint count as the
+    # mean of the known ones.
+    self.assertEqual({'tCloseTls1': 100, 'tConnectTls1': 100,
+                      'tDisconnectTls1': 100}, weights)
+    with mock.patch('test_driver.Report.Log', autospec=True) as mock_log:
+      self.assertTrue(test_driver.RunTest(
+          'end_to_end_test_data/reset_example.test', {}))
+    self.assertEqual(100, mock_log.call_args[0][0].estimated_ms)
+
+  def testFailuresFirst(self, mock_visualizer):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      history = os.path.join(tmpdir, 'history.json')
+      with open(history, 'w') as history_file:
+        history_file.write('{"tDisconnectTls1": {"runs": 1, "mean_ms": 1.0, '
+                           '"failures": 1}}')
+      args = test_driver.ParseArgs(
+          ['--history', history, 'end_to_end_test_data/reset_example.test'])
+      order = []
+
+      def Run(transition):
+        order.append(transition.name)
+        return True
+
+      with mock.patch.object(test_driver.stl.state.Transition, 'Run',
+                             autospec=True, side_effect=Run):
+        self.assertTrue(test_driver.RunTest(
+            'end_to_end_test_data/reset_example.test', {}, args))
+      self.assertEqual(['tConnectTls1', 'tDisconnectTls1'], order[:2])
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def testRest(self, mock_visualizer):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      ledger = os.path.join(tmpdir, 'ledger.json')
+      order = []
+
+      def Run(transition):
+        order.append(transition.name)
+        return True
+
+      for build, expected in [('1', 3), ('1', 0), ('2', 3)]:
+        args = test_driver.ParseArgs([
+            '--ledger', ledger, '--build', build, '--rest',
+            'end_to_end_test_data/reset_example.test'])
+        del order[:]
+        with mock.patch.object(test_driver.stl.state.Transition, 'Run',
+                               autospec=True, side_effect=Run):
+          self.assertTrue(test_driver.RunTest(
+              'end_to_end_test_data/reset_example.test', {}, args))
+        self.assertEqual(expected, len(set(order)))
+      # A selection matching nothing stays empty with the rest of a build.
+      self.assertEqual([], self._RunOrder([
+          '--ledger', ledger, '--build', '3', '--rest', '--select', 'NoMatch'
+      ]))
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def testRestWithoutLedger(self, mock_visualizer):
+    args = test_driver.ParseArgs(
+        ['--rest', 'end_to_end_test_data/reset_example.test'])
+    with self.assertRaisesRegexp(RuntimeError, 'needs a --ledger'):
+      test_driver.RunTest('end_to_end_test_data/reset_example.test', {}, args)
+
+  def _RunOrder(self, argv):
+    """Runs reset_example.test and returns the names of transitions run."""
+    order = []
+
+    def Run(transition):
+      order.append(transition.name)
+      return True
+
+    args = test_driver.ParseArgs(
+        ['end_to_end_test_data/reset_example.test'] + argv)
+    with mock.patch.object(test_driver.stl.state.Transition, 'Run',
+                           autospec=True, side_effect=Run):
+      self.assertTrue(test_driver.RunTest(
+          'end_to_end_test_data/reset_example.test', {}, args))
+    return order
+
+  def testSelect(self, mock_visualizer):
+    self.assertEqual(['tConnectTls1', 'tCloseTls1'],
+                     self._RunOrder(['--select', 'Close']))
+    self.assertEqual(3, len(set(self._RunOrder(
+        ['--select-states', 'sTlsState(1)', '--select-roles', 'rSender']))))
+    self.assertEqual([], self._RunOrder(['--select-states', 'sTlsState(2)']))
+
+  def testSelectStatesOfModule(self, mock_visualizer):
+    self.assertEqual(
+        self._RunOrder(['--select-states', 'sTlsState(1)']),
+        self._RunOrder(['--select-states', 'example::sTlsState(1)']))
+
+  def testSelectSymmetricTransitions(self, mock_visualizer):
+    test_driver.AddManifestRootToPath(
+        'end_to_end_test_data/symmetric_example.test')
+    transitions, states, symmetry, _, _ = test_driver.LoadTest(
+        test_driver.LoadManifest('end_to_end_test_data/symmetric_example.test',
+                                 {}),
+        'end_to_end_test_data/symmetric_example.test')
+    graph, _ = test_driver.stl.graph.BuildTransitionGraph(transitions, states,
+                                                          symmetry)
+    # Edges of the reduced graph run whichever transition of the orbit of
+    # tConnectTls1 applies, and only one of them is labelled tConnectTls1.
+    self.assertEqual(1, len(test_driver._SelectedEdges(graph,
+                                                       {'tConnectTls1'})))
+    edges = test_driver._SelectedEdges(graph, {'tConnectTls1'}, symmetry)
+    self.assertEqual(6, len(edges))
+    self.assertEqual(set(['tConnectTls']),
+                     set(graph.edges[e]['transition'].template for e in edges))
+
+  def testBaseline(self, mock_visualizer):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      baseline = os.path.join(tmpdir, 'baseline.json')
+      self.assertEqual(3, len(set(self._RunOrder(['--baseline', baseline]))))
+      self.assertEqual([], self._RunOrder(['--baseline', baseline]))
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def testAsyncio(self, mock_visualizer):
+    for argv, num_loops in [(['--asyncio'], 1), ([], 2)]:
+      args = test_driver.ParseArgs(
+          argv + ['end_to_end_test_data/async_example.test'])
+      self.assertTrue(test_driver.RunTest(
+          'end_to_end_test_data/async_example.test', {}, args))
+      # Without --asyncio, each event runs in a loop of its own.
+      loops = test_driver.importlib.import_module('noop').AsyncNoOp.loops
+      self.assertEqual(num_loops, len(loops))
+      loops.clear()
+
+  def testConcurrency(self, mock_visualizer):
+    for argv, most in [(['--concurrency', '3'], 3),
+                       (['--concurrency', '3', '--asyncio'], 3), ([], 2)]:
+      args = test_driver.ParseArgs(
+          argv + ['end_to_end_test_data/concurrent_example.test'])
+      with mock.patch('test_driver.Report.Log', autospec=True) as mock_log:
+        self.assertTrue(test_driver.RunTest(
+            'end_to_end_test_data/concurrent_example.test', {}, args))
+      self.assertEqual(6, sum(mock_log.call_args[0][0].passed.values()))
+      # Only state machines without a role in common run at once. The two TLS
+      # connections share their roles and run in one lane, so only the adverts
+      # run alongside them. An advert goes to two listeners at once.
+      sleep = test_driver.importlib.import_module('noop').Sleep
+      self.assertEqual(most, sleep.most)
+      sleep.most = 0
+
+  def testLookahead(self, mock_visualizer):
+    # A single state machine, whose link and advert transitions run at once
+    # where its walk takes them one after another.
+    for argv, most in [(['--concurrency', '2'], 2),
+                       (['--concurrency', '2', '--asyncio'], 2), ([], 1)]:
+      args = test_driver.ParseArgs(
+          argv + ['end_to_end_test_data/lookahead_example.test'])
+      with mock.patch('test_driver.Report.Log', autospec=True) as mock_log:
+        self.assertTrue(test_driver.RunTest(
+            'end_to_end_test_data/lookahead_example.test', {}, args))
+      self.assertEqual(0, sum(mock_log.call_args[0][0].skipped.values()))
+      sleep = test_driver.importlib.import_module('noop').Sleep
+      self.assertEqual(most, sleep.most)
+      sleep.most = 0
+
+  def testLookaheadFailure(self, mock_visualizer):
+    run = test_driver.stl.state.Transition.Run
+
+    def FailLinkUp(transition):
+      return transition.name != 'tLinkUp1' and run(transition)
+
+    reports = []
+    for argv in (['--concurrency', '2'], []):
+      args = test_driver.ParseArgs(
+          argv + ['end_to_end_test_data/lookahead_example.test'])
+      with mock.patch.object(test_driver.stl.state.Transition, 'Run',
+                             autospec=True, side_effect=FailLinkUp):
+        with mock.patch('test_driver.Report.Log', autospec=True) as mock_log:
+          self.assertFalse(test_driver.RunTest(
+              'end_to_end_test_data/lookahead_example.test', {}, args))
+      report = mock_log.call_args[0][0]
+      reports.append((report.passed, report.failed, report.skipped))
+    # The advert which ran alongside the failed link counts from the vertex
+    # the link failed to, and the walk goes on from there like without
+    # lookahead.
+    self.assertEqual(reports[1], reports[0])
+    self.assertEqual({'tLinkUp1': 2}, dict(reports[0][1]))
+
+  def testConcurrencyAtLeastOne(self, mock_visualizer):
+    with mock.patch('sys.stderr'):
+      with self.assertRaises(SystemExit):
+        test_driver.ParseArgs(
+            ['--concurrency', '0', 'end_to_end_test_data/simple_example.test'])
+
+  def testTimeout(self, mock_visualizer):
+    args = test_driver.ParseArgs(['end_to_end_test_data/timeout_example.test'])
+    start = time.time()
+    with mock.patch('test_driver.Report.Log', autospec=True) as mock_log:
+      self.assertFalse(test_driver.RunTest(
+          'end_to_end_test_data/timeout_example.test', {}, args))
+    self.assertLess(time.time() - start, 5)
+    # The run goes on from the error states of the transition which hung.
+    report = mock_log.call_args[0][0]
+    self.assertEqual({'tConnectTls1': 1}, dict(report.failed))
+    self.assertEqual({'tDisconnectTls1': 1}, dict(report.passed))
+
+  def testFailFast(self, mock_visualizer):
+    args = test_driver.ParseArgs(
+        ['--fail-fast', 'end_to_end_test_data/simple_example.test'])
+    with mock.patch.object(test_driver.stl.state.Transition, 'Run',
+                           return_value=False):
+      with mock.patch('test_driver.Report.Log', autospec=True) as mock_log:
+        self.assertFalse(test_driver.RunTest(
+            'end_to_end_test_data/simple_example.test', {}, args))
+    self.assertEqual(1, sum(mock_log.call_args[0][0].failed.values()))
+
   def testDidYouMean_Transition(self, mock_visualizer):
     # The tConnectTlsActual transition has a a typo; raise an exception
     # with a helpful error message.
@@ -13,7 +13,10 @@
 # limitations under the License.
 """Base classes, functions, exceptions."""
 
+import asyncio
+import copy
 import logging
+import threading
 
 import stl.levenshtein
 
@@ -631,6 +634,9 @@ class FuncWithContext(Func):
 
   Attributes:
     context: Context to run this event function.
+    timeout_ms: Optional milliseconds after which running this event fails.
+    group: Optional number of the parallel { } block of this event within its
+        transition. Consecutive events of the same block run at once.
   """
 
   class Context(object):
@@ -641,12 +647,17 @@ class FuncWithContext(Func):
       target: Target role of this event function.
       test_source: Whether or not this function call is to test source Role.
           If not, this function call is to test target Role.
+      cancelled: threading.Event set when the call timed out. Events which
+          block for long should check it, e.g. with cancelled.wait(seconds)
+          instead of time.sleep(seconds), and give up once it is set. Each
+          call gets a copy of the context with an Event of its own.
     """
 
     def __init__(self):
       self.source = None
       self.target = None
       self.test_source = False
+      self.cancelled = threading.Event()
 
     def __str__(self):
       return ('CONTEXT: s(%s)%s, t(%s)%s' % (self.source,
@@ -658,15 +669,88 @@ class FuncWithContext(Func):
     Func.__init__(self, name)
     self.event = event
     self.context = FuncWithContext.Context()
+    self.timeout_ms = None
+    self.group = None
 
   def __str__(self):
-    return ('FUNC %s: s(%s), t(%s), a(%s)' % (
-        self.name, self.context.source, self.context.target, GetCSV(self.args)))
+    return ('FUNC %s: s(%s), t(%s), a(%s)%s' % (
+        self.name, self.context.source, self.context.target, GetCSV(self.args),
+        '' if self.group is None else ' g(%d)' % self.group))
 
-  def Run(self):
-    logging.log(2, 'Running ' + str(self))
-    new_args = [self.context]
+  def _CallContext(self):
+    """Returns a copy of the context with a cancelled Event of its own.
+
+    A call which timed out may still run when the event runs again, and must
+    keep seeing its own cancellation. |context.cancelled| is the Event of the
+    last call.
+    """
+    context = copy.copy(self.context)
+    context.cancelled = threading.Event()
+    self.context.cancelled = context.cancelled
+    return context
+
+  def _Call(self, context):
+    new_args = [context]
     new_args.extend(self.args)
-    if self.context.test_source:
+    if context.test_source:
       return self.event.Wait(*new_args)
     return self.event.Fire(*new_args)
+
+  def _RunNow(self, context):
+    result = self._Call(context)
+    if asyncio.iscoroutine(result):  # stl.lib.AsyncEvent
+      return asyncio.run(result)
+    return result
+
+  def _TimedOut(self, timeout_ms, context):
+    logging.error('Timed out after %d ms: %s', timeout_ms, self)
+    context.cancelled.set()
+    return False
+
+  def Run(self, timeout_ms=None):
+    """Runs the event, in a watchdog thread if there is a timeout.
+
+    Args:
+      timeout_ms: Optional milliseconds after which the event fails. The event
+          is asked to stop through |context.cancelled|, but is not killed.
+    Returns:
+      The result of the event, or False if it timed out.
+    """
+    logging.log(2, 'Running ' + str(self))
+    context = self._CallContext()
+    if timeout_ms is None:
+      return self._RunNow(context)
+    outcome = []
+
+    def Watched():
+      try:
+        outcome.append((self._RunNow(context), None))
+      except Exception as e:  # pylint: disable=broad-except
+        outcome.append((None, e))
+
+    watched = threading.Thread(target=Watched, name=self.name)
+    # An event which ignores the cancellation must not keep the process alive.
+    watched.daemon = True
+    watched.start()
+    watched.join(timeout_ms / 1000.0)
+    if not outcome:
+      return self._TimedOut(timeout_ms, context)
+    result, error = outcome[0]
+    if error is not None:
+      raise error
+    return result
+
+  async def RunAsync(self, timeout_ms=None):
+    """Like Run(), but runs blocking events in a thread executor."""
+    method = self.event.Wait if self.context.test_source else self.event.Fire
+    if not asyncio.iscoroutinefunction(method):
+      return await asyncio.get_running_loop().run_in_executor(
+          None, self.Run, timeout_ms)
+    logging.log(2, 'Running ' + str(self))
+    context = self._CallContext()
+    if timeout_ms is None:
+      return await self._Call(context)
+    try:
+      return await asyncio.wait_for(self._Call(context), timeout_ms / 1000.0)
+    except asyncio.TimeoutError:
+      return self._TimedOut(timeout_ms, context)
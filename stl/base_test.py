@@ -16,13 +16,58 @@
 """Tests for stl.base."""
 # pylint: disable=invalid-name
 
+import asyncio
+import time
 import unittest
 
 import stl.base
+import stl.lib
+
+
+class _BlockingEvent(stl.lib.Event):
+
+  def Fire(self, context, seconds):
+    return not context.cancelled.wait(seconds)
+
+  def Wait(self, context, seconds):
+    return self.Fire(context, seconds)
+
+
+class _PollingEvent(stl.lib.Event):
+  """Polls the cancellation of its context, and records when it stopped."""
+
+  def __init__(self):
+    self.stopped = []
+
+  def Fire(self, context, seconds):
+    deadline = time.time() + seconds
+    while time.time() < deadline and not context.cancelled.is_set():
+      time.sleep(0.01)
+    self.stopped.append(time.time())
+    return time.time() >= deadline
+
+  def Wait(self, context, seconds):
+    return self.Fire(context, seconds)
+
+
+class _AsyncEvent(stl.lib.AsyncEvent):
+
+  async def Fire(self, context, seconds):
+    await asyncio.sleep(seconds)
+    return True
+
+  async def Wait(self, context, seconds):
+    return await self.Fire(context, seconds)
 
 
 class BaseTest(unittest.TestCase):
 
+  def _Func(self, event, seconds, timeout_ms=None):
+    func = stl.base.FuncWithContext('eEvent', event)
+    func.args = [seconds]
+    func.timeout_ms = timeout_ms
+    return func
+
   def testConstEquality(self):
     a_bool_true = stl.base.Const('a', 'bool', stl.base.Value(True))
     self.assertEqual(a_bool_true,
@@ -69,6 +114,39 @@ class BaseTest(unittest.TestCase):
     rRoleMissingField.fields = {'a': stl.base.Field('a', 'int')}
     self.assertNotEqual(rRoleFields, rRoleMissingField)
 
+  def testFuncWithContextTimeout(self):
+    func = self._Func(_BlockingEvent(), 0)
+    self.assertTrue(func.Run(1000))
+    func = self._Func(_BlockingEvent(), 10)
+    start = time.time()
+    self.assertFalse(func.Run(50))
+    self.assertLess(time.time() - start, 5)
+    # The event gave up once the watchdog cancelled it.
+    self.assertTrue(func.context.cancelled.is_set())
+
+  def testFuncWithContextRunAgainAfterTimeout(self):
+    event = _PollingEvent()
+    func = self._Func(event, 10)
+    self.assertFalse(func.Run(50))
+    # The call which timed out still sees its cancellation while the event
+    # runs again.
+    func.args = [0.5]
+    start = time.time()
+    self.assertTrue(func.Run(5000))
+    self.assertEqual(2, len(event.stopped))
+    self.assertLess(event.stopped[0] - start, 0.4)
+    self.assertFalse(func.context.cancelled.is_set())
+
+  def testFuncWithContextRunAsyncTimeout(self):
+    for event in (_BlockingEvent(), _AsyncEvent()):
+      self.assertTrue(asyncio.run(self._Func(event, 0).RunAsync(1000)))
+      func = self._Func(event, 10)
+      start = time.time()
+      self.assertFalse(asyncio.run(func.RunAsync(50)))
+      self.assertLess(time.time() - start, 5)
+    # Events of stl.lib.AsyncEvent still run without an event loop.
+    self.assertTrue(self._Func(_AsyncEvent(), 0).Run())
+
 
 if __name__ == '__main__':
   unittest.main()
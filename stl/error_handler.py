@@ -79,7 +79,8 @@ _MISSING_POST_STATES = stl.parser_error.ParserError(
                ' are no explicit post_states use an empty'
                ' list (post_states = []).'),
     stack_patterns=[
-        ['TRANSITION', 'NAME', 'params', '{', 'local_vars', 'pre_states', 'events'],
+        ['TRANSITION', 'NAME', 'params', '{', 'transition_decls', 'pre_states',
+         'events'],
     ])
 _MISSING_PRE_STATES = stl.parser_error.ParserError(
     error_name='missing-pre-states',
@@ -94,7 +95,8 @@ _EMPTY_PRE_STATES = stl.parser_error.ParserError(
     error_id=303,
     error_msg='Transitions require non-empty "pre_states".',
     stack_patterns=[
-        ['TRANSITION', 'NAME', 'params', '{', 'local_vars', 'PRE_STATES', '=', '[']
+        ['TRANSITION', 'NAME', 'params', '{', 'transition_decls', 'PRE_STATES',
+         '=', '[']
     ])
 
 # The ordering here is important, since the first matching error is
@@ -138,6 +138,8 @@ class EventInTransition(stl.base.NamedObject):
     source: Source role of this event.
     target: Target role of this event.
     param_values: List of values to be resolved.
+    group: Optional number of the parallel { } block of this event within the
+        transition. Events of the same block run at once.
   """
 
   def __init__(self, event, source, target):
@@ -145,16 +147,19 @@ class EventInTransition(stl.base.NamedObject):
     self.source = source
     self.target = target
     self.param_values = []
+    self.group = None
 
   def __eq__(self, other):
     return (stl.base.NamedObject.__eq__(self, other) and
             self.source == other.source and self.target == other.target and
-            self.param_values == other.param_values)
+            self.param_values == other.param_values and
+            self.group == other.group)
 
   def __str__(self):
-    return ('EVENT %s: s(%s), t(%s), v(%s)' %
+    return ('EVENT %s: s(%s), t(%s), v(%s)%s' %
             (self.name, self.source, self.target,
-             stl.base.GetCSV(self.param_values)))
+             stl.base.GetCSV(self.param_values),
+             '' if self.group is None else ' g(%d)' % self.group))
 
   def Resolve(self, env, resolved_params):
     logging.log(1, 'Resolving ' + self.name)
@@ -172,6 +177,7 @@ class EventInTransition(stl.base.NamedObject):
     if isinstance(func, stl.base.FuncWithContext):
       func.context.source = source
       func.context.target = target
+      func.group = self.group
 
     # Clear event context.
     if old_source:
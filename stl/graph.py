@@ -14,6 +14,7 @@
 
 """Module for state transition graph."""
 
+import collections
 import itertools
 import logging
 import networkx as nx
@@ -71,6 +72,10 @@ class StateVertex(object):
   def AddEdge(self, edge):
     self._edges.append(edge)
 
+  def RemoveEdges(self, names):
+    """Removes edges of transitions whose names are in |names|."""
+    self._edges = [e for e in self._edges if e.transition.name not in names]
+
   def GetMatchingTransitions(self, transitions):
     """Return a list of state.Transition's compatible to this state.
 
@@ -137,17 +142,76 @@ class TransitionEdge(object):
     transition: state.Transition in state transition spec.
     output_vertext: graph.StateVertex matching with |transition|'s post_states.
     error_vertext: graph.StateVertex matching with |transition|'s error_states.
+    permutation: With symmetry reduction, the permutation which maps
+        |output_vertex| back to the state reached by |transition|.
+    error_permutation: Same to |permutation|, but for |error_vertex|.
   """
 
   def __init__(self, trans, output_vertex, error_vertex):
     self.transition = trans
     self.output_vertex = output_vertex
     self.error_vertex = error_vertex
+    self.permutation = {}
+    self.error_permutation = {}
 
   def __str__(self):
     return str(self.transition)
 
 
+def _TransitionStates(trans):
+  """Returns all state.StateResolved's which |trans| reads or writes."""
+  state_values = list(itertools.chain(*trans.pre_states))
+  state_values.extend(trans.post_states)
+  state_values.extend(trans.error_states)
+  return [s.state for s in state_values]
+
+
+def SplitIndependentTransitions(transitions, states):
+  """Splits transitions into groups of independent state machines.
+
+  Two states are dependent when they appear together in a transition. The
+  transition graph of all states is the Cartesian product of the graphs of
+  independent groups, so covering each group separately avoids running every
+  transition once per combination of the states of other groups.
+
+  Args:
+    transitions: Dictionary of resolved state.Transition's.
+    states: Dictionary of state.StateResolved's.
+  Returns:
+    List of (transitions, states) tuples, one per independent group, in the
+    order of the first transition of each group.
+  """
+  # Union-find over state keys.
+  parents = dict((k, k) for k in states)
+
+  def _Find(key):
+    root = key
+    while parents[root] != root:
+      root = parents[root]
+    while parents[key] != root:
+      parents[key], key = root, parents[key]
+    return root
+
+  for t in transitions.values():
+    keys = [str(s) for s in _TransitionStates(t)]
+    for key in keys[1:]:
+      parents[_Find(key)] = _Find(keys[0])
+
+  components = collections.OrderedDict()
+  for name, t in transitions.items():
+    keys = [str(s) for s in _TransitionStates(t)]
+    root = _Find(keys[0]) if keys else None
+    if root not in components:
+      components[root] = ({}, {})
+    components[root][0][name] = t
+  for key, s in states.items():
+    root = _Find(key)
+    if root in components:
+      components[root][1][key] = s
+  logging.debug('%d independent groups of transitions', len(components))
+  return list(components.values())
+
+
 def _AddVertex(graph, vertex_list, vertex):
   if vertex not in graph:
     graph[vertex] = vertex
@@ -155,54 +219,262 @@ def _AddVertex(graph, vertex_list, vertex):
   return graph[vertex]
 
 
-def BuildTransitionGraph(transitions, states):
-  """Build a transition graph based on transitions and states."""
+def _Canonicalize(vertex, symmetry):
+  """Replaces |vertex|'s states with the representative of its orbit.
+
+  Args:
+    vertex: graph.StateVertex to canonicalize.
+    symmetry: stl.symmetry.Symmetry, or None.
+  Returns:
+    The permutation which maps the canonicalized |vertex| back to the original.
+  """
+  if not symmetry:
+    return {}
+  state_list, perm = symmetry.Canonicalize(vertex.state_list)
+  vertex.state_list = sorted(state_list, key=str)
+  return symmetry.Invert(perm)
+
+
+def _ExpandVertex(graph, vertexes, v, transitions, symmetry):
+  """Adds edges of |transitions| which can be executed from |v|.
+
+  Args:
+    graph: Dictionary of all graph.StateVertex's found so far.
+    vertexes: List to append graph.StateVertex's not found yet to.
+    v: graph.StateVertex to add edges to.
+    transitions: List of state.Transition's.
+    symmetry: stl.symmetry.Symmetry, or None.
+  Returns:
+    List of graph.TransitionEdge's added to |v|.
+  """
+  matched_transitions = v.GetMatchingTransitions(transitions)
+  logging.log(3, 'matched transitions for %s: %s', v, matched_transitions)
+  edges = []
+  for t in matched_transitions:
+    output_v = StateVertex(t.post_states)
+    output_v.AppendStateListNotExist(v.state_list)
+    output_perm = _Canonicalize(output_v, symmetry)
+    output_v = _AddVertex(graph, vertexes, output_v)
+
+    error_v = None
+    error_perm = {}
+    if t.error_states:
+      error_v = StateVertex(t.error_states)
+      error_v.AppendStateListNotExist(v.state_list)
+      error_perm = _Canonicalize(error_v, symmetry)
+      error_v = _AddVertex(graph, vertexes, error_v)
+
+    edge = TransitionEdge(t, output_v, error_v)
+    edge.permutation = output_perm
+    edge.error_permutation = error_perm
+    logging.debug('Adding edge %s from %s to %s', edge, v, output_v)
+    v.AddEdge(edge)
+    edges.append(edge)
+  return edges
+
+
+def _AddNxEdge(nx_graph, v, e, symmetry):
+  """Adds graph.TransitionEdge |e| from |v| to |nx_graph|.
+
+  Returns:
+    The key of the edge added.
+  """
+  error_vertex_id = v.id
+  if e.error_vertex:
+    error_vertex_id = e.error_vertex.id
+  attr = {}
+  if symmetry:
+    attr['permutation'] = e.permutation
+    attr['error_permutation'] = e.error_permutation
+  nx_graph.add_node(v.id, vertex=v)
+  nx_graph.add_node(e.output_vertex.id, vertex=e.output_vertex)
+  return nx_graph.add_edge(
+      v.id,
+      e.output_vertex.id,
+      label=e.transition.name,
+      transition=e.transition,
+      error_vertex_id=error_vertex_id,
+      weight=1,
+      **attr)
+
+
+def BuildTransitionGraph(transitions, states, symmetry=None):
+  """Build a transition graph based on transitions and states.
+
+  Args:
+    transitions: Dictionary of resolved state.Transition's.
+    states: Dictionary of state.StateResolved's.
+    symmetry: Optional stl.symmetry.Symmetry. If given, only one vertex per
+        orbit of interchangeable states is explored, and each edge carries the
+        permutations to map its target back to the state actually reached.
+  Returns:
+    nx_graph: nx MultiDiGraph with vertex ids as nodes. Each node has its
+        graph.StateVertex as the 'vertex' attribute.
+    initial_vertex_id: id of the vertex of initial state values.
+  """
   initial_vertex = StateVertex([s.InitialValue() for s in states.values()])
-  used_transitions = {}  # To check transitions not used.
 
   graph = {}
   graph[initial_vertex] = initial_vertex
   vertexes = [initial_vertex]
   for v in vertexes:
-    matched_transitions = v.GetMatchingTransitions(transitions.values())
-    logging.log(3, 'matched transitions for %s: %s', v, matched_transitions)
-    for t in matched_transitions:
-      trans_key = str(t)
-      if trans_key in used_transitions:
-        used_transitions[trans_key].append(v)
-      else:
-        used_transitions[trans_key] = [v]
-
-      output_v = StateVertex(t.post_states)
-      output_v.AppendStateListNotExist(v.state_list)
-      output_v = _AddVertex(graph, vertexes, output_v)
-
-      error_v = None
-      if t.error_states:
-        error_v = StateVertex(t.error_states)
-        error_v.AppendStateListNotExist(v.state_list)
-        error_v = _AddVertex(graph, vertexes, error_v)
-
-      edge = TransitionEdge(t, output_v, error_v)
-      logging.debug('Adding edge %s from %s to %s', edge, v, output_v)
-      v.AddEdge(edge)
+    _ExpandVertex(graph, vertexes, v, transitions.values(), symmetry)
 
   nx_graph = nx.MultiDiGraph()
-  edge_labels = {}
+  nx_graph.add_node(initial_vertex.id, vertex=initial_vertex)
   for v in vertexes:
     for e in v.edges:
-      edge_label = str(e.transition)
-      if edge_label not in edge_labels:
-        edge_labels[edge_label] = e.transition.name
-      error_vertex_id = v.id
-      if e.error_vertex:
-        error_vertex_id = e.error_vertex.id
-      nx_graph.add_edge(
-          v.id,
-          e.output_vertex.id,
-          label=edge_labels[edge_label],
-          transition=e.transition,
-          error_vertex_id=error_vertex_id,
-          weight=1)
+      _AddNxEdge(nx_graph, v, e, symmetry)
 
   return nx_graph, initial_vertex.id
+
+
+class LazyTransitionGraph(object):
+  """Transition graph whose vertexes are explored as they are reached.
+
+  BuildTransitionGraph() explores every reachable vertex before the first
+  transition can run. Here the graph only has the edges of the vertexes
+  explored so far, so its size is bounded by the region of the graph visited.
+
+  Attributes:
+    graph: nx MultiDiGraph like the one of BuildTransitionGraph(), with the
+        edges of explored vertexes and the vertexes they lead to.
+    initial: id of the vertex of initial state values.
+  """
+
+  def __init__(self, transitions, states, symmetry=None):
+    """Creates a graph with the initial vertex only.
+
+    Args:
+      transitions: Dictionary of resolved state.Transition's.
+      states: Dictionary of state.StateResolved's.
+      symmetry: Optional stl.symmetry.Symmetry, as in BuildTransitionGraph().
+    """
+    self._transitions = list(transitions.values())
+    self._symmetry = symmetry
+    initial_vertex = StateVertex([s.InitialValue() for s in states.values()])
+    self._vertexes = {initial_vertex: initial_vertex}
+    self._explored = set()
+    self.graph = nx.MultiDiGraph()
+    self.graph.add_node(initial_vertex.id, vertex=initial_vertex)
+    self.initial = initial_vertex.id
+
+  def Explore(self, vertex_id):
+    """Adds the edges of the transitions which can run from a vertex.
+
+    Args:
+      vertex_id: id of a node of |graph|.
+    Returns:
+      List of edges (source_node, target_node, edge_index) added, which is
+      empty if the vertex was explored before.
+    """
+    if vertex_id in self._explored:
+      return []
+    self._explored.add(vertex_id)
+    v = self.graph.nodes[vertex_id]['vertex']
+    edges = []
+    for e in _ExpandVertex(self._vertexes, [], v, self._transitions,
+                           self._symmetry):
+      key = _AddNxEdge(self.graph, v, e, self._symmetry)
+      if e.error_vertex:
+        # A failed transition leaves the system under test there.
+        self.graph.add_node(e.error_vertex.id, vertex=e.error_vertex)
+      edges.append((v.id, e.output_vertex.id, key))
+    logging.debug('Explored %s: %d edge(s)', v, len(edges))
+    return edges
+
+
+def DiffTransitions(old_transitions, new_transitions):
+  """Returns the difference between 2 dictionaries of resolved transitions.
+
+  Args:
+    old_transitions: Dictionary of resolved state.Transition's before a change.
+    new_transitions: Dictionary of resolved state.Transition's after a change.
+  Returns:
+    added: Dictionary of transitions added or changed.
+    removed: Set of names of transitions removed or changed.
+  """
+  added = {}
+  for name, t in new_transitions.items():
+    if name not in old_transitions or str(old_transitions[name]) != str(t):
+      added[name] = t
+  removed = set(name for name in old_transitions
+                if name not in new_transitions or name in added)
+  return added, removed
+
+
+def UpdateTransitionGraph(nx_graph, initial_vertex_id, transitions, states,
+                          added, removed, symmetry=None):
+  """Updates a transition graph after some transitions changed.
+
+  Only edges of the changed transitions are updated, and only vertexes newly
+  reachable are explored. Vertexes which are not reachable anymore are pruned.
+  The result is the same graph as rebuilding it with BuildTransitionGraph(),
+  except vertex ids and the order of edges. If the set of states changed, the
+  initial vertex changes as well, so the graph is rebuilt.
+
+  Args:
+    nx_graph: nx MultiDiGraph built by BuildTransitionGraph(). It is updated in
+        place unless the graph is rebuilt.
+    initial_vertex_id: id of the vertex of initial state values.
+    transitions: Dictionary of all resolved state.Transition's after the change.
+    states: Dictionary of all state.StateResolved's after the change.
+    added: Dictionary of transitions added or changed.
+    removed: Names of transitions removed or changed.
+    symmetry: Optional stl.symmetry.Symmetry the graph was built with.
+  Returns:
+    nx_graph: Updated nx MultiDiGraph.
+    initial_vertex_id: id of the vertex of initial state values.
+  """
+  initial_vertex = nx_graph.nodes[initial_vertex_id]['vertex']
+  if (sorted(str(s.state) for s in initial_vertex.state_list) !=
+      sorted(states)):
+    logging.info('States changed, rebuilding the transition graph.')
+    return BuildTransitionGraph(transitions, states, symmetry)
+
+  # Error vertexes without edges of their own are not nodes of |nx_graph|.
+  graph = {}
+  for _, v in nx_graph.nodes(data='vertex'):
+    graph[v] = v
+    for e in v.edges:
+      if e.error_vertex:
+        graph[e.error_vertex] = e.error_vertex
+
+  removed = set(removed)
+  for v in graph:
+    if v.id in nx_graph:
+      nx_graph.remove_edges_from([
+          (s, t, k) for s, t, k, trans in nx_graph.out_edges(
+              v.id, keys=True, data='transition') if trans.name in removed
+      ])
+    v.RemoveEdges(removed)
+
+  new_vertexes = []
+  for v in list(graph):
+    for e in _ExpandVertex(graph, new_vertexes, v, added.values(), symmetry):
+      _AddNxEdge(nx_graph, v, e, symmetry)
+  for v in new_vertexes:
+    for e in _ExpandVertex(graph, new_vertexes, v, transitions.values(),
+                           symmetry):
+      _AddNxEdge(nx_graph, v, e, symmetry)
+  logging.debug('Explored %d new vertexes', len(new_vertexes))
+
+  # Prune vertexes which are not reachable from the initial vertex.
+  reachable = set([initial_vertex])
+  queue = [initial_vertex]
+  for v in queue:
+    for e in v.edges:
+      for u in (e.output_vertex, e.error_vertex):
+        if u and u not in reachable:
+          reachable.add(u)
+          queue.append(u)
+  nx_graph.remove_nodes_from([
+      v.id for _, v in nx_graph.nodes(data='vertex') if v not in reachable
+  ])
+  # Vertexes left without edges are not nodes of a rebuilt graph.
+  nx_graph.remove_nodes_from([
+      n for n in nx_graph
+      if n != initial_vertex_id and not nx_graph.degree(n)
+  ])
+
+  return nx_graph, initial_vertex_id
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for stl.graph."""
+# pylint: disable=invalid-name
+
+import unittest
+
+import stl.base
+import stl.graph
+import stl.state
+
+
+class GraphTest(unittest.TestCase):
+
+  def setUp(self):
+    self.sTlsState = stl.state.State('sTlsState')
+    self.sTlsState.params = [stl.base.Param('tlsId', 'int')]
+    self.sTlsState.values = ['kNotConnected', 'kConnected']
+    self.states = {}
+    self.transitions = {}
+    for i in range(1, 4):
+      self._AddState(i)
+      self._AddTransition('tConnectTls%d' % i, [(i, 'kNotConnected')],
+                          [(i, 'kConnected')])
+      self._AddTransition('tDisconnectTls%d' % i, [(i, 'kConnected')],
+                          [(i, 'kNotConnected')])
+
+  def _AddState(self, tls_id):
+    s = stl.state.StateResolved('sTlsState', self.sTlsState)
+    s.resolved_params = [tls_id]
+    self.states[str(s)] = s
+
+  def _StateValue(self, tls_id, value):
+    return stl.state.StateValue(self.states['STATE sTlsState(%d)' % tls_id],
+                                value)
+
+  def _AddTransition(self, name, pre_states, post_states):
+    t = stl.state.Transition(name)
+    t.template = name
+    t.pre_states = [[self._StateValue(*s)] for s in pre_states]
+    t.post_states = [self._StateValue(*s) for s in post_states]
+    self.transitions[name] = t
+    return t
+
+  def testSplitIndependentTransitions(self):
+    components = stl.graph.SplitIndependentTransitions(self.transitions,
+                                                       self.states)
+    self.assertEqual(3, len(components))
+    for i, (transitions, states) in enumerate(components, 1):
+      self.assertEqual(['tConnectTls%d' % i, 'tDisconnectTls%d' % i],
+                       sorted(transitions))
+      self.assertEqual(['STATE sTlsState(%d)' % i], list(states))
+      graph, _ = stl.graph.BuildTransitionGraph(transitions, states)
+      self.assertEqual(2, graph.number_of_nodes())
+      self.assertEqual(2, graph.number_of_edges())
+
+  def testSplitDependentTransitions(self):
+    # Connecting 2 and 3 at once joins their groups.
+    self._AddTransition('tConnectTls23', [(2, 'kNotConnected'),
+                                          (3, 'kNotConnected')],
+                        [(2, 'kConnected'), (3, 'kConnected')])
+    components = stl.graph.SplitIndependentTransitions(self.transitions,
+                                                       self.states)
+    self.assertEqual(2, len(components))
+    self.assertEqual(['tConnectTls1', 'tDisconnectTls1'],
+                     sorted(components[0][0]))
+    self.assertEqual(['tConnectTls2', 'tConnectTls23', 'tConnectTls3',
+                      'tDisconnectTls2', 'tDisconnectTls3'],
+                     sorted(components[1][0]))
+    self.assertEqual(['STATE sTlsState(2)', 'STATE sTlsState(3)'],
+                     sorted(components[1][1]))
+
+  def _Edges(self, graph):
+    edges = set()
+    for source, target, attr in graph.edges(data=True):
+      edges.add((str(graph.nodes[source]['vertex']),
+                 str(graph.nodes[target]['vertex']), attr['label'],
+                 str(graph.nodes[attr['error_vertex_id']]['vertex'])))
+    return edges
+
+  def _AssertUpdateEqualsRebuild(self, old_transitions):
+    graph, initial = stl.graph.BuildTransitionGraph(old_transitions,
+                                                    self.states)
+    added, removed = stl.graph.DiffTransitions(old_transitions,
+                                               self.transitions)
+    graph, initial = stl.graph.UpdateTransitionGraph(
+        graph, initial, self.transitions, self.states, added, removed)
+    expected, expected_initial = stl.graph.BuildTransitionGraph(
+        self.transitions, self.states)
+    self.assertEqual(self._Edges(expected), self._Edges(graph))
+    self.assertEqual(
+        sorted(str(v) for _, v in expected.nodes(data='vertex')),
+        sorted(str(v) for _, v in graph.nodes(data='vertex')))
+    self.assertEqual(str(expected.nodes[expected_initial]['vertex']),
+                     str(graph.nodes[initial]['vertex']))
+    return graph
+
+  def testLazyTransitionGraph(self):
+    lazy = stl.graph.LazyTransitionGraph(self.transitions, self.states)
+    self.assertEqual(1, lazy.graph.number_of_nodes())
+    edges = lazy.Explore(lazy.initial)
+    self.assertEqual(3, len(edges))
+    self.assertEqual(4, lazy.graph.number_of_nodes())
+    self.assertEqual([], lazy.Explore(lazy.initial))
+    # Exploring every vertex ends up with the whole graph.
+    pending = [e[1] for e in edges]
+    while pending:
+      pending.extend(e[1] for e in lazy.Explore(pending.pop()))
+    expected, _ = stl.graph.BuildTransitionGraph(self.transitions, self.states)
+    self.assertEqual(self._Edges(expected), self._Edges(lazy.graph))
+
+  def testUpdateTransitionGraphAddTransition(self):
+    old_transitions = dict(self.transitions)
+    self._AddTransition('tConnectTls23', [(2, 'kNotConnected'),
+                                          (3, 'kNotConnected')],
+                        [(2, 'kConnected'), (3, 'kConnected')])
+    self._AssertUpdateEqualsRebuild(old_transitions)
+
+  def testUpdateTransitionGraphRemoveTransition(self):
+    old_transitions = dict(self.transitions)
+    # Vertexes where tls 1 is connected are not reachable anymore.
+    del self.transitions['tConnectTls1']
+    graph = self._AssertUpdateEqualsRebuild(old_transitions)
+    self.assertEqual(4, graph.number_of_nodes())
+
+  def testUpdateTransitionGraphChangeTransition(self):
+    old_transitions = dict(self.transitions)
+    # Disconnecting tls 1 disconnects tls 2 as well.
+    self._AddTransition('tDisconnectTls1', [(1, 'kConnected')],
+                        [(1, 'kNotConnected'), (2, 'kNotConnected')])
+    self._AssertUpdateEqualsRebuild(old_transitions)
+
+  def testUpdateTransitionGraphNewState(self):
+    old_transitions = dict(self.transitions)
+    self._AddState(4)
+    self._AddTransition('tConnectTls4', [(4, 'kNotConnected')],
+                        [(4, 'kConnected')])
+    self._AssertUpdateEqualsRebuild(old_transitions)
+
+
+if __name__ == '__main__':
+  unittest.main()
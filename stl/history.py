@@ -0,0 +1,131 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measured run times of transitions, kept between test runs.
+
+The history is a JSON file mapping transition names to the number of passed
+runs, their mean duration in milliseconds and the number of failed runs. The
+next run weighs the edges of the transition graph by these durations, so the
+edge-covering circuit minimizes the expected run time instead of the number of
+transitions.
+"""
+
+import json
+import logging
+import os
+
+
+class History(object):
+  """Run times and failures of transitions.
+
+  Attributes:
+    filename: Name of the JSON file the history is loaded from and saved to.
+    transitions: Dictionary of {'runs': int, 'mean_ms': float, 'failures':
+        int} keyed on transition names.
+  """
+
+  def __init__(self, filename=None):
+    self.filename = filename
+    self.transitions = {}
+    if filename and os.path.exists(filename):
+      with open(filename) as history_file:
+        self.transitions = json.load(history_file)
+      logging.debug('Loaded run times of %d transition(s) from %s',
+                    len(self.transitions), filename)
+
+  def Save(self):
+    """Writes the history back to its file."""
+    with open(self.filename, 'w') as history_file:
+      json.dump(self.transitions, history_file, indent=2, sort_keys=True)
+
+  def _Entry(self, name):
+    return self.transitions.setdefault(name, {'runs': 0, 'mean_ms': 0.0})
+
+  def Record(self, name, duration_ms):
+    """Adds a passed run of transition |name| which took |duration_ms|."""
+    entry = self._Entry(name)
+    entry['runs'] += 1
+    entry['mean_ms'] += (duration_ms - entry['mean_ms']) / entry['runs']
+
+  def RecordFailure(self, name):
+    """Adds a failed run of transition |name|."""
+    entry = self._Entry(name)
+    entry['failures'] = entry.get('failures', 0) + 1
+
+  def Update(self, durations, failures=None):
+    """Records runs from the results of a test.
+
+    Args:
+      durations: Dictionary of lists of the milliseconds of passed runs, keyed
+          on transition names.
+      failures: Optional dictionary of the number of failed runs, keyed on
+          transition names.
+    """
+    for name, runs in durations.items():
+      for duration_ms in runs:
+        self.Record(name, duration_ms)
+    for name, count in (failures or {}).items():
+      for _ in range(count):
+        self.RecordFailure(name)
+
+  def FailureRate(self, name):
+    """Returns the fraction of the runs of transition |name| which failed."""
+    entry = self.transitions.get(name, {})
+    failures = entry.get('failures', 0)
+    if not failures:
+      return 0.0
+    return float(failures) / (failures + entry['runs'])
+
+  def Estimate(self, transition):
+    """Returns the expected milliseconds to run |transition|.
+
+    Measured run times take precedence over the cost_ms hint of the spec.
+
+    Args:
+      transition: stl.state.Transition.
+    Returns:
+      Milliseconds, or None if neither is known.
+    """
+    if self.transitions.get(transition.name, {}).get('runs'):
+      return self.transitions[transition.name]['mean_ms']
+    return transition.cost_ms
+
+  def WeighGraph(self, graph):
+    """Sets the weight of each edge of |graph| to its expected run time.
+
+    Edges whose run time is unknown get the mean of the known ones. If none is
+    known, edges keep weight 1 and the circuit minimizes the number of
+    transitions. Each edge also gets its estimate as 'cost_ms', or None, and
+    its past 'failure_rate'.
+
+    Args:
+      graph: nx MultiDiGraph of transitions.
+    """
+    estimates = {}
+    for source, target, key, transition in graph.edges(
+        keys=True, data='transition'):
+      estimates[(source, target, key)] = self.Estimate(transition)
+      graph.edges[source, target, key]['failure_rate'] = self.FailureRate(
+          transition.name)
+    known = [ms for ms in estimates.values() if ms is not None]
+    if not known:
+      return
+    default = sum(known) / len(known)
+    for edge, estimate in estimates.items():
+      attr = graph.edges[edge]
+      attr['cost_ms'] = estimate
+      # A zero weight would make the circuit indifferent to extra runs.
+      attr['weight'] = max(estimate if estimate is not None else default, 1)
+    logging.info('Weighed %d of %d transition(s) by run time', len(known),
+                 len(estimates))
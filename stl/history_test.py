@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for stl.history."""
+# pylint: disable=invalid-name
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import networkx as nx
+
+import stl.history
+import stl.state
+import stl.traverse
+
+
+class HistoryTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.tmpdir, 'history.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _AddEdge(self, graph, source, target, name, cost_ms=None):
+    transition = stl.state.Transition(name)
+    transition.cost_ms = cost_ms
+    graph.add_edge(source, target, transition=transition, weight=1)
+
+  def testRecordAndSave(self):
+    history = stl.history.History(self.filename)
+    history.Update({'tFast': [10, 20], 'tSlow': [900]})
+    history.Save()
+
+    history = stl.history.History(self.filename)
+    self.assertEqual({'runs': 2, 'mean_ms': 15}, history.transitions['tFast'])
+    history.Record('tSlow', 1100)
+    self.assertEqual(1000, history.transitions['tSlow']['mean_ms'])
+
+  def testFailureRate(self):
+    history = stl.history.History()
+    history.Update({'tFlaky': [10, 10, 10]}, {'tFlaky': 1, 'tBroken': 2})
+    self.assertEqual(0.25, history.FailureRate('tFlaky'))
+    self.assertEqual(1, history.FailureRate('tBroken'))
+    self.assertEqual(0, history.FailureRate('tUnknown'))
+    # Failed runs do not count as measured run times.
+    broken = stl.state.Transition('tBroken')
+    broken.cost_ms = 500
+    self.assertEqual(500, history.Estimate(broken))
+
+  def testEstimate(self):
+    history = stl.history.History()
+    history.Record('tMeasured', 30)
+    measured = stl.state.Transition('tMeasured')
+    measured.cost_ms = 500
+    hinted = stl.state.Transition('tHinted')
+    hinted.cost_ms = 500
+    self.assertEqual(30, history.Estimate(measured))
+    self.assertEqual(500, history.Estimate(hinted))
+    self.assertIsNone(history.Estimate(stl.state.Transition('tUnknown')))
+
+  def testWeighGraphWithoutEstimates(self):
+    graph = nx.MultiDiGraph()
+    self._AddEdge(graph, 0, 1, 't01')
+    self._AddEdge(graph, 1, 0, 't10')
+    stl.history.History().WeighGraph(graph)
+    self.assertEqual([1, 1], [w for _, _, w in graph.edges(data='weight')])
+
+  def testWeighGraphMinimizesRunTime(self):
+    # The circuit needs an extra path from 1 back to 0. Going back over the
+    # slow 1->0 edge is shorter by hop count, but the detour through 2 is
+    # shorter by run time.
+    graph = nx.MultiDiGraph()
+    for name in ('t01a', 't01b', 't01c'):
+      self._AddEdge(graph, 0, 1, name, 10)
+    self._AddEdge(graph, 1, 0, 't10', 1000)
+    self._AddEdge(graph, 1, 2, 't12', 10)
+    self._AddEdge(graph, 2, 0, 't20', 10)
+    history = stl.history.History()
+    history.Record('t20', 20)
+    history.WeighGraph(graph)
+    self.assertEqual(20, graph.edges[(2, 0, 0)]['weight'])
+    self.assertEqual(20, graph.edges[(2, 0, 0)]['cost_ms'])
+
+    circuit = stl.traverse.MinEdgeCoverCircuit(graph, 0)
+    self.assertEqual(1, [e[:2] for e in circuit].count((1, 0)))
+    self.assertEqual(2, [e[:2] for e in circuit].count((2, 0)))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,70 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Coverage of transitions which passed in recent test runs.
+
+The ledger is a JSON file mapping a spec hash and a build id of the system
+under test to the names of the transitions which passed against that build,
+with the time of their last pass. A repeated run of the same spec against the
+same build then only needs to cover the transitions which did not pass within
+the time window.
+"""
+
+import json
+import logging
+import os
+import time
+
+
+class Ledger(object):
+  """Last passes of transitions, keyed on spec and build.
+
+  Attributes:
+    filename: Name of the JSON file the ledger is loaded from and saved to.
+    window_s: Seconds a pass covers a transition for.
+    entries: Dictionary of {transition name: seconds since the epoch} keyed on
+        '<spec hash>:<build id>'.
+  """
+
+  def __init__(self, filename=None, window_s=24 * 3600):
+    self.filename = filename
+    self.window_s = window_s
+    self.entries = {}
+    if filename and os.path.exists(filename):
+      with open(filename) as ledger_file:
+        self.entries = json.load(ledger_file)
+      logging.debug('Loaded coverage of %d build(s) from %s',
+                    len(self.entries), filename)
+
+  def Save(self):
+    """Writes the passes back to the file.
+
+    Passes outside the window are kept, since a later run may have a wider
+    window. Only Covered() leaves them out.
+    """
+    with open(self.filename, 'w') as ledger_file:
+      json.dump(self.entries, ledger_file, indent=2, sort_keys=True)
+
+  def Record(self, spec, build, names, now=None):
+    """Adds passes of the transitions |names| of |spec| against |build|."""
+    now = time.time() if now is None else now
+    passes = self.entries.setdefault('%s:%s' % (spec, build), {})
+    for name in names:
+      passes[name] = now
+
+  def Covered(self, spec, build, now=None):
+    """Returns the set of names of transitions passed within the window."""
+    now = time.time() if now is None else now
+    passes = self.entries.get('%s:%s' % (spec, build), {})
+    return set(name for name, t in passes.items() if now - t <= self.window_s)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for stl.ledger."""
+# pylint: disable=invalid-name
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import stl.ledger
+
+
+class LedgerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.tmpdir, 'ledger.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def testCovered(self):
+    ledger = stl.ledger.Ledger(self.filename, window_s=100)
+    ledger.Record('spec', 'build1', ['tConnect', 'tDisconnect'], now=1000)
+    ledger.Record('spec', 'build1', ['tConnect'], now=1050)
+    ledger.Save()
+
+    ledger = stl.ledger.Ledger(self.filename, window_s=100)
+    self.assertEqual(set(['tConnect', 'tDisconnect']),
+                     ledger.Covered('spec', 'build1', now=1100))
+    self.assertEqual(set(['tConnect']),
+                     ledger.Covered('spec', 'build1', now=1101))
+    # Passes do not carry over to other builds or specs.
+    self.assertEqual(set(), ledger.Covered('spec', 'build2', now=1100))
+    self.assertEqual(set(), ledger.Covered('other', 'build1', now=1100))
+
+  def testSaveKeepsPassesOutsideTheWindow(self):
+    ledger = stl.ledger.Ledger(self.filename, window_s=100)
+    ledger.Record('spec', 'build1', ['tConnect'], now=1000)
+    ledger.Record('spec', 'build1', ['tDisconnect'], now=1200)
+    ledger.Save()
+    self.assertEqual(set(['tDisconnect']),
+                     ledger.Covered('spec', 'build1', now=1200))
+
+    # A later run with a wider window still counts the older pass.
+    ledger = stl.ledger.Ledger(self.filename, window_s=1000)
+    self.assertEqual(set(['tConnect', 'tDisconnect']),
+                     ledger.Covered('spec', 'build1', now=1200))
+
+if __name__ == '__main__':
+  unittest.main()
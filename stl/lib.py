@@ -171,6 +171,84 @@ class Event(object):
     """
 
 
+class AsyncEvent(Event):
+  """Library class for implementing external events with asyncio.
+
+  Fire() and Wait() are coroutines, e.g. awaiting a network connection, so the
+  events of a test can share one event loop with other tasks such as the GUI
+  server. With --asyncio, the test driver awaits them in its event loop and
+  runs blocking events in a thread executor. Otherwise each call runs in an
+  event loop of its own.
+  """
+
+  @abc.abstractmethod
+  async def Fire(self, context, *args):
+    """Like Event.Fire(), but awaited."""
+
+  @abc.abstractmethod
+  async def Wait(self, context, *args):
+    """Like Event.Wait(), but awaited."""
+
+
+class Reset(object):
+  """Library class for resetting the system under test.
+
+  A reset brings every role under test back to the initial values of all
+  states, e.g. by restarting a device. It lets the test driver cover transitions
+  which cannot be undone, such as a shutdown, in several walks from the initial
+  states of a single run.
+  """
+
+  __metaclass__ = abc.ABCMeta
+
+  @abc.abstractmethod
+  def Reset(self, roles):
+    """Reset the system under test to its initial states.
+
+    Args:
+      roles: List of stl.base.Role's under test.
+
+    Returns:
+      True if the system under test was reset successfully.
+    """
+
+
+class Snapshot(object):
+  """Library class for saving and restoring states of the system under test.
+
+  Systems under test such as emulators and containers can often restore a
+  snapshot much faster than transitions bring them back to the same states. The
+  snapshot strategy then covers transitions as a tree of walks which restore
+  snapshots instead of walking back to where the next walk starts.
+  """
+
+  __metaclass__ = abc.ABCMeta
+
+  @abc.abstractmethod
+  def Snapshot(self, roles):
+    """Save the current states of the system under test.
+
+    Args:
+      roles: List of stl.base.Role's under test.
+
+    Returns:
+      A handle of the snapshot to pass to Restore(), or None if the snapshot
+      failed.
+    """
+
+  @abc.abstractmethod
+  def Restore(self, roles, handle):
+    """Bring the system under test back to the states of a snapshot.
+
+    Args:
+      roles: List of stl.base.Role's under test.
+      handle: Handle returned by Snapshot().
+
+    Returns:
+      True if the system under test was restored successfully.
+    """
+
+
 class Qualifier(object):
   """Library class for defining external qualifiers.
 
@@ -38,6 +38,9 @@ import stl.module
 import stl.qualifier
 import stl.state
 
+# Names of the attributes a transition can set before its pre_states.
+TRANSITION_ATTRS = ('cost_ms', 'timeout_ms')
+
 
 class StlSyntaxError(SyntaxError):
   """Error for incorrect STL syntax."""
@@ -59,6 +62,8 @@ class StlParser(object):
     self._filename = filename
     self._global_env = global_env
     self._local_env = {'_curr_module': None}
+    # Number of parallel event groups in the transition being parsed.
+    self._parallel_groups = 0
     error_formatter = error_formatter or stl.error_formatter.PrettyErrorFormatter()
     self.lexer_error_handler = stl.error_handler.LexerErrorHandler(error_formatter)
     self.parser_error_handler = stl.error_handler.ParserErrorHandler(error_formatter)
@@ -318,28 +323,49 @@ class StlParser(object):
       trans.expand = stl.base.Expand(p[5])
       trans.expand.values = p[6]
     else:
-      (trans.local_vars, trans.pre_states, trans.events, trans.post_states,
-       trans.error_states) = p[5]
+      (trans.local_vars, attrs, trans.pre_states, trans.events,
+       trans.post_states, trans.error_states) = p[5]
+      trans.cost_ms = attrs.get('cost_ms')
+      trans.timeout_ms = attrs.get('timeout_ms')
+    self._parallel_groups = 0
     self._local_env['_curr_module'].transitions[trans.name] = trans
 
   def p_transition_body(self, p):
-    """transition_body : local_vars pre_states events post_states error_states"""  # pylint: disable=line-too-long
-    p[0] = (p[1], p[2], p[3], p[4], p[5])
-
-  def p_local_vars(self, p):
-    """local_vars : local_vars local_var
-                  | empty"""
+    """transition_body : transition_decls pre_states events post_states error_states"""  # pylint: disable=line-too-long
+    local_vars, attrs = p[1]
+    p[0] = (local_vars, attrs, p[2], p[3], p[4], p[5])
+
+  def p_transition_decls(self, p):
+    """transition_decls : transition_decls local_var
+                        | transition_decls transition_attr
+                        | empty"""
     if len(p) == 2:  # empty
-      p[0] = []
+      p[0] = ([], {})
       return
-    assert isinstance(p[1], list)
-    for f in p[1]:
-      if f.name == p[2].name:
-        logging.error('[%s:%d] Duplicated local var: %s', self._filename,
-                      p.lineno(2), p[2].name)
-    p[1].append(p[2])
+    local_vars, attrs = p[1]
+    if isinstance(p[2], stl.base.LocalVar):
+      for f in local_vars:
+        if f.name == p[2].name:
+          logging.error('[%s:%d] Duplicated local var: %s', self._filename,
+                        p.lineno(2), p[2].name)
+      local_vars.append(p[2])
+    else:
+      name, value = p[2]
+      if name in attrs:
+        logging.error('[%s:%d] Duplicated transition attribute: %s',
+                      self._filename, p.lineno(2), name)
+      attrs[name] = value
     p[0] = p[1]
 
+  def p_transition_attr(self, p):
+    """transition_attr : NAME '=' NUMBER ';' """
+    # Attribute names are not keywords, so specs can still use them as names.
+    if p[1] not in TRANSITION_ATTRS:
+      logging.error('[%s:%d] Unknown transition attribute: %s',
+                    self._filename, p.lineno(1), p[1])
+      self._global_env['error'] = True
+    p[0] = (p[1], p[3])
+
   def p_local_var(self, p):
     """local_var : type NAME ';' """
     p[0] = stl.base.LocalVar(p[2], p[1])
@@ -422,7 +448,34 @@ class StlParser(object):
 
   def p_role_events(self, p):
     """role_events : role_events role_event
-                   | role_event"""
+                   | role_events parallel_events
+                   | role_event
+                   | parallel_events"""
+    events = p[len(p) - 1]
+    if not isinstance(events, list):
+      events = [events]
+    if len(p) == 2:  # first role_event or parallel_events
+      p[0] = events
+      return
+    assert isinstance(p[1], list)
+    p[1].extend(events)
+    p[0] = p[1]
+
+  def p_parallel_events(self, p):
+    """parallel_events : NAME '{' parallel_role_events '}' """
+    # 'parallel' is not a keyword, so specs can still use it as a name.
+    if p[1] != 'parallel':
+      logging.error('[%s:%d] Expected parallel before {: %s', self._filename,
+                    p.lineno(1), p[1])
+      self._global_env['error'] = True
+    self._parallel_groups += 1
+    for e in p[3]:
+      e.group = self._parallel_groups
+    p[0] = p[3]
+
+  def p_parallel_role_events(self, p):
+    """parallel_role_events : parallel_role_events role_event
+                            | role_event"""
     if len(p) == 2:  # first role_event
       p[0] = [p[1]]
       return
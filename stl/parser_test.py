@@ -603,6 +603,116 @@ class StlParserTest(unittest.TestCase):
     self.assertEqual(self.expected_module, self.actual_module)
     self.assertFalse('error' in self.global_env)
 
+  def testTransition_WithCostAndTimeout(self):
+    input_text = ('module foo;\n'
+                  'transition tSlow {\n'
+                  '  cost_ms = 500;\n'
+                  '  timeout_ms = 2000;\n'
+                  '  pre_states = [ sState.kPreValue ]\n'
+                  '  events {\n'
+                  '    rRole1 -> eEvent -> rRole2;\n'
+                  '  }\n'
+                  '  post_states = [ sState.kPostValue ]\n'
+                  '}')
+
+    tSlow = stl.state.Transition('tSlow')
+    tSlow.cost_ms = 500
+    tSlow.timeout_ms = 2000
+    tSlow.pre_states = [[
+        stl.state.StateValueInTransition('sState', 'kPreValue')
+    ]]
+    tSlow.events = [stl.event.EventInTransition('eEvent', 'rRole1', 'rRole2')]
+    tSlow.post_states = [
+        stl.state.StateValueInTransition('sState', 'kPostValue')
+    ]
+
+    self.expected_module.transitions = {'tSlow': tSlow}
+
+    self.Parse(input_text)
+    self.assertEqual(self.expected_module, self.actual_module)
+    self.assertFalse('error' in self.global_env)
+
+  def testTransition_WithParallelEvents(self):
+    input_text = ('module foo;\n'
+                  'transition tBroadcast {\n'
+                  '  pre_states = [ sState.kPreValue ]\n'
+                  '  events {\n'
+                  '    rRole1 -> eEvent1 -> rRole2;\n'
+                  '    parallel {\n'
+                  '      rRole2 -> eEvent2 -> rRole3;\n'
+                  '      rRole2 -> eEvent2 -> rRole4;\n'
+                  '    }\n'
+                  '    parallel {\n'
+                  '      rRole3 -> eEvent3 -> rRole2;\n'
+                  '    }\n'
+                  '  }\n'
+                  '  post_states = [ sState.kPostValue ]\n'
+                  '}')
+
+    tBroadcast = stl.state.Transition('tBroadcast')
+    tBroadcast.pre_states = [[
+        stl.state.StateValueInTransition('sState', 'kPreValue')
+    ]]
+    tBroadcast.events = [
+        stl.event.EventInTransition('eEvent1', 'rRole1', 'rRole2'),
+        stl.event.EventInTransition('eEvent2', 'rRole2', 'rRole3'),
+        stl.event.EventInTransition('eEvent2', 'rRole2', 'rRole4'),
+        stl.event.EventInTransition('eEvent3', 'rRole3', 'rRole2'),
+    ]
+    for e, group in zip(tBroadcast.events, [None, 1, 1, 2]):
+      e.group = group
+    tBroadcast.post_states = [
+        stl.state.StateValueInTransition('sState', 'kPostValue')
+    ]
+
+    self.expected_module.transitions = {'tBroadcast': tBroadcast}
+
+    self.Parse(input_text)
+    self.assertEqual(self.expected_module, self.actual_module)
+    self.assertFalse('error' in self.global_env)
+
+  def testTransition_AttributeNamesAreNotKeywords(self):
+    # cost_ms, timeout_ms and parallel are only special where they apply, so
+    # specs can still use them as names.
+    input_text = ('module foo;\n'
+                  'event parallel(int cost_ms, int timeout_ms);\n'
+                  'transition tSlow {\n'
+                  '  int parallel;\n'
+                  '  timeout_ms = 2000;\n'
+                  '  pre_states = [ sState.kPreValue ]\n'
+                  '  events {\n'
+                  '    parallel {\n'
+                  '      rRole1 -> parallel -> rRole2;\n'
+                  '    }\n'
+                  '  }\n'
+                  '  post_states = [ sState.kPostValue ]\n'
+                  '}')
+
+    self.Parse(input_text)
+    self.assertFalse('error' in self.global_env)
+    self.assertEqual(
+        [stl.base.Param('cost_ms', 'int'),
+         stl.base.Param('timeout_ms', 'int')],
+        self.actual_module.events['parallel'].params)
+    tSlow = self.actual_module.transitions['tSlow']
+    self.assertEqual([stl.base.LocalVar('parallel', 'int')], tSlow.local_vars)
+    self.assertEqual(2000, tSlow.timeout_ms)
+    self.assertEqual(1, tSlow.events[0].group)
+
+  def testTransition_UnknownAttribute(self):
+    input_text = ('module foo;\n'
+                  'transition tSlow {\n'
+                  '  slowness = 2;\n'
+                  '  pre_states = [ sState.kPreValue ]\n'
+                  '  events {\n'
+                  '    rRole1 -> eEvent -> rRole2;\n'
+                  '  }\n'
+                  '  post_states = [ sState.kPostValue ]\n'
+                  '}')
+
+    self.Parse(input_text)
+    self.assertTrue(self.global_env['error'])
+
 
 if __name__ == '__main__':
   unittest.main()
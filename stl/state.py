@@ -13,7 +13,10 @@
 # limitations under the License.
 """Defines state and trasitions."""
 
+import asyncio
+import concurrent.futures
 import logging
+import time
 
 import stl.base
 import stl.levenshtein
@@ -168,7 +171,9 @@ class Transition(stl.base.ParameterizedObject):
     events: List of events either resolved (stl.base.Func) or unresolved
         (stl.event.EventInTransition) happending during this state transition.
         All function calls are sequentially executed and it aborts execution on
-        any function returning False.
+        any function returning False. Consecutive events of the same parallel
+        { } block, i.e. with the same group, run at once instead, and abort
+        execution after all of them returned if any returned False.
     post_states: List of state values either resolved (stl.tate.StateValue) or
         resolved (stl.state.StateValueInTransition). When all events finished
         with success, i.e returned True, these state values are used to
@@ -180,6 +185,13 @@ class Transition(stl.base.ParameterizedObject):
         matched pre_states. If None, error_states is same to pre_states which
         means no transition happened.
     expand: Expression to expand to a resolved transition, stl.state.Transition.
+    template: Name of the transition spec defining the body of this resolved
+        transition. Resolved transitions expanded from the same spec share the
+        same template.
+    cost_ms: Optional hint of the milliseconds it takes to run this transition,
+        e.g. cost_ms = 500; before pre_states.
+    timeout_ms: Optional milliseconds after which running this transition
+        fails, e.g. timeout_ms = 10000; before pre_states.
   """
 
   def __init__(self, name):
@@ -190,6 +202,9 @@ class Transition(stl.base.ParameterizedObject):
     self.post_states = []
     self.error_states = []
     self.expand = None
+    self.template = None
+    self.cost_ms = None
+    self.timeout_ms = None
 
   def __eq__(self, other):
     return (
@@ -197,7 +212,9 @@ class Transition(stl.base.ParameterizedObject):
         self.local_vars == other.local_vars and
         self.pre_states == other.pre_states and self.events == other.events and
         self.post_states == other.post_states and
-        self.error_states == other.error_states and self.expand == other.expand)
+        self.error_states == other.error_states and
+        self.expand == other.expand and self.cost_ms == other.cost_ms and
+        self.timeout_ms == other.timeout_ms)
 
   def __str__(self):
     if self.expand:
@@ -243,6 +260,9 @@ class Transition(stl.base.ParameterizedObject):
       return resolved
 
     resolved = Transition(self.name)
+    resolved.template = self.name
+    resolved.cost_ms = self.cost_ms
+    resolved.timeout_ms = self.timeout_ms
     resolved.local_vars = self.local_vars
     new_resolved_params = resolved_params.copy()
     for v in self.local_vars:
@@ -274,13 +294,60 @@ class Transition(stl.base.ParameterizedObject):
       resolved.error_states.append(s.Resolve(env, new_resolved_params))
     return resolved
 
+  def _EventTimeout(self, event, deadline):
+    """Returns the timeout of |event| in ms within the transition |deadline|."""
+    timeout_ms = event.timeout_ms
+    if deadline is None:
+      return timeout_ms
+    remaining_ms = max(deadline - time.time() * 1000, 0)
+    if timeout_ms is None:
+      return remaining_ms
+    return min(timeout_ms, remaining_ms)
+
+  def _Deadline(self):
+    if self.timeout_ms is None:
+      return None
+    return time.time() * 1000 + self.timeout_ms
+
+  def _EventGroups(self):
+    """Yields lists of the events to run at once, one list after another."""
+    group = []
+    for e in self.events:
+      if group and (e.group is None or e.group != group[-1].group):
+        yield group
+        group = []
+      group.append(e)
+    if group:
+      yield group
+
   def Run(self):
     """Execute this state transition.
 
+    Each event runs within its own timeout and what is left of |timeout_ms|.
+    The events of a parallel group run in a thread pool.
+
     Returns:
-      Whether or not all event functions returned True.
+      Whether or not all event functions returned True. An event which timed
+      out counts as failed.
     """
-    for e in self.events:
-      if e.Run() is False:
+    deadline = self._Deadline()
+    for group in self._EventGroups():
+      timeouts = [self._EventTimeout(e, deadline) for e in group]
+      if len(group) == 1:
+        results = [group[0].Run(timeouts[0])]
+      else:
+        with concurrent.futures.ThreadPoolExecutor(len(group)) as executor:
+          results = list(executor.map(lambda e, t: e.Run(t), group, timeouts))
+      if any(r is False for r in results):
+        return False
+    return True
+
+  async def RunAsync(self):
+    """Like Run(), but awaits the events in the running event loop."""
+    deadline = self._Deadline()
+    for group in self._EventGroups():
+      results = await asyncio.gather(
+          *[e.RunAsync(self._EventTimeout(e, deadline)) for e in group])
+      if any(r is False for r in results):
         return False
     return True
@@ -16,14 +16,67 @@
 """Tests for stl.state."""
 # pylint: disable=invalid-name
 
+import asyncio
+import time
 import unittest
 
 import stl.base
+import stl.lib
 import stl.state
 
 
+class _SleepEvent(stl.lib.Event):
+
+  def Fire(self, context, seconds):
+    return not context.cancelled.wait(seconds)
+
+  def Wait(self, context, seconds):
+    return self.Fire(context, seconds)
+
+
 class StateTest(unittest.TestCase):
 
+  def testTransitionTimeout(self):
+    tSlow = stl.state.Transition('tSlow')
+    events = []
+    for seconds in (0.1, 10):
+      events.append(stl.base.FuncWithContext('eSleep', _SleepEvent()))
+      events[-1].args = [seconds]
+    tSlow.events = events[:1]
+    tSlow.timeout_ms = 150
+    events[0].timeout_ms = 1000
+    self.assertTrue(tSlow.Run())
+    # The first event takes most of the time of the transition.
+    tSlow.events = events
+    start = time.time()
+    self.assertFalse(tSlow.Run())
+    self.assertLess(time.time() - start, 5)
+    self.assertTrue(events[1].context.cancelled.is_set())
+
+  def testTransitionParallelEvents(self):
+    tBroadcast = stl.state.Transition('tBroadcast')
+    for seconds in (0.2, 0.2, 0.2, 10):
+      tBroadcast.events.append(
+          stl.base.FuncWithContext('eSleep', _SleepEvent()))
+      tBroadcast.events[-1].args = [seconds]
+    tBroadcast.events[-1].timeout_ms = 1000
+    for e in tBroadcast.events[:3]:
+      e.group = 1
+    tBroadcast.events[1].timeout_ms = 50
+    # Only the events of the group run, and the one which timed out fails the
+    # transition once all of them returned.
+    start = time.time()
+    self.assertFalse(tBroadcast.Run())
+    self.assertLess(time.time() - start, 0.5)
+    self.assertFalse(tBroadcast.events[-1].context.cancelled.is_set())
+
+    tBroadcast.events[1].timeout_ms = None
+    tBroadcast.events.pop()
+    start = time.time()
+    self.assertTrue(tBroadcast.Run())
+    self.assertTrue(asyncio.run(tBroadcast.RunAsync()))
+    self.assertLess(time.time() - start, 1)
+
   def testStateEquality(self):
     sSimpleState = stl.state.State('sSimpleState')
     sSimpleState.values = ['kValue1']
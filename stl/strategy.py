@@ -0,0 +1,556 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Strategies for choosing which transitions of a graph to run.
+
+A strategy walks through the transition graph from its initial vertex. The
+test driver runs each edge the strategy yields and reports the result back
+before asking for the next edge, so the strategy can adapt to failures.
+"""
+
+import abc
+import collections
+import itertools
+import logging
+import random
+import time
+
+import stl.levenshtein
+import stl.traverse
+
+
+class Strategy(object):
+  """Library class for traversal strategies.
+
+  Attributes:
+    graph: nx MultiDiGraph of transitions.
+    initial: Initial vertex of |graph|.
+    reset: Whether or not the system under test can be reset.
+    paths: stl.traverse.ShortestPaths of |graph|.
+    vertex: Vertex the system under test is in.
+    uncovered: Set of edges (source_node, target_node, edge_index) not run yet.
+    runs: collections.Counter of the number of times each edge was run.
+  """
+
+  __metaclass__ = abc.ABCMeta
+
+  def __init__(self, graph, initial, reset=False):
+    self.graph = graph
+    self.initial = initial
+    self.reset = reset
+    reset_edges = None
+    if reset:
+      reset_edges = (initial, stl.traverse.ResetWeight(graph))
+    self.paths = stl.traverse.ShortestPaths(graph, reset_edges)
+    self.vertex = initial
+    self.uncovered = set(graph.edges(keys=True))
+    self.runs = collections.Counter()
+
+  @abc.abstractmethod
+  def Walk(self):
+    """Yields the edges to run.
+
+    Reset edges are yielded as (source_node, initial, stl.traverse.RESET).
+    Feedback() is called for each edge before the next one is asked for,
+    except for the edges of Peek(), which may be asked for first.
+    """
+
+  def Peek(self, n):
+    """Returns up to |n| edges Walk() yields next if the edges run pass.
+
+    The test driver may ask for these edges before the results of the edges
+    before them, to run the edges which are independent of each other at once.
+    Strategies which pick each edge from the result of the one before return
+    none.
+    """
+    return []
+
+  def Feedback(self, edge, passed, vertex):
+    """Records the result of running |edge|.
+
+    A failed edge gets an infinite weight, so no shortest path takes it again.
+
+    Args:
+      edge: (source_node, target_node, edge_index) of the edge run.
+      passed: Whether or not the transition passed.
+      vertex: Vertex the system under test is in now.
+    """
+    self.vertex = vertex
+    if edge[2] in (stl.traverse.RESET, stl.traverse.SNAPSHOT,
+                   stl.traverse.RESTORE):
+      return
+    self.uncovered.discard(edge)
+    self.runs[edge] += 1
+    if not passed:
+      self.graph.edges[edge]['weight'] = float('inf')
+      self.paths.Invalidate(edge)
+
+  def _OutEdges(self, vertex):
+    """Returns the edges from |vertex| which have not failed."""
+    return [
+        e for e in self.graph.out_edges(vertex, keys=True)
+        if self.graph.edges[e]['weight'] != float('inf')
+    ]
+
+
+class CircuitStrategy(Strategy):
+  """Runs the minimum edge-covering circuit.
+
+  After a failed transition, the rest of the circuit is dropped, and the
+  transitions not run yet are covered again from the vertex the system under
+  test is left in. The walk stops as soon as every transition has run.
+
+  If transitions failed in past runs, see stl.history.History, the walk runs
+  the likeliest failures first when that costs at most |extra_cost| more.
+
+  Given the |edges| to cover, e.g. those which did not pass recently, the walk
+  only covers them, taking shortest paths to reach them.
+  """
+
+  def __init__(self, graph, initial, reset=False, walk=None,
+               exact_limit=stl.traverse.EXACT_LIMIT, extra_cost=0, edges=None):
+    """Creates a circuit strategy.
+
+    Args:
+      graph: nx MultiDiGraph of transitions.
+      initial: Initial vertex of |graph|.
+      reset: Whether or not the system under test can be reset.
+      walk: Optional list of edges to run instead of the circuit. Only its
+          edges are covered.
+      exact_limit: Maximum number of imbalanced vertexes for which the circuit
+          is planned exactly rather than approximately, or None for no limit.
+      extra_cost: Fraction of the weight of the circuit the walk may add to run
+          likely failures first.
+      edges: Optional list of edges to cover instead of all.
+    """
+    Strategy.__init__(self, graph, initial, reset)
+    self._walk = walk
+    self._exact_limit = exact_limit
+    self._extra_cost = extra_cost
+    self._edges = edges
+    self._failed = False
+    self._plan = iter([])
+    # Edges taken from |_plan| by Peek() which Walk() has not yielded yet.
+    self._upcoming = collections.deque()
+    # Edges Walk() yielded which have no Feedback() yet.
+    self._running = []
+
+  def Walk(self):
+    if self._walk is None and self._edges is not None:
+      self.uncovered = set(self._edges)
+      self._plan = stl.traverse.IterRequiredEdgeCover(
+          self.graph, self.initial, self._edges, self.paths)
+    elif self._walk is None and any(
+        rate for _, _, rate in self.graph.edges(data='failure_rate')):
+      self._plan = iter(stl.traverse.RiskFirstWalk(
+          self.graph, self.initial, self.reset, self.paths, self._extra_cost,
+          self._exact_limit))
+    elif self._walk is None:
+      self._plan = stl.traverse.IterMinEdgeCoverCircuit(
+          self.graph, self.initial, self.reset, self.paths, self._exact_limit)
+    else:
+      self.uncovered = set(
+          e for e in self._walk if e[2] != stl.traverse.RESET)
+      self._plan = iter(self._walk)
+    while self.uncovered:
+      if self._upcoming:
+        edge = self._upcoming.popleft()
+      else:
+        edge = next(self._plan, None)
+      if edge is None:
+        logging.warning('%d transition(s) cannot be reached',
+                        len(self.uncovered))
+        return
+      self._running.append(edge)
+      yield edge
+      if self._failed and not self._running:
+        self._failed = False
+        self._upcoming.clear()
+        self._plan = stl.traverse.IterRequiredEdgeCover(
+            self.graph, self.vertex,
+            [e for e in self.graph.edges(keys=True) if e in self.uncovered],
+            self.paths)
+
+  def Peek(self, n):
+    # The walk stops once the edges running and these cover the rest.
+    remaining = self.uncovered.difference(self._running)
+    upcoming = []
+    for i in itertools.count():
+      if len(upcoming) == n or not remaining:
+        break
+      if i == len(self._upcoming):
+        edge = next(self._plan, None)
+        if edge is None:
+          break
+        self._upcoming.append(edge)
+      upcoming.append(self._upcoming[i])
+      remaining.discard(self._upcoming[i])
+    return upcoming
+
+  def Feedback(self, edge, passed, vertex):
+    Strategy.Feedback(self, edge, passed, vertex)
+    # Results come in the order of the walk, also for the edges of Peek().
+    if self._running:
+      self._running.pop(0)
+    if not passed:
+      self._failed = True
+
+
+class SmokeStrategy(Strategy):
+  """Runs each transition once, taking the nearest one not run yet.
+
+  Each transition is reached by the shortest path from the vertex the system
+  under test is in. Transitions on the way count as run.
+  """
+
+  def Walk(self):
+    while self.uncovered:
+      distances = self.paths.Tree(self.vertex)[0]
+      reachable = [
+          e for e in self.graph.edges(keys=True)
+          if e in self.uncovered and e[0] in distances and
+          self.graph.edges[e]['weight'] != float('inf')
+      ]
+      if not reachable:
+        logging.warning('%d transition(s) cannot be reached',
+                        len(self.uncovered))
+        return
+      nearest = min(reachable, key=lambda e: distances[e[0]])
+      for edge in self.paths.Path(self.vertex, nearest[0]) + [nearest]:
+        yield edge
+        if self.vertex != edge[1]:
+          break  # The transition failed, start again from the error vertex.
+
+
+class RandomStrategy(Strategy):
+  """Runs a random walk of a fixed length, e.g. for soak testing.
+
+  Each step takes one of the transitions from the current vertex which have
+  not failed, or resets the system under test if there is none.
+  """
+
+  def __init__(self, graph, initial, reset=False, length=1000, seed=None):
+    """Creates a random strategy.
+
+    Args:
+      graph: nx MultiDiGraph of transitions.
+      initial: Initial vertex of |graph|.
+      reset: Whether or not the system under test can be reset.
+      length: Number of edges to run.
+      seed: Optional seed of the random walk, to repeat it.
+    """
+    Strategy.__init__(self, graph, initial, reset)
+    self.length = length
+    self._random = random.Random(seed)
+
+  def Walk(self):
+    for _ in range(self.length):
+      edges = self._OutEdges(self.vertex)
+      if edges:
+        yield self._Choose(edges)
+      elif self.reset and self.vertex != self.initial:
+        yield (self.vertex, self.initial, stl.traverse.RESET)
+      else:
+        logging.warning('No transition to run from %s', self.vertex)
+        return
+
+  def _Choose(self, edges):
+    """Returns the next edge to run among |edges|."""
+    return self._random.choice(edges)
+
+
+class WeightedStrategy(RandomStrategy):
+  """Runs a random walk which favors transitions run fewer times.
+
+  An edge is chosen with a probability inversely proportional to one more than
+  the number of times it has run. The walk stops once every transition has run,
+  or after |length| edges.
+  """
+
+  def Walk(self):
+    for edge in RandomStrategy.Walk(self):
+      yield edge
+      if not self.uncovered:
+        return
+
+  def _Choose(self, edges):
+    weights = [1.0 / (1 + self.runs[e]) for e in edges]
+    point = self._random.uniform(0, sum(weights))
+    for edge, weight in zip(edges, weights):
+      point -= weight
+      if point <= 0:
+        return edge
+    return edges[-1]
+
+
+class BudgetStrategy(Strategy):
+  """Runs the most valuable transitions which fit in a time budget.
+
+  Each transition not run yet is worth its value in |values|, keyed on its name
+  or its template name (1 by default), plus |failure_value| times the fraction
+  of its past runs which failed. Repeatedly, the strategy takes the shortest
+  path to the transition which collects the most value per estimated
+  millisecond on the way, among those which fit in the rest of the budget.
+
+  Transitions take their 'cost_ms' estimates if the graph was weighed by run
+  time, and |default_ms| otherwise. The budget is spent by the estimated run
+  times, or by the actual time taken if it is longer.
+  """
+
+  def __init__(self, graph, initial, reset=False, budget_ms=300000,
+               values=None, failure_value=1, default_ms=1000, reset_ms=None):
+    """Creates a budget strategy.
+
+    Args:
+      graph: nx MultiDiGraph of transitions.
+      initial: Initial vertex of |graph|.
+      reset: Whether or not the system under test can be reset.
+      budget_ms: Milliseconds to spend.
+      values: Optional dictionary of the values of transitions, keyed on their
+          names or template names, e.g. of recently changed transitions.
+      failure_value: Extra value of a transition which always failed before.
+      default_ms: Estimated milliseconds of each transition if the graph is not
+          weighed by run time.
+      reset_ms: Estimated milliseconds of a reset. Defaults to |default_ms|.
+    """
+    Strategy.__init__(self, graph, initial, reset)
+    self.budget_ms = budget_ms
+    self.spent_ms = 0.0
+    self._values = values or {}
+    self._failure_value = failure_value
+    # Edge weights are milliseconds once the graph is weighed by run time.
+    weighed = any('cost_ms' in attr for _, _, attr in graph.edges(data=True))
+    self._unit_ms = 1 if weighed else default_ms
+    self._reset_ms = default_ms if reset_ms is None else reset_ms
+
+  def Value(self, edge):
+    """Returns the value of running |edge| now."""
+    if edge not in self.uncovered:
+      return 0
+    attr = self.graph.edges[edge]
+    template = getattr(attr.get('transition'), 'template', None)
+    value = self._values.get(attr.get('label'), self._values.get(template, 1))
+    return value + self._failure_value * attr.get('failure_rate', 0)
+
+  def Duration(self, edge):
+    """Returns the estimated milliseconds of running |edge|."""
+    if edge[2] == stl.traverse.RESET:
+      return self._reset_ms
+    return self.graph.edges[edge]['weight'] * self._unit_ms
+
+  def Walk(self):
+    start = time.time()
+    total = len(self.uncovered)
+    while self.uncovered:
+      remaining_ms = self.budget_ms - max(self.spent_ms,
+                                          (time.time() - start) * 1000)
+      reset_edges = None
+      if self.reset:
+        reset_edges = (self.initial, float(self._reset_ms) / self._unit_ms)
+      distances, predecessors = stl.traverse.ShortestPathTree(
+          self.graph, self.vertex, reset_edges)
+      # Value collected on the shortest path to each vertex.
+      collected = {self.vertex: 0}
+      for node in sorted(distances, key=distances.get):
+        if node != self.vertex:
+          edge = predecessors[node]
+          collected[node] = collected[edge[0]] + self.Value(edge)
+      best, best_rate = None, 0
+      for edge in self.graph.edges(keys=True):
+        if (edge not in self.uncovered or edge[0] not in distances or
+            self.graph.edges[edge]['weight'] == float('inf')):
+          continue
+        cost_ms = distances[edge[0]] * self._unit_ms + self.Duration(edge)
+        if cost_ms > remaining_ms:
+          continue
+        rate = (collected[edge[0]] + self.Value(edge)) / cost_ms
+        if rate > best_rate:
+          best, best_rate = edge, rate
+      if best is None:
+        break
+      path = stl.traverse.PathFromTree(predecessors, self.vertex, best[0])
+      for edge in path + [best]:
+        yield edge
+        self.spent_ms += self.Duration(edge)
+        if self.vertex != edge[1]:
+          break  # The transition failed, plan again from the error vertex.
+    logging.info(
+        'Covered %d of %d transition(s) in an estimated %.0f of %d ms, '
+        'skipped %d', total - len(self.uncovered), total, self.spent_ms,
+        self.budget_ms, len(self.uncovered))
+
+
+class SnapshotStrategy(Strategy):
+  """Covers the transitions as a tree of walks from snapshots.
+
+  The system under test must be able to snapshot and restore its states, see
+  stl.lib.Snapshot. Rather than walking back to a vertex with transitions not
+  run yet, the walk restores a snapshot whenever that is faster.
+
+  Restores are compared with transitions by their run times, measured while
+  walking. If the graph is weighed by run time, a restore weighs its mean
+  milliseconds, and otherwise its mean milliseconds per transition.
+  """
+
+  def __init__(self, graph, initial, reset=False, restore_weight=None):
+    """Creates a snapshot strategy.
+
+    Args:
+      graph: nx MultiDiGraph of transitions.
+      initial: Initial vertex of |graph|.
+      reset: Whether or not the system under test can be reset.
+      restore_weight: Optional fixed weight of a restore, instead of measuring
+          it.
+    """
+    Strategy.__init__(self, graph, initial, reset)
+    self.snapshots = set()
+    self._restore_weight = restore_weight
+    self._weighed = any(
+        'cost_ms' in attr for _, _, attr in graph.edges(data=True))
+    # Measured milliseconds keyed on SNAPSHOT, RESTORE and None for transitions.
+    self._durations = collections.defaultdict(list)
+    self._failed = False
+
+  def RestoreWeight(self):
+    """Returns the weight of a restore in the units of edge weights."""
+    if self._restore_weight is not None:
+      return self._restore_weight
+    restores = (self._durations[stl.traverse.RESTORE] or
+                self._durations[stl.traverse.SNAPSHOT])
+    if not restores:
+      return 1
+    restore_ms = sum(restores) / len(restores)
+    transitions = self._durations[None]
+    if self._weighed:
+      return restore_ms
+    if not transitions or not sum(transitions):
+      return 1
+    return restore_ms / (sum(transitions) / len(transitions))
+
+  def Walk(self):
+    walk = stl.traverse.IterSnapshotCover(
+        self.graph, self.initial, list(self.graph.edges(keys=True)),
+        self.RestoreWeight, self.snapshots, self.paths)
+    while self.uncovered:
+      edge = next(walk, None)
+      if edge is None:
+        logging.warning('%d transition(s) cannot be reached',
+                        len(self.uncovered))
+        return
+      start = time.time()
+      yield edge
+      key = edge[2] if edge[2] in (stl.traverse.SNAPSHOT,
+                                   stl.traverse.RESTORE) else None
+      self._durations[key].append((time.time() - start) * 1000)
+      if self._failed:
+        self._failed = False
+        walk = stl.traverse.IterSnapshotCover(
+            self.graph, self.vertex,
+            [e for e in self.graph.edges(keys=True) if e in self.uncovered],
+            self.RestoreWeight, self.snapshots, self.paths)
+
+  def Feedback(self, edge, passed, vertex):
+    Strategy.Feedback(self, edge, passed, vertex)
+    if not passed:
+      if edge[2] == stl.traverse.SNAPSHOT:
+        self.snapshots.discard(edge[0])
+      self._failed = True
+
+
+class OnlineStrategy(Strategy):
+  """Explores the transition graph while walking it.
+
+  Vertexes are explored when the walk reaches them, e.g. by
+  stl.graph.LazyTransitionGraph, so the first transition runs right away and
+  only the visited region of the graph is kept. Each step takes the shortest
+  path to the nearest transition not run yet, or to the nearest vertex not
+  explored yet.
+  """
+
+  def __init__(self, graph, initial, reset=False, explore=None):
+    """Creates an online strategy.
+
+    Args:
+      graph: nx MultiDiGraph of the transitions explored so far.
+      initial: Initial vertex of |graph|.
+      reset: Whether or not the system under test can be reset.
+      explore: Function adding the out-edges of a vertex to |graph|, which
+          returns the list of edges added.
+    """
+    Strategy.__init__(self, graph, initial, reset)
+    self._explore = explore
+    self._explored = set()
+
+  def Walk(self):
+    while True:
+      if self.vertex not in self._explored:
+        self._explored.add(self.vertex)
+        self.uncovered.update(self._explore(self.vertex))
+      reset_edges = None
+      if self.reset:
+        reset_edges = (self.initial, stl.traverse.ResetWeight(self.graph))
+      distances, predecessors = stl.traverse.ShortestPathTree(
+          self.graph, self.vertex, reset_edges)
+      goals = [(distances[e[0]], e) for e in self.graph.edges(keys=True)
+               if e in self.uncovered and e[0] in distances and
+               self.graph.edges[e]['weight'] != float('inf')]
+      goals.extend((distances[n], n) for n in self.graph.nodes()
+                   if n in distances and n not in self._explored)
+      if not goals:
+        if self.uncovered:
+          logging.warning('%d transition(s) cannot be reached',
+                          len(self.uncovered))
+        return
+      _, goal = min(goals, key=lambda g: g[0])
+      if isinstance(goal, tuple):
+        walk = stl.traverse.PathFromTree(predecessors, self.vertex,
+                                         goal[0]) + [goal]
+      else:
+        walk = stl.traverse.PathFromTree(predecessors, self.vertex, goal)
+      for edge in walk:
+        yield edge
+        if self.vertex != edge[1]:
+          break  # The transition failed, start again from the error vertex.
+
+
+STRATEGIES = {
+    'budget': BudgetStrategy,
+    'circuit': CircuitStrategy,
+    'online': OnlineStrategy,
+    'random': RandomStrategy,
+    'smoke': SmokeStrategy,
+    'snapshot': SnapshotStrategy,
+    'weighted': WeightedStrategy,
+}
+
+
+def CreateStrategy(name, graph, initial, reset=False, **options):
+  """Creates a strategy by name.
+
+  Args:
+    name: Name of the strategy in STRATEGIES.
+    graph: nx MultiDiGraph of transitions.
+    initial: Initial vertex of |graph|.
+    reset: Whether or not the system under test can be reset.
+    **options: Options of the strategy, e.g. length of a random walk.
+  Returns:
+    stl.strategy.Strategy.
+  Raises:
+    NameError: If there is no strategy named |name|.
+  """
+  if name not in STRATEGIES:
+    did_you_mean = stl.levenshtein.closest_candidate(name, STRATEGIES.keys())
+    raise NameError('Cannot find a strategy: %s. Did you mean %s?' %
+                    (name, did_you_mean))
+  return STRATEGIES[name](graph, initial, reset, **options)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for stl.strategy."""
+# pylint: disable=invalid-name
+
+import unittest
+
+import networkx as nx
+
+import stl.strategy
+import stl.traverse
+
+
+class StrategyTest(unittest.TestCase):
+
+  def setUp(self):
+    self.graph = nx.MultiDiGraph()
+    for s, t in [('s0', 's1'), ('s1', 's2'), ('s2', 's0'), ('s1', 's0'),
+                 ('s2', 's1')]:
+      self.graph.add_edge(s, t, weight=1, error_vertex_id=s)
+
+  def _Run(self, strategy, failing=()):
+    """Runs the walk of |strategy|, failing the edges in |failing| once."""
+    walk = []
+    failing = set(failing)
+    vertex = strategy.initial
+    for edge in strategy.Walk():
+      self.assertEqual(vertex, edge[0])
+      walk.append(edge)
+      if edge in failing:
+        failing.remove(edge)
+        vertex = self.graph.edges[edge]['error_vertex_id']
+        strategy.Feedback(edge, False, vertex)
+      else:
+        vertex = edge[1]
+        strategy.Feedback(edge, True, vertex)
+    return walk
+
+  def testCircuit(self):
+    strategy = stl.strategy.CreateStrategy('circuit', self.graph, 's0')
+    walk = self._Run(strategy)
+    self.assertEqual(set(self.graph.edges(keys=True)), set(walk))
+    # One extra path s0 -> s1 -> s2 balances the graph.
+    self.assertEqual(7, len(walk))
+
+  def testCircuitReplansAfterFailure(self):
+    strategy = stl.strategy.CreateStrategy('circuit', self.graph, 's0')
+    walk = self._Run(strategy, [('s0', 's1', 0)])
+    self.assertEqual(('s0', 's1', 0), walk[0])
+    # s0 -> s1 is the only way out of s0, so nothing else can run.
+    self.assertEqual(1, len(walk))
+    self.assertEqual(4, len(strategy.uncovered))
+
+  def testCircuitPeek(self):
+    strategy = stl.strategy.CreateStrategy('circuit', self.graph, 's0')
+    walk = strategy.Walk()
+    first = next(walk)
+    upcoming = strategy.Peek(2)
+    self.assertEqual(2, len(upcoming))
+    # The walk yields the edges peeked before their results are known.
+    self.assertEqual(upcoming, [next(walk), next(walk)])
+    for edge in [first] + upcoming:
+      strategy.Feedback(edge, True, edge[1])
+    rest = list(walk)
+    self.assertEqual(7, len(rest) + 3)
+    # The walk stops at the last edge to cover, and so does Peek().
+    self.assertEqual([], strategy.Peek(2))
+
+  def testCircuitPeekReplansAfterFailure(self):
+    strategy = stl.strategy.CreateStrategy('circuit', self.graph, 's0')
+    walk = strategy.Walk()
+    first = next(walk)
+    second = strategy.Peek(1)[0]
+    self.assertEqual([('s0', 's1', 0), ('s1', 's2', 0)], [first, next(walk)])
+    strategy.Feedback(first, True, 's1')
+    strategy.Feedback(second, False, 's1')
+    # The rest is planned again from s1, where s2 cannot be reached anymore.
+    self.assertEqual([('s1', 's0', 0)], list(walk))
+
+  def testCircuitEdges(self):
+    strategy = stl.strategy.CreateStrategy('circuit', self.graph, 's0',
+                                           edges=[('s2', 's1', 0)])
+    walk = self._Run(strategy)
+    self.assertEqual([('s0', 's1', 0), ('s1', 's2', 0), ('s2', 's1', 0)], walk)
+
+  def testSmoke(self):
+    strategy = stl.strategy.CreateStrategy('smoke', self.graph, 's0')
+    walk = self._Run(strategy, [('s2', 's1', 0)])
+    self.assertEqual(set(self.graph.edges(keys=True)), set(walk))
+    self.assertFalse(strategy.uncovered)
+
+  def testRandom(self):
+    walks = []
+    for _ in range(2):
+      strategy = stl.strategy.CreateStrategy(
+          'random', self.graph, 's0', length=20, seed=1)
+      walks.append(self._Run(strategy))
+    self.assertEqual(20, len(walks[0]))
+    self.assertEqual(walks[0], walks[1])
+
+  def testRandomResets(self):
+    graph = nx.MultiDiGraph()
+    graph.add_edge('s0', 's1', weight=1, error_vertex_id='s0')
+    strategy = stl.strategy.CreateStrategy(
+        'random', graph, 's0', reset=True, length=4)
+    self.assertEqual([('s0', 's1', 0), ('s1', 's0', stl.traverse.RESET)] * 2,
+                     self._Run(strategy))
+
+  def testWeighted(self):
+    strategy = stl.strategy.CreateStrategy(
+        'weighted', self.graph, 's0', length=1000, seed=1)
+    walk = self._Run(strategy)
+    self.assertEqual(set(self.graph.edges(keys=True)), set(walk))
+    self.assertFalse(strategy.uncovered)
+    self.assertLess(len(walk), 1000)
+
+  def testBudget(self):
+    strategy = stl.strategy.CreateStrategy('budget', self.graph, 's0',
+                                           budget_ms=3500, default_ms=1000)
+    walk = self._Run(strategy)
+    self.assertEqual(3, len(walk))
+    self.assertEqual(3, len(set(walk)))
+    self.assertEqual(2, len(strategy.uncovered))
+    self.assertEqual(3000, strategy.spent_ms)
+
+  def testBudgetValues(self):
+    for s, t, k in self.graph.edges(keys=True):
+      self.graph.edges[s, t, k]['label'] = 't%s%s' % (s[1], t[1])
+    self.graph.edges['s1', 's0', 0]['failure_rate'] = 1.0
+    strategy = stl.strategy.CreateStrategy(
+        'budget', self.graph, 's0', budget_ms=3500, values={'t21': 10})
+    # t21 is worth the detour through s2, and t10 failed before.
+    self.assertEqual([('s0', 's1', 0), ('s1', 's2', 0), ('s2', 's1', 0)],
+                     self._Run(strategy))
+    strategy = stl.strategy.CreateStrategy(
+        'budget', self.graph, 's0', budget_ms=2500)
+    self.assertEqual([('s0', 's1', 0), ('s1', 's0', 0)], self._Run(strategy))
+
+  def testSnapshot(self):
+    strategy = stl.strategy.CreateStrategy('snapshot', self.graph, 's0',
+                                           restore_weight=0.5)
+    walk = self._Run(strategy)
+    self.assertEqual(set(self.graph.edges(keys=True)),
+                     set(walk) - set(e for e in walk if isinstance(e[2], str)))
+    self.assertFalse(strategy.uncovered)
+    self.assertEqual(('s0', 's0', stl.traverse.SNAPSHOT), walk[0])
+    self.assertIn(('s1', 's1', stl.traverse.SNAPSHOT), walk)
+
+  def testOnline(self):
+    graph = nx.MultiDiGraph()
+    graph.add_node('s0')
+
+    def Explore(vertex):
+      edges = list(self.graph.out_edges(vertex, keys=True))
+      for s, t, k in edges:
+        graph.add_edge(s, t, k, **self.graph.edges[s, t, k])
+      return edges
+
+    strategy = stl.strategy.CreateStrategy('online', graph, 's0',
+                                           explore=Explore)
+    walk = self._Run(strategy, failing=[('s2', 's0', 0)])
+    self.assertEqual(set(self.graph.edges(keys=True)), set(walk))
+    self.assertFalse(strategy.uncovered)
+
+  def testUnknownStrategy(self):
+    with self.assertRaisesRegexp(NameError, 'Did you mean smoke?'):
+      stl.strategy.CreateStrategy('smok', self.graph, 's0')
+
+
+if __name__ == '__main__':
+  unittest.main()
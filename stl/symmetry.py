@@ -0,0 +1,254 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Symmetry reduction of state transition graphs.
+
+Specs often instantiate the same parameterized states and transitions several
+times with interchangeable ids, e.g. sTlsState(1) and sTlsState(2). Every
+permutation of which id is in which state leads to an equivalent vertex, so the
+transition graph only needs to keep one representative vertex per orbit.
+
+A permutation is a dictionary mapping (group index, id) to the id it moves to.
+Ids which are not in the dictionary are not moved.
+"""
+
+import itertools
+import logging
+
+import stl.base
+import stl.state
+
+
+def _Id(state):
+  """Returns the id of a stl.state.StateResolved within its symmetry group."""
+  return stl.base.GetCSV(state.resolved_params)
+
+
+class Symmetry(object):
+  """Interchangeable instances of parameterized states.
+
+  Resolved states whose names are in the same group and which share the same
+  resolved parameters form a component, e.g. sTlsState(1) and sTlsSession(1).
+  Components of a group are interchangeable when every permutation of their ids
+  maps each transition to another transition. A vertex is then canonicalized by
+  sorting the values of its components.
+
+  Attributes:
+    groups: List of lists of state names whose instances are permuted together.
+  """
+
+  def __init__(self, groups, states, transitions):
+    """Creates a symmetry.
+
+    Args:
+      groups: List of lists of state names.
+      states: Dictionary of stl.state.StateResolved's.
+      transitions: Dictionary of resolved stl.state.Transition's.
+    """
+    self.groups = [sorted(g) for g in groups]
+    self._group_of = {}
+    for i, g in enumerate(self.groups):
+      for name in g:
+        self._group_of[name] = i
+    self._states = {}  # (name, id) -> stl.state.StateResolved
+    self._ids = [set() for _ in self.groups]
+    for s in states.values():
+      if s.name in self._group_of:
+        self._states[(s.name, _Id(s))] = s
+        self._ids[self._group_of[s.name]].add(_Id(s))
+    self._ids = [sorted(ids) for ids in self._ids]
+    self._transition_list = list(transitions.values())
+    self._transitions = {}
+    for t in self._transition_list:
+      self._transitions.setdefault(self._Signature(t, {}), t)
+
+  def __str__(self):
+    return 'SYMMETRY %s' % stl.base.GetCSV(
+        ['(%s)' % stl.base.GetCSV(g) for g in self.groups])
+
+  def IsInvariant(self):
+    """Whether every transition maps to a transition under any permutation.
+
+    Transpositions of adjacent ids generate all permutations, so it is enough
+    to check them.
+
+    Returns:
+      True if the transitions are invariant under permutations of all groups.
+    """
+    for g, ids in enumerate(self._ids):
+      for i, j in zip(ids, ids[1:]):
+        perm = {(g, i): j, (g, j): i}
+        for t in self._transition_list:
+          if self._Signature(t, perm) not in self._transitions:
+            logging.debug('Not symmetric in %s: %s', self.groups[g], t.name)
+            return False
+    return True
+
+  def Canonicalize(self, state_list):
+    """Returns the representative of the orbit of a vertex.
+
+    Args:
+      state_list: List of stl.state.StateValue's of a vertex.
+    Returns:
+      canonical: List of stl.state.StateValue's of the representative vertex.
+      perm: Permutation which maps |state_list| to |canonical|.
+    """
+    values = {}
+    for s in state_list:
+      values[(s.state.name, _Id(s.state))] = s.value
+    perm = {}
+    for g, names in enumerate(self.groups):
+      ids = [i for i in self._ids[g] if any((n, i) in values for n in names)]
+      component_values = {}
+      for i in ids:
+        component_values[i] = [values.get((n, i), '') for n in names]
+      # Sort components by their values, keeping ties in the order of ids.
+      components = sorted(ids, key=component_values.get)
+      for source, target in zip(components, ids):
+        if source != target:
+          perm[(g, source)] = target
+    return self.PermuteStates(state_list, perm), perm
+
+  def PermuteStates(self, state_list, perm):
+    """Returns a copy of |state_list| with ids moved by |perm|."""
+    return [self._PermuteState(s, perm) for s in state_list]
+
+  def PermuteTransition(self, trans, perm):
+    """Returns the transition |trans| is mapped to by |perm|.
+
+    Args:
+      trans: Resolved stl.state.Transition.
+      perm: Permutation of ids.
+    Returns:
+      The resolved stl.state.Transition with the permuted states.
+    Raises:
+      RuntimeError: If no transition matches the permuted one.
+    """
+    if not perm:
+      return trans
+    signature = self._Signature(trans, perm)
+    if signature not in self._transitions:
+      raise RuntimeError('Transitions are not symmetric in %s: %s' %
+                         (self, trans.name))
+    return self._transitions[signature]
+
+  def Orbit(self, trans):
+    """Returns the names of the transitions |trans| maps to by permutations.
+
+    A reduced transition graph only has the edges of one transition of each
+    orbit from each vertex, so the others are found through it.
+    """
+    orbit = {trans.name: trans}
+    queue = [trans]
+    while queue:
+      t = queue.pop()
+      for g, ids in enumerate(self._ids):
+        for i, j in zip(ids, ids[1:]):
+          permuted = self.PermuteTransition(t, {(g, i): j, (g, j): i})
+          if permuted.name not in orbit:
+            orbit[permuted.name] = permuted
+            queue.append(permuted)
+    return set(orbit)
+
+  @staticmethod
+  def Compose(outer, inner):
+    """Returns the permutation applying |inner| first, then |outer|."""
+    composed = {}
+    for k in set(outer) | set(inner):
+      g, i = k
+      j = inner.get(k, i)
+      j = outer.get((g, j), j)
+      if i != j:
+        composed[k] = j
+    return composed
+
+  @staticmethod
+  def Invert(perm):
+    """Returns the inverse permutation of |perm|."""
+    return dict(((g, j), i) for (g, i), j in perm.items())
+
+  def _PermuteState(self, state_value, perm):
+    """Returns |state_value| with its state moved by |perm|."""
+    name = state_value.state.name
+    if name not in self._group_of:
+      return state_value
+    g = self._group_of[name]
+    target = perm.get((g, _Id(state_value.state)))
+    if target is None:
+      return state_value
+    return stl.state.StateValue(self._states[(name, target)],
+                                state_value.value)
+
+  def _Signature(self, trans, perm):
+    """Returns a key identifying |trans| with its states moved by |perm|."""
+    pre_states = sorted(
+        tuple(sorted(str(self._PermuteState(s, perm)) for s in options))
+        for options in trans.pre_states)
+    post_states = sorted(
+        str(self._PermuteState(s, perm)) for s in trans.post_states)
+    error_states = sorted(
+        str(self._PermuteState(s, perm)) for s in trans.error_states)
+    events = [e.name for e in trans.events]
+    return str((trans.template, pre_states, post_states, error_states, events))
+
+
+def InferSymmetry(states, transitions, excluded=()):
+  """Finds parameterized states whose instances are interchangeable.
+
+  Each parameterized state with more than one resolved instance is a candidate
+  group of its own.
+
+  Args:
+    states: Dictionary of stl.state.StateResolved's.
+    transitions: Dictionary of resolved stl.state.Transition's.
+    excluded: State names which must not be inferred, e.g. already declared.
+  Returns:
+    List of lists of state names whose instances are interchangeable.
+  """
+  by_name = {}
+  for s in states.values():
+    if s.name not in excluded:
+      by_name.setdefault(s.name, []).append(s)
+  groups = []
+  for name, instances in sorted(by_name.items()):
+    if len(instances) < 2:
+      continue
+    if Symmetry([[name]], states, transitions).IsInvariant():
+      logging.info('Inferred interchangeable instances of %s', name)
+      groups.append([name])
+  return groups
+
+
+def BuildSymmetry(groups, states, transitions):
+  """Returns a Symmetry of |groups| after checking that it is invariant.
+
+  Args:
+    groups: List of lists of state names.
+    states: Dictionary of stl.state.StateResolved's.
+    transitions: Dictionary of resolved stl.state.Transition's.
+  Returns:
+    stl.symmetry.Symmetry, or None if |groups| is empty.
+  Raises:
+    RuntimeError: If the transitions are not invariant under the symmetry.
+  """
+  if not groups:
+    return None
+  names = list(itertools.chain(*groups))
+  if len(names) != len(set(names)):
+    raise RuntimeError('A state is in more than one symmetry group: %s' %
+                       stl.base.GetCSV(names))
+  symmetry = Symmetry(groups, states, transitions)
+  if not symmetry.IsInvariant():
+    raise RuntimeError('Transitions are not symmetric in %s' % symmetry)
+  return symmetry
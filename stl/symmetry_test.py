@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for stl.symmetry."""
+# pylint: disable=invalid-name
+
+import random
+import unittest
+
+import stl.base
+import stl.graph
+import stl.state
+import stl.symmetry
+
+
+class SymmetryTest(unittest.TestCase):
+
+  def setUp(self):
+    self.sTlsState = stl.state.State('sTlsState')
+    self.sTlsState.params = [stl.base.Param('tlsId', 'int')]
+    self.sTlsState.values = ['kNotConnected', 'kConnected']
+    self.states = {}
+    self.transitions = {}
+    for i in range(1, 4):
+      s = stl.state.StateResolved('sTlsState', self.sTlsState)
+      s.resolved_params = [i]
+      self.states[str(s)] = s
+      self._AddTransition('tConnectTls%d' % i, 'tConnectTls',
+                          stl.state.StateValue(s, 'kNotConnected'),
+                          stl.state.StateValue(s, 'kConnected'))
+      self._AddTransition('tDisconnectTls%d' % i, 'tDisconnectTls',
+                          stl.state.StateValue(s, 'kConnected'),
+                          stl.state.StateValue(s, 'kNotConnected'))
+
+  def _AddTransition(self, name, template, pre_state, post_state):
+    t = stl.state.Transition(name)
+    t.template = template
+    t.pre_states = [[pre_state]]
+    t.post_states = [post_state]
+    self.transitions[name] = t
+    return t
+
+  def testInferSymmetry(self):
+    self.assertEqual([['sTlsState']],
+                     stl.symmetry.InferSymmetry(self.states, self.transitions))
+
+  def testInferSymmetryNotInvariant(self):
+    # Only tlsId 1 can be reset, so the instances are not interchangeable.
+    s = [s for s in self.states.values() if s.resolved_params == [1]][0]
+    self._AddTransition('tResetTls1', 'tResetTls',
+                        stl.state.StateValue(s, 'kConnected'),
+                        stl.state.StateValue(s, 'kNotConnected'))
+    self.assertEqual([],
+                     stl.symmetry.InferSymmetry(self.states, self.transitions))
+    with self.assertRaises(RuntimeError):
+      stl.symmetry.BuildSymmetry([['sTlsState']], self.states,
+                                 self.transitions)
+
+  def testComposeAndInvert(self):
+    perm = {(0, '1'): '2', (0, '2'): '3', (0, '3'): '1'}
+    inverse = stl.symmetry.Symmetry.Invert(perm)
+    self.assertEqual({}, stl.symmetry.Symmetry.Compose(perm, inverse))
+    self.assertEqual({
+        (0, '1'): '3',
+        (0, '2'): '1',
+        (0, '3'): '2'
+    }, stl.symmetry.Symmetry.Compose(perm, perm))
+
+  def testGraphSize(self):
+    graph, _ = stl.graph.BuildTransitionGraph(self.transitions, self.states)
+    self.assertEqual(8, graph.number_of_nodes())
+    self.assertEqual(24, graph.number_of_edges())
+
+    symmetry = stl.symmetry.BuildSymmetry([['sTlsState']], self.states,
+                                          self.transitions)
+    graph, _ = stl.graph.BuildTransitionGraph(self.transitions, self.states,
+                                              symmetry)
+    # Vertexes are identified by the number of connected instances.
+    self.assertEqual(4, graph.number_of_nodes())
+    self.assertEqual(12, graph.number_of_edges())
+
+  def testOrbit(self):
+    symmetry = stl.symmetry.BuildSymmetry([['sTlsState']], self.states,
+                                          self.transitions)
+    self.assertEqual(set(['tConnectTls1', 'tConnectTls2', 'tConnectTls3']),
+                     symmetry.Orbit(self.transitions['tConnectTls3']))
+
+  def testMapRepresentativeEdges(self):
+    symmetry = stl.symmetry.BuildSymmetry([['sTlsState']], self.states,
+                                          self.transitions)
+    graph, initial = stl.graph.BuildTransitionGraph(self.transitions,
+                                                    self.states, symmetry)
+    # Walk randomly through the reduced graph and check that the transitions
+    # mapped back always match the concrete state they are run from.
+    concrete = dict((str(s), 'kNotConnected') for s in self.states.values())
+    permutation = {}
+    vertex = initial
+    rand = random.Random(0)
+    for _ in range(100):
+      source, target, key = rand.choice(list(graph.out_edges(vertex,
+                                                             keys=True)))
+      attr = graph[source][target][key]
+      transition = symmetry.PermuteTransition(attr['transition'], permutation)
+      pre_state = transition.pre_states[0][0]
+      self.assertEqual(pre_state.value, concrete[str(pre_state.state)])
+      post_state = transition.post_states[0]
+      concrete[str(post_state.state)] = post_state.value
+      permutation = symmetry.Compose(permutation, attr['permutation'])
+      vertex = target
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -20,89 +20,130 @@ least once.
 """
 
 import collections
+import heapq
+import itertools
+import logging
+
 import networkx as nx
+import numpy as np
 
 
 class Context(object):
   """Context object for running the Hungarian algorithm.
 
-  Contains algorithm variables.
+  Contains algorithm variables. Vertexes in left and right are indexes into
+  |left| and |right|, and all per-vertex variables are NumPy arrays, so each
+  step of the algorithm updates all vertexes at once.
 
   Attributes:
-    g: The complete bipartite graph we will find a maximum matching for.
-    left: The set of left nodes.
-    right: The set of right nodes.
-    labels: Dictionary of vertex names to numeric algorithm label.
+    left: List of left nodes.
+    right: List of right nodes.
+    weights: Dense matrix where weights[x, y] is the weight of edge (x, y).
+    left_labels: Array of numeric algorithm labels of left vertexes.
+    right_labels: Array of numeric algorithm labels of right vertexes.
     num_matched: Current number of matched edges
-    s: Set of left nodes in the augmenting tree
-    t: Set of right nodes in the augmenting tree
-    matches: Dictionary where matches[n] = m (and matches[m] = n) if n and m are
-        currently matched.
-    slack: Dictionary keyed on y, where slack[y] = min(for x in S: labels[x] +
-        labels[y] - weight(x, y))
-    slackx: Dictionary keyed on y, where slackx[y] is the node in right which
-        gives y its current slack value.
-    prev: Dictionary keyed on a node x in S, where prev[x] is the previous node
-        in S along x's path in the augmenting tree.
+    s: Boolean mask of left vertexes in the augmenting tree
+    t: Boolean mask of right vertexes in the augmenting tree
+    left_matches: Array where left_matches[x] = y if x and y are currently
+        matched, or -1 if x is not matched.
+    right_matches: Array where right_matches[y] = x if x and y are currently
+        matched, or -1 if y is not matched.
+    slack: Array where slack[y] = min(for x in S: left_labels[x] +
+        right_labels[y] - weights[x, y])
+    slackx: Array where slackx[y] is the vertex in S which gives y its current
+        slack value.
+    prev: Array where prev[x] is the previous vertex in S along x's path in the
+        augmenting tree, or -1 for the root.
   """
 
   def __init__(self):
-    self.g = None
     self.left = None
     self.right = None
-    self.labels = None
+    self.weights = None
+    self.left_labels = None
+    self.right_labels = None
     self.num_matched = 0
     self.s = None
     self.t = None
-    self.matches = None
+    self.left_matches = None
+    self.right_matches = None
     self.slack = None
     self.slackx = None
     self.prev = None
+    self._epsilon = 0
 
   def MaxBipartiteMatching(self, graph):
     """Find a maximum matching for a bipartite graph.
 
+    Args:
+      graph: A networkx graph object, assumed to be complete bipartite.
+    Returns:
+      A dictionary keyed on node names in left to node names in right.
+    """
+    # The data object will have data['bipartite'] == 0 if it is on the left.
+    left = [n for n, d in graph.nodes(data=True) if not d['bipartite']]
+    right = [n for n, d in graph.nodes(data=True) if d['bipartite']]
+    weights = np.full((len(left), len(right)), -np.inf)
+    right_index = dict((n, i) for i, n in enumerate(right))
+    for x, n in enumerate(left):
+      for m, attr in graph[n].items():
+        weights[x, right_index[m]] = attr['weight']
+    matches = self.MaxWeightMatching(weights)
+    self.left = left
+    self.right = right
+    return dict((n, right[y]) for n, y in zip(left, matches))
+
+  def MaxWeightMatching(self, weights):
+    """Find a maximum weight matching for a dense weight matrix.
+
     This is O(n^3) implementation of the Hungarian method for complete bipartite
     matching problems.
 
     Args:
-      graph: A networkx graph object, assumed to be bipartite.
+      weights: Matrix of n x m weights, where n <= m.
     Returns:
-      A dictionary keyed on node names in left to node names in right.
+      Array of n indexes, where the x-th element is the column matched to x.
     """
     # Initialize algorithm variables
-    self.g = nx.Graph(graph)
-    # The data object will have data['bipartite'] == 0 if it is on the left.
-    self.left = set(n for n, d in self.g.nodes(data=True) if not d['bipartite'])
-    self.right = set(self.g) - self.left
+    self.weights = np.asarray(weights, dtype=float)
+    n, m = self.weights.shape
     self.num_matched = 0
-    self.s = set()
-    self.t = set()
-    self.matches = {}
-    self.slack = {}
-    self.slackx = {}
-    self.prev = {}
+    self.left_matches = np.full(n, -1, dtype=int)
+    self.right_matches = np.full(m, -1, dtype=int)
+    finite = self.weights[np.isfinite(self.weights)]
+    scale = np.abs(finite).max() if finite.size else 0
+    # Tolerance for comparing labels, which accumulate rounding errors.
+    self._epsilon = 1e-9 * max(1, scale)
 
     # Initialize labels to create a trivial equality subgraph.
-    self.labels = {}
-    for x in self.left:
-      self.labels[x] = max([val['weight'] for val in self.g[x].values()])
-    for y in self.right:
-      self.labels[y] = 0
+    self.left_labels = self.weights.max(axis=1) if m else np.zeros(n)
+    self.right_labels = np.zeros(m)
+    self._MatchTightEdges()
 
     # Augment until we have a perfect matching.
-    while self.num_matched != len(self.left):
+    while self.num_matched != n:
       self._Augment()
-    # Return only the left -> right mappings.
-    ret = {}
-    for k in self.left:
-      ret[k] = self.matches[k]
-    return ret
+    return self.left_matches.copy()
+
+  def _MatchTightEdges(self):
+    """Greedily match the edges of the initial equality subgraph.
+
+    Every left vertex with a free right vertex at its maximum weight is matched
+    to it, which leaves few vertexes for the augmenting path search.
+    """
+    for x in range(self.weights.shape[0]):
+      tight = np.flatnonzero((self._CalcSlack(x) <= self._epsilon) &
+                             (self.right_matches < 0))
+      if tight.size:
+        y = tight[0]
+        self.left_matches[x] = y
+        self.right_matches[y] = x
+        self.num_matched += 1
 
   def _Augment(self):
-    """Find an augmenting path starting from an unmatched node in |left|.
+    """Find an augmenting path starting from an unmatched vertex in left.
 
-    Start with a root node in |left| and attempt to find an augmenting path
+    Start with a root vertex in left and attempt to find an augmenting path
     starting from |root|. In order for a path to be augmenting, each edge in the
     path must have: weight(x, y) == labels[x] + labels[y]. The set of all edges
     which have this property is known as the "equality subgraph" for the current
@@ -112,96 +153,43 @@ class Context(object):
     with an unmatched edge; augmenting the path flips the matched-ness of each
     edge, so that the total number of matched edges increases by 1.
 
-    If an augmenting path does not exist, we update the labels of all nodes in
-    S and T to force new edges into the equality subgraph. Eventually, an
+    If an augmenting path does not exist, we update the labels of all vertexes
+    in S and T to force new edges into the equality subgraph. Eventually, an
     augmenting path will be generated this way.
     """
-    self.s = set()
-    self.t = set()
-    self.prev = {}
-    queue = collections.deque()
-    # Choose left node which is not yet matched
-    root = list(self.left - set(self.matches.keys()))[0]
-    queue.append(root)
-    self.s.add(root)
-    for y in self.right:
-      self.slack[y] = self._CalcSlack(root, y)
-      self.slackx[y] = root
+    n, m = self.weights.shape
+    self.s = np.zeros(n, dtype=bool)
+    self.t = np.zeros(m, dtype=bool)
+    self.prev = np.full(n, -1, dtype=int)
+    # Choose left vertex which is not yet matched
+    root = np.flatnonzero(self.left_matches < 0)[0]
+    self.s[root] = True
+    self.slack = self._CalcSlack(root)
+    self.slackx = np.full(m, root, dtype=int)
     while True:
-      # We will try to find an augmenting path.
-      path_exists, x, y = self._FindAugmentingPath(queue)
-      if path_exists:
-        break
-      self._UpdateLabels()
-      queue.clear()
-      # Try to find a newly-added edge in the equality subgraph.
-      path_exists, x, y = self._FindAugmentingEdge(queue)
-      if path_exists:
+      # Edges (slackx[y], y) with y in Right - T in the equality subgraph.
+      tight = np.flatnonzero(~self.t & (self.slack <= self._epsilon))
+      if not tight.size:
+        self._UpdateLabels()
+        continue
+      y = tight[0]
+      if self.right_matches[y] < 0:
+        # y is a free vertex, so (slackx[y], y) terminates an augmenting path.
         break
+      # The edge is matched, but we will try to extend the tree from its match.
+      self.t[y] = True
+      self._AddToTree(self.right_matches[y], self.slackx[y])
     # Invert the augmenting path; the number of matched edges increases by 1.
-    self._InvertPath(x, y)
-
-  def _FindAugmentingPath(self, queue):
-    """Find an augmenting path for the current labeling.
-
-    Perform a BFS to find an augmenting path for the current labeling.
-
-    Args:
-      queue: Queue for performing BFS traversal.
-    Returns:
-      found: True if path was found.
-      x: Left vertex of final path edge.
-      y: Right vertex of final path edge.
-    """
-    while queue:
-      x = queue.popleft()
-      # Nodes in Right - T which share an edge with x in the equality subgraph.
-      for y in self.right - self.t:
-        if not self._InEqualitySubgraph(x, y):
-          continue
-        # Edge (x, y) is in the equality subgraph.
-        if y not in self.matches:
-          # Edge (x, y) is an unmatched edge terminating an augmenting path.
-          return True, x, y
-        # The edge is matched, but we will try
-        self.t.add(y)
-        queue.append(self.matches[y])
-        self._AddToTree(self.matches[y], x)
-    return False, None, None
-
-  def _FindAugmentingEdge(self, queue):
-    """Find a final edge for an augmenting path after updating labels.
-
-    At least one new edge should have been added to the equality subgraph, so
-    we check if any new edges will create an augmenting path.
-
-    Args:
-      queue: Queue for performing BFS traversal.
-    Returns:
-      found: True if path was found.
-      x: Left vertex of final path edge.
-      y: Right vertex of final path edge.
-    """
-    for y in (v for v in self.right - self.t if self.slack[v] == 0):
-      # Edge (slackx[y], y) is now in the equality subgraph.
-      if y not in self.matches:
-        # y is a free node, so (slackx[y], y) terminates an augmenting path.
-        return True, self.slackx[y], y
-      self.t.add(y)
-      if self.matches[y] not in self.s:
-        queue.append(self.matches[y])
-        self._AddToTree(self.matches[y], self.slackx[y])
-    return False, None, None
+    self._InvertPath(self.slackx[y], y)
 
   def _InvertPath(self, x, y):
     """Invert the augmenting path whose final edge is (x, y)."""
     self.num_matched += 1
     while True:
-      if x in self.matches:
-        ty = self.matches[x]
-      self.matches[y] = x
-      self.matches[x] = y
-      if x not in self.prev:
+      ty = self.left_matches[x]
+      self.right_matches[y] = x
+      self.left_matches[x] = y
+      if self.prev[x] < 0:
         break
       y = ty
       x = self.prev[x]
@@ -214,126 +202,990 @@ class Context(object):
     by slack. This guarantees at least one vertex in Right will have a slack
     value of 0, thereby adding it to the equality subgraph.
     """
-    delta = float('inf')
-    for y in self.right - self.t:
-      delta = min(delta, self.slack[y])
-    for x in self.s:
-      self.labels[x] -= delta
-    for y in self.t:
-      self.labels[y] += delta
-    for y in self.right - self.t:
-      self.slack[y] -= delta
+    free = ~self.t
+    delta = self.slack[free].min()
+    self.left_labels[self.s] -= delta
+    self.right_labels[self.t] += delta
+    self.slack[free] -= delta
 
   def _AddToTree(self, x, prevx):
     """Adds |x| to the current augmenting tree.
 
-    x is a node which has already been matched to a node y in Right (which is
-    itself connected to prevx via a non-matching edge in the equality subgraph).
-    We indicate prevx comes before x in the tree so we can trace the path later.
+    x is a vertex which has already been matched to a vertex y in Right (which
+    is itself connected to prevx via a non-matching edge in the equality
+    subgraph). We indicate prevx comes before x in the tree so we can trace the
+    path later.
 
     Args:
-      x: Node which has already been matched to a node y in right
-      prevx: Previous node in Left along the path.
+      x: Vertex which has already been matched to a vertex y in right
+      prevx: Previous vertex in Left along the path.
     """
-    self.s.add(x)
+    self.s[x] = True
     self.prev[x] = prevx
-    for y in self.right:
-      # Find the minimum slack over all edges from nodes in S connected to y
-      slack = self._CalcSlack(x, y)
-      if slack < self.slack[y]:
-        self.slack[y] = slack
-        # Remember the node in S which brought the slack down.
-        self.slackx[y] = x
+    # Find the minimum slack over all edges from vertexes in S connected to y
+    slack = self._CalcSlack(x)
+    smaller = slack < self.slack
+    self.slack[smaller] = slack[smaller]
+    # Remember the vertex in S which brought the slack down.
+    self.slackx[smaller] = x
 
-  def _InEqualitySubgraph(self, x, y):
-    """Return True if x and y are in the equality subgraph."""
-    return self.g[x][y]['weight'] == self.labels[x] + self.labels[y]
+  def _CalcSlack(self, x):
+    """Calculate the slacks for all edges (x, y)."""
+    return self.left_labels[x] + self.right_labels - self.weights[x]
 
-  def _CalcSlack(self, x, y):
-    """Calculate the slack for an edge (x, y)."""
-    return self.labels[x] + self.labels[y] - self.g[x][y]['weight']
 
+def MinCostFlow(costs, supplies, demands):
+  """Finds the cheapest way to ship supplies from sources to sinks.
 
-def MinEdgeCoverCircuit(graph, initial):
-  """Calculates the minimum edge-covering circuit for a graph.
+  Solves the transportation problem with successive shortest paths: each step
+  runs Dijkstra's algorithm on the residual network with reduced costs, from
+  all sources with remaining supply to the closest sink with remaining demand,
+  and ships as much as the path allows. Node potentials keep the reduced costs
+  non-negative. Capacities between sources and sinks are unbounded.
+
+  Args:
+    costs: Matrix of n x m non-negative costs of shipping one unit from source
+        x to sink y.
+    supplies: Array of n units to ship from each source.
+    demands: Array of m units to ship to each sink. The sum must equal the sum
+        of |supplies|.
+  Returns:
+    Matrix of n x m integer units shipped from source x to sink y.
+  Raises:
+    RuntimeError: if the demands cannot be met.
+  """
+  costs = np.asarray(costs, dtype=float)
+  n, m = costs.shape
+  supplies = np.array(supplies, dtype=int)
+  demands = np.array(demands, dtype=int)
+  if supplies.sum() != demands.sum():
+    raise RuntimeError('Supplies and demands are not balanced.')
+  flows = np.zeros((n, m), dtype=int)
+  left_potentials = np.zeros(n)
+  right_potentials = np.zeros(m)
+  while supplies.any():
+    # Dijkstra over the residual network, starting from all sources at once.
+    left_distances = np.where(supplies > 0, 0, np.inf)
+    right_distances = np.full(m, np.inf)
+    left_done = np.zeros(n, dtype=bool)
+    right_done = np.zeros(m, dtype=bool)
+    left_prev = np.full(n, -1, dtype=int)
+    right_prev = np.full(m, -1, dtype=int)
+    while True:
+      x = np.argmin(np.where(left_done, np.inf, left_distances))
+      y = np.argmin(np.where(right_done, np.inf, right_distances))
+      if left_done[x] or (not right_done[y] and
+                          right_distances[y] <= left_distances[x]):
+        if np.isinf(right_distances[y]) or right_done[y]:
+          raise RuntimeError('Demands cannot be met.')
+        right_done[y] = True
+        if demands[y] > 0:
+          break
+        # Residual arcs back to the sources which ship to y.
+        reduced = (-costs[:, y] + right_potentials[y] - left_potentials +
+                   right_distances[y])
+        closer = (flows[:, y] > 0) & ~left_done & (reduced < left_distances)
+        left_distances[closer] = reduced[closer]
+        left_prev[closer] = y
+      else:
+        left_done[x] = True
+        reduced = (costs[x] + left_potentials[x] - right_potentials +
+                   left_distances[x])
+        closer = ~right_done & (reduced < right_distances)
+        right_distances[closer] = reduced[closer]
+        right_prev[closer] = x
+    distance = right_distances[y]
+    left_potentials += np.minimum(left_distances, distance)
+    right_potentials += np.minimum(right_distances, distance)
+
+    # Trace the path back to its source and ship as much as it allows.
+    path = []
+    sink = y
+    while True:
+      x = right_prev[y]
+      path.append((x, y))
+      if left_prev[x] < 0:
+        break
+      y = left_prev[x]
+    # Consecutive steps are joined by residual arcs cancelling a shipment.
+    cancelled = [(x, y) for (x, _), (_, y) in zip(path, path[1:])]
+    amount = min([supplies[x], demands[sink]] +
+                 [flows[x, y] for x, y in cancelled])
+    supplies[x] -= amount
+    demands[sink] -= amount
+    for x, y in path:
+      flows[x, y] += amount
+    for x, y in cancelled:
+      flows[x, y] -= amount
+  return flows
+
+
+# Key of the edges which reset the system under test to the initial vertex.
+RESET = 'reset'
+
+# Key of the self-loop edges which take a snapshot of the system under test.
+SNAPSHOT = 'snapshot'
+
+# Key of the edges which restore the system under test to a snapshot.
+RESTORE = 'restore'
+
+
+def ResetWeight(graph):
+  """Returns a weight of reset edges which outweighs any path without resets.
+
+  A path visits each node at most once, and the circuit needs at most one
+  extra path per edge, so no set of extra paths without resets costs more.
+  Edges weighed e.g. by run time scale this bound by the heaviest finite weight.
+
+  Args:
+    graph: nx MultiDiGraph to examine.
+  """
+  heaviest = max([w for _, _, w in graph.edges(data='weight')
+                  if w != float('inf')] or [1])
+  return graph.number_of_nodes() * (graph.number_of_edges() + 1) * heaviest
+
+
+def ShortestPathTree(graph, source, reset=None):
+  """Finds the shortest paths from |source| to all reachable nodes.
+
+  Runs a breadth-first search while every edge has weight 1, which is the case
+  until a transition fails, and Dijkstra's algorithm otherwise. Among parallel
+  edges the one with the smallest weight is taken.
+
+  Args:
+    graph: nx MultiDiGraph to examine.
+    source: Node to start from.
+    reset: Optional 2-tuple (initial vertex, weight). If set, every node also
+        has an edge (node, initial, RESET) with that weight.
+  Returns:
+    distances: Dictionary of path weights keyed on reachable nodes.
+    predecessors: Dictionary where predecessors[n] is the last edge
+        (source_node, target_node, edge_index) of the shortest path to n.
+  """
+  distances = {source: 0}
+  predecessors = {}
+  if not reset and all(w == 1 for _, _, w in graph.edges(data='weight')):
+    queue = collections.deque([source])
+    while queue:
+      node = queue.popleft()
+      for _, target, key in graph.out_edges(node, keys=True):
+        if target not in distances:
+          distances[target] = distances[node] + 1
+          predecessors[target] = (node, target, key)
+          queue.append(target)
+    return distances, predecessors
+
+  heap = [(0, 0, source)]
+  done = set()
+  count = itertools.count(1)  # Tie breaker, nodes need not be comparable.
+  while heap:
+    distance, _, node = heapq.heappop(heap)
+    if node in done:
+      continue
+    done.add(node)
+    edges = list(graph.out_edges(node, keys=True, data='weight'))
+    if reset:
+      edges.append((node, reset[0], RESET, reset[1]))
+    for _, target, key, weight in edges:
+      if distance + weight < distances.get(target, float('inf')):
+        distances[target] = distance + weight
+        predecessors[target] = (node, target, key)
+        heapq.heappush(heap, (distance + weight, next(count), target))
+  return distances, predecessors
+
+
+def PathFromTree(predecessors, source, target):
+  """Returns the list of edges from |source| to |target| in a path tree."""
+  path = []
+  while target != source:
+    edge = predecessors[target]
+    path.append(edge)
+    target = edge[0]
+  path.reverse()
+  return path
+
+
+class ShortestPaths(object):
+  """Cache of the shortest path trees of a graph, keyed on their source node.
+
+  Attributes:
+    graph: nx MultiDiGraph to examine.
+    reset: Optional 2-tuple (initial vertex, weight) of reset edges.
+  """
+
+  def __init__(self, graph, reset=None):
+    self.graph = graph
+    self.reset = reset
+    self._trees = {}
+
+  def Tree(self, source):
+    """Returns the distances and predecessors of ShortestPathTree."""
+    if source not in self._trees:
+      self._trees[source] = ShortestPathTree(self.graph, source, self.reset)
+    return self._trees[source]
+
+  def Distance(self, source, target):
+    """Returns the weight of the shortest path, or inf if there is none."""
+    return self.Tree(source)[0].get(target, float('inf'))
+
+  def Path(self, source, target):
+    """Returns the list of edges of the shortest path, or None."""
+    distances, predecessors = self.Tree(source)
+    if target not in distances:
+      return None
+    return PathFromTree(predecessors, source, target)
+
+  def Invalidate(self, edge):
+    """Drops the trees which take |edge|, after its weight has increased.
+
+    Trees which do not take the edge keep their shortest paths.
+
+    Args:
+      edge: (source_node, target_node, edge_index) of the edge.
+    """
+    for source, (_, predecessors) in list(self._trees.items()):
+      if predecessors.get(edge[1]) == edge:
+        del self._trees[source]
+
+
+def IterEulerianCircuit(graph, initial, virtual_edges, edges=None, end=None):
+  """Yields the edges of an Eulerian circuit as it is found.
+
+  Runs Hierholzer's algorithm backwards, following in-edges from |initial|.
+  Edges leave the stack of the backward walk in the order of a forward circuit,
+  so they are yielded as soon as they are final and the memory is bounded by
+  the size of the graph rather than the length of the circuit.
+
+  The graph itself is not modified: virtual edges are an overlay of paths of
+  real edges, and each vertex keeps a cursor to its next unused in-edge.
+
+  Args:
+    graph: nx MultiDiGraph which is Eulerian once |virtual_edges| are added.
+    initial: Vertex to start and end at.
+    virtual_edges: Dictionary of lists of paths starting at a vertex, where
+        each path is a list of edges (source_node, target_node, edge_index).
+    edges: Optional list of the edges of |graph| to cover, instead of all.
+    end: Optional vertex to end at instead of |initial|. The edges are then
+        Eulerian once an edge from |end| to |initial| is added.
+  Yields:
+    (source_node, target_node, edge_index) of real edges, where each virtual
+    edge is expanded into its path.
+  """
+  in_edges = dict((n, []) for n in graph.nodes())
+  # The closing edge is the first one taken backwards from |initial|, so it is
+  # the last one of the circuit and is left out.
+  closing = [(end, initial, None)]
+  if end is not None:
+    in_edges[initial].append(closing)
+  if edges is None:
+    edges = graph.edges(keys=True)
+  for e in edges:
+    in_edges[e[1]].append([e])
+  for paths in virtual_edges.values():
+    for path in paths:
+      in_edges[path[-1][1]].append(path)
+  cursors = dict.fromkeys(in_edges, 0)
+  # Stack of vertexes along the current trail and the paths which left them.
+  stack = [(initial, None)]
+  while stack:
+    vertex, path = stack[-1]
+    if cursors[vertex] < len(in_edges[vertex]):
+      previous_path = in_edges[vertex][cursors[vertex]]
+      cursors[vertex] += 1
+      stack.append((previous_path[0][0], previous_path))
+    else:
+      stack.pop()
+      if path is not None and path is not closing:
+        for edge in path:
+          yield edge
+
+
+def EulerianCircuit(graph, initial, virtual_edges):
+  """Returns the list of edges yielded by IterEulerianCircuit."""
+  return list(IterEulerianCircuit(graph, initial, virtual_edges))
+
+
+# Default number of vertexes with more in-edges than out-edges above which the
+# circuit is balanced approximately.
+EXACT_LIMIT = 300
+
+
+def _Surplus(edges, start=None):
+  """Returns a collections.Counter of in-degree minus out-degree of |edges|.
+
+  Args:
+    edges: List of edges (source_node, target_node, edge_index).
+    start: Optional vertex an open walk starts from, which counts as entered.
+  """
+  surplus = collections.Counter()
+  for source, target, _ in edges:
+    surplus[target] += 1
+    surplus[source] -= 1
+  if start is not None:
+    surplus[start] += 1
+  return surplus
+
+
+def _Adjacency(graph, reset=None, reverse=False):
+  """Returns lists of (neighbor, edge_index, weight) keyed on nodes.
+
+  Plain lists avoid the overhead of networkx views when searching many times.
+
+  Args:
+    graph: nx MultiDiGraph to examine.
+    reset: Optional 2-tuple (initial vertex, weight) of reset edges.
+    reverse: Whether or not to list the edges into each node instead.
+  """
+  adjacency = dict((n, []) for n in graph.nodes())
+  for source, target, key, weight in graph.edges(keys=True, data='weight'):
+    if reverse:
+      adjacency[target].append((source, key, weight))
+    else:
+      adjacency[source].append((target, key, weight))
+  if reset:
+    for node in graph.nodes():
+      if reverse:
+        adjacency[reset[0]].append((node, RESET, reset[1]))
+      else:
+        adjacency[node].append((reset[0], RESET, reset[1]))
+  return adjacency
+
+
+def _IterNearestNodes(adjacency, sources, predecessors=None):
+  """Yields the nodes reachable from any of |sources|, nearest first.
+
+  Runs Dijkstra's algorithm lazily, so the caller can stop as soon as it has
+  found the nodes it looks for.
+
+  Args:
+    adjacency: Adjacency lists of the graph, as returned by _Adjacency.
+    sources: List of nodes to start from.
+    predecessors: Optional dictionary filled in like the predecessors of
+        ShortestPathTree. On reversed adjacency lists, its edges point
+        backwards.
+  Yields:
+    2-tuples (distance, node).
+  """
+  if predecessors is None:
+    predecessors = {}
+  distances = dict((n, 0) for n in sources)
+  heap = [(0, i, n) for i, n in enumerate(sources)]
+  heapq.heapify(heap)
+  done = set()
+  count = itertools.count(len(heap))  # Tie breaker.
+  while heap:
+    distance, _, node = heapq.heappop(heap)
+    if node in done:
+      continue
+    done.add(node)
+    yield distance, node
+    for target, key, weight in adjacency[node]:
+      if distance + weight < distances.get(target, float('inf')):
+        distances[target] = distance + weight
+        predecessors[target] = (node, target, key)
+        heapq.heappush(heap, (distance + weight, next(count), target))
+
+
+def _ApproximateBalancingPaths(graph, edges, reset=None):
+  """Finds cheap extra paths which make |edges| Eulerian, greedily.
+
+  Works in rounds. Each round searches backwards from all the vertexes which
+  still need in-edges at once, which finds the nearest of them for every vertex
+  with surplus in-edges. Vertexes with surplus then ship along their shortest
+  paths in order of distance, as much as their nearest vertex still needs. No
+  dense cost matrix is built, and each round costs a single search.
+
+  Every surplus unit travels at least to its nearest deficit vertex, and every
+  deficit unit at least from its nearest surplus vertex, so the larger of the
+  two sums is a lower bound on the optimal extra weight.
+
+  Args:
+    graph: nx MultiDiGraph to examine.
+    edges: List of edges (source_node, target_node, edge_index) to balance.
+    reset: Optional 2-tuple (initial vertex, weight) of reset edges.
+  Returns:
+    virtual_edges: Dictionary of lists of paths starting at a vertex.
+    weight: Total weight of the extra paths.
+    lower_bound: Lower bound on the weight of the optimal extra paths.
+  Raises:
+    RuntimeError: if the edges cannot be balanced.
+  """
+  surplus = _Surplus(edges)
+  backward = _Adjacency(graph, reset, reverse=True)
+  lower_bound_in = 0
+  for distance, node in _IterNearestNodes(
+      _Adjacency(graph, reset), [n for n in graph.nodes() if surplus[n] > 0]):
+    if surplus[node] < 0:
+      lower_bound_in -= surplus[node] * distance
+  lower_bound_out = None
+  virtual_edges = collections.defaultdict(list)
+  weight = 0
+  while any(n > 0 for n in surplus.values()):
+    predecessors = {}
+    nearest = [(distance, node) for distance, node in _IterNearestNodes(
+        backward, [n for n in graph.nodes() if surplus[n] < 0], predecessors)
+               if surplus[node] > 0]
+    if lower_bound_out is None:
+      lower_bound_out = sum(surplus[x] * distance for distance, x in nearest)
+    shipped = False
+    for distance, x in nearest:
+      # Backward edges point from a vertex to the next one on its path.
+      path = []
+      node = x
+      while node in predecessors:
+        following, _, key = predecessors[node]
+        path.append((node, following, key))
+        node = following
+      amount = min(surplus[x], -surplus[node])
+      if amount <= 0:
+        continue  # An earlier vertex of this round took the rest.
+      surplus[x] -= amount
+      surplus[node] += amount
+      weight += amount * distance
+      virtual_edges[x].extend([path] * amount)
+      shipped = True
+    if not shipped:
+      raise RuntimeError('Demands cannot be met.')
+  return virtual_edges, weight, max(lower_bound_in, lower_bound_out or 0)
+
+
+def _BalancingPaths(graph, edges, paths, start=None):
+  """Finds the cheapest extra paths which make |edges| Eulerian.
+
+  Args:
+    graph: nx MultiDiGraph to examine.
+    edges: List of edges (source_node, target_node, edge_index) to balance.
+    paths: stl.traverse.ShortestPaths of |graph|.
+    start: Optional vertex an open walk starts from. Any vertex may then have
+        one more in-edge than out-edges, where the walk ends.
+  Returns:
+    virtual_edges: Dictionary of lists of paths starting at a vertex.
+    end: The vertex the open walk ends at, or None without |start|.
+  Raises:
+    RuntimeError: if the edges cannot be balanced.
+  """
+  surplus = _Surplus(edges, start)
+  left = [n for n in graph.nodes() if surplus[n] > 0]
+  right = [n for n in graph.nodes() if surplus[n] < 0]
+  supplies = [surplus[n] for n in left]
+  demands = [-surplus[n] for n in right]
+  costs = np.array([[paths.Distance(x, y) for y in right] for x in left])
+  costs = costs.reshape(len(left), len(right))
+  if start is not None:
+    # The end of the walk is a sink which any vertex reaches for free.
+    costs = np.hstack([costs, np.zeros((len(left), 1))])
+    demands.append(1)
+  flows = MinCostFlow(costs, supplies, demands)
+  virtual_edges = collections.defaultdict(list)
+  for x, y in zip(*np.nonzero(flows[:, :len(right)])):
+    sub_path = paths.Path(left[x], right[y])
+    virtual_edges[left[x]].extend([sub_path] * flows[x, y])
+  end = None
+  if start is not None:
+    end = left[np.flatnonzero(flows[:, -1])[0]]
+  return virtual_edges, end
+
+
+def _ConnectingPaths(edges, virtual_edges, start, paths):
+  """Adds round trips from |start| to the edges it is not connected to.
+
+  Components of the edges and balancing paths which |start| is not connected to
+  are joined by a shortest round trip from |start| to their closest vertex, in
+  order of distance. Round trips keep the edges balanced.
+
+  Args:
+    edges: List of edges (source_node, target_node, edge_index) to cover.
+    virtual_edges: Dictionary of lists of paths starting at a vertex.
+    start: Vertex the walk starts from.
+    paths: stl.traverse.ShortestPaths of the graph.
+  Raises:
+    RuntimeError: if some edges cannot be reached from |start| and back.
+  """
+  parents = {start: start}
+
+  def Find(n):
+    parents.setdefault(n, n)
+    while parents[n] != n:
+      parents[n] = parents[parents[n]]
+      n = parents[n]
+    return n
+
+  def Union(path):
+    for source, target, _ in path:
+      parents[Find(source)] = Find(target)
+
+  Union(edges)
+  Union(itertools.chain(*itertools.chain(*virtual_edges.values())))
+  while True:
+    unconnected = [e[0] for e in edges if Find(e[0]) != Find(start)]
+    if not unconnected:
+      return
+    target = min(unconnected, key=lambda n: paths.Distance(start, n))
+    there = paths.Path(start, target)
+    back = paths.Path(target, start)
+    if there is None or back is None:
+      raise RuntimeError('Edges are not reachable from %s and back.' % start)
+    virtual_edges[start].append(there)
+    virtual_edges[target].append(back)
+    Union(there + back)
+
+
+def _IterNearestEdges(start, edges, paths):
+  """Yields a walk which greedily takes the nearest edge not yet covered."""
+  remaining = set(edges)
+  vertex = start
+  while remaining:
+    distances = paths.Tree(vertex)[0]
+    reachable = [e for e in edges if e in remaining and e[0] in distances]
+    if not reachable:
+      logging.warning('%d edge(s) are not reachable from %s', len(remaining),
+                      vertex)
+      return
+    nearest = min(reachable, key=lambda e: distances[e[0]])
+    for edge in paths.Path(vertex, nearest[0]) + [nearest]:
+      remaining.discard(edge)
+      yield edge
+    vertex = nearest[1]
+
+
+def IterRequiredEdgeCover(graph, start, edges, paths=None):
+  """Yields a short walk from |start| which covers the given edges.
+
+  Like IterMinEdgeCoverCircuit, the edges are balanced with the cheapest extra
+  paths and walked as an Eulerian path, except that the walk may end anywhere.
+  Edges which are not connected to |start| are joined by round trips, and the
+  walk stops at the last edge to cover. If that fails, e.g. because a failed
+  transition cut the graph, the walk greedily takes the nearest edge not yet
+  covered instead.
+
+  Args:
+    graph: nx MultiDiGraph to examine.
+    start: Vertex to start from.
+    edges: List of edges (source_node, target_node, edge_index) to cover.
+        Edges with an infinite weight and edges not reachable from |start| are
+        left out.
+    paths: Optional stl.traverse.ShortestPaths of |graph| to reuse.
+  Yields:
+    (source_node, target_node, edge_index) of the edges of the walk.
+  """
+  if paths is None:
+    paths = ShortestPaths(graph)
+  distances = paths.Tree(start)[0]
+  edges = [e for e in edges
+           if e[0] in distances and graph.edges[e]['weight'] != float('inf')]
+  try:
+    virtual_edges, end = _BalancingPaths(graph, edges, paths, start)
+    _ConnectingPaths(edges, virtual_edges, start, paths)
+  except RuntimeError as e:
+    logging.warning('Covering nearest edges first: %s', e)
+    walk = _IterNearestEdges(start, edges, paths)
+  else:
+    walk = IterEulerianCircuit(graph, start, virtual_edges, edges, end)
+  # Paths after the last edge to cover lead nowhere useful.
+  remaining = set(edges)
+  for edge in walk:
+    if not remaining:
+      return
+    remaining.discard(edge)
+    yield edge
+
+
+def IterMinEdgeCoverCircuit(graph, initial, reset=False, paths=None,
+                            exact_limit=EXACT_LIMIT):
+  """Yields the minimum edge-covering circuit for a graph.
 
   The algorithm requires that the graph is strongly connected (every node can
   by reached by every other node). Begin by finding all nodes where the
   in-degree exceeds the out-degree (call this collection of nodes LEFT) and
   all nodes where the out-degree exceeds the in-degree (call this collection
-  RIGHT). For each node in "left", we want to find N paths exiting that node,
-  where N = in_degree - out_degree for that node. We split this node into N
-  copies in LEFT (and do the same thing for each node in RIGHT). Each copy L in
-  LEFT will eventually paired with a copy R in RIGHT. Each pairing's weight is
-  defined as the minimum path weight from L to R. Thus, we create a bipartite
-  matching which minimizes the total weight of all pairings. Once we have a
-  final matching, we add "virtual" edges to the graph from L to R. The graph is
-  now Eulerian (every node's in_degree == out_degree) and we can simply find an
-  Eulerian circuit. We finish by substituting the virtual edges in the circuit
-  with the actual paths.
+  RIGHT). Each node in LEFT needs N more paths exiting it, where N = in_degree -
+  out_degree for that node, and likewise each node in RIGHT needs more paths
+  entering it. The cost of a path from L to R is the minimum path weight from L
+  to R, found by one shortest path search per node in LEFT. Thus, we solve a
+  min-cost flow problem which ships the surplus of LEFT to RIGHT as cheaply as
+  possible. Once we have a final flow, we add "virtual" edges from L to R for
+  every unit shipped. The graph is now Eulerian (every node's in_degree ==
+  out_degree) and we can simply find an Eulerian circuit, in which the virtual
+  edges are substituted with the actual paths.
+
+  Above |exact_limit| vertexes in LEFT, the flow is approximated greedily
+  instead: each vertex in LEFT ships to the nearest vertex in RIGHT which still
+  needs paths. The extra weight over a lower bound on the optimum is logged.
+
+  If the system under test can be reset, the graph only needs to be reachable
+  from the initial vertex: every node gets a reset edge back to the initial
+  vertex, which the extra paths may take. Reset edges weigh more than any set of
+  extra paths without them, so the circuit is split into the minimum number of
+  walks from the initial vertex.
+
+  The circuit is planned before the first edge is yielded. Edges are then
+  yielded while the Eulerian circuit is walked, so the caller can start running
+  transitions without holding the whole circuit in memory.
+
+  Args:
+    graph: nx MultiGraph to examine.
+    initial: initial vertex label.
+    reset: Whether or not the system under test can be reset.
+    paths: Optional stl.traverse.ShortestPaths of |graph| to reuse. It must
+        have the reset edges if |reset| is set.
+    exact_limit: Maximum number of vertexes in LEFT to balance exactly, or
+        None to always balance exactly.
+  Yields:
+    3-tuples to distinguish edges in the original multi-graph:
+    (source_node, target_node, edge_index). Reset edges are yielded as
+    (source_node, initial, RESET).
+  Raises:
+    RuntimeError: if the graph is not properly formed.
+  """
+  reset_edges = None
+  if reset:
+    if len(nx.descendants(graph, initial)) + 1 < graph.number_of_nodes():
+      raise RuntimeError('Graph is not reachable from the initial vertex.')
+    reset_edges = (initial, ResetWeight(graph))
+  elif not nx.is_strongly_connected(graph):
+    raise RuntimeError('Graph is not strongly connected.')
+  edges = list(graph.edges(keys=True))
+  left = sum(1 for n in _Surplus(edges).values() if n > 0)
+  if exact_limit is not None and left > exact_limit:
+    virtual_edges, weight, lower_bound = _ApproximateBalancingPaths(
+        graph, edges, reset_edges)
+    total = sum(w for _, _, w in graph.edges(data='weight'))
+    logging.info(
+        'Balanced %d vertexes approximately: %s extra weight, at most %s '
+        '(%.1f%%) over the optimal circuit', left, weight,
+        weight - lower_bound,
+        100.0 * (weight - lower_bound) / (total + lower_bound))
+  else:
+    if paths is None:
+      paths = ShortestPaths(graph, reset_edges)
+    virtual_edges, _ = _BalancingPaths(graph, edges, paths)
+  if reset:
+    resets = sum(e[2] == RESET for e in itertools.chain(
+        *itertools.chain(*virtual_edges.values())))
+    logging.info('Covering the graph with %d reset(s)', resets)
+  for edge in IterEulerianCircuit(graph, initial, virtual_edges):
+    yield edge
+
+
+def MinEdgeCoverCircuit(graph, initial, reset=False, exact_limit=EXACT_LIMIT):
+  """Calculates the minimum edge-covering circuit for a graph.
 
   Args:
     graph: nx MultiGraph to examine.
     initial: initial vertex label.
+    reset: Whether or not the system under test can be reset.
+    exact_limit: Maximum number of imbalanced vertexes to balance exactly, or
+        None to always balance exactly.
   Returns:
     A list containing 3-tuples to distinguish edges in the original multi-graph:
     (source_node, target_node, edge_index)
   Raises:
     RuntimeError: if the graph is not properly formed.
   """
-  if not nx.is_strongly_connected(graph):
-    raise RuntimeError('Graph is not strongly connected.')
-  left = [(n, x)
-          for n in graph.nodes()
-          for x in range(graph.in_degree(n) - graph.out_degree(n))]
-  right = [(n, x)
-           for n in graph.nodes()
-           for x in range(graph.out_degree(n) - graph.in_degree(n))]
-  b = nx.Graph()
-  b.add_nodes_from(left, bipartite=0)
-  b.add_nodes_from(right, bipartite=1)
-
-  path_weights = nx.floyd_warshall(graph)
-  edges = [(x, y, -path_weights[x[0]][y[0]]) for x in left for y in right]
-  b.add_weighted_edges_from(edges)
-  matches = Context().MaxBipartiteMatching(b)
-  copy = graph.copy()
-  for k, v in matches.items():
-    sub_path = nx.shortest_path(
-        graph, source=k[0], target=v[0], weight='weight')
-    copy.add_edge(k[0], v[0], sub_path=sub_path)
-  euler_circuit = list(nx.eulerian_circuit(copy, source=initial))
-
-  for edge in copy.edges(data=True):
-    edge[2]['visited'] = False
-
-  expanded_circuit = []
-
-  for circuit_edge in euler_circuit:
-    s = circuit_edge[0]
-    t = circuit_edge[1]
-    # Find the first non-visited edge between s and t
-    edge_index = 0
-    for edge_index, edge in copy[s][t].items():
-      if not edge['visited']:
+  return list(
+      IterMinEdgeCoverCircuit(graph, initial, reset, exact_limit=exact_limit))
+
+
+def _WalkWeight(graph, walk, paths):
+  """Returns the total weight of |walk|, counting reset edges of |paths|."""
+  return sum(paths.reset[1] if e[2] == RESET else graph.edges[e]['weight']
+             for e in walk)
+
+
+def RepairCircuit(graph, initial, circuit, reset=False, paths=None,
+                  extra_cost=0.1, exact_limit=EXACT_LIMIT):
+  """Repairs an edge-covering circuit after a few edges of |graph| changed.
+
+  Edges keep their keys when e.g. stl.graph.UpdateTransitionGraph() updates
+  the graph in place, so the change is the edges of |circuit| which are not in
+  |graph| anymore and the edges of |graph| which |circuit| does not run. The
+  repaired circuit runs the edges of |circuit| which are still in |graph| as
+  often as before, which keeps the extra paths that balanced the parts of the
+  graph the change did not touch, and runs each new edge once. Extra runs of
+  an edge, or reset edges, at a vertex of a changed edge may have balanced it,
+  so they are dropped. Only the vertexes left unbalanced then get extra paths,
+  found like in IterMinEdgeCoverCircuit.
+
+  If the extra paths weigh more than |extra_cost| times the edges kept and
+  added, the circuit is planned again from scratch, reusing |paths|.
+
+  Args:
+    graph: nx MultiDiGraph after the change.
+    initial: Initial vertex of |graph|.
+    circuit: List of edges (source_node, target_node, edge_index) of the
+        circuit before the change, e.g. of MinEdgeCoverCircuit.
+    reset: Whether or not the system under test can be reset.
+    paths: Optional stl.traverse.ShortestPaths of |graph| after the change. It
+        must have the reset edges if |reset| is set.
+    extra_cost: Fraction of the weight of the repaired edges the extra paths
+        may add.
+    exact_limit: |exact_limit| of IterMinEdgeCoverCircuit.
+  Returns:
+    List of edges of a circuit covering |graph|, like MinEdgeCoverCircuit.
+  Raises:
+    RuntimeError: if the graph is not properly formed.
+  """
+  if paths is None:
+    reset_edges = (initial, ResetWeight(graph)) if reset else None
+    paths = ShortestPaths(graph, reset_edges)
+
+  def InGraph(e):
+    if e[2] == RESET:
+      return reset and e[0] in graph
+    return graph.has_edge(*e)
+
+  removed = set(e for e in circuit if not InGraph(e))
+  previous = set(circuit)
+  added = [e for e in graph.edges(keys=True) if e not in previous]
+  touched = set()
+  for e in itertools.chain(removed, added):
+    touched.update(e[:2])
+  edges = []
+  dropped = 0
+  run = set()
+  for e in circuit:
+    if e in removed:
+      continue
+    if (e in run or e[2] == RESET) and (e[0] in touched or e[1] in touched):
+      dropped += 1
+      continue
+    edges.append(e)
+    run.add(e)
+  edges.extend(added)
+  try:
+    virtual_edges, _ = _BalancingPaths(graph, edges, paths)
+    _ConnectingPaths(edges, virtual_edges, initial, paths)
+  except RuntimeError as e:
+    logging.info('Planning the circuit again: %s', e)
+    return list(
+        IterMinEdgeCoverCircuit(graph, initial, reset, paths, exact_limit))
+  extra = _WalkWeight(graph, itertools.chain(
+      *itertools.chain(*virtual_edges.values())), paths)
+  weight = _WalkWeight(graph, edges, paths)
+  if extra > extra_cost * weight:
+    logging.info('Planning the circuit again: repairing it adds %s to %s',
+                 extra, weight)
+    return list(
+        IterMinEdgeCoverCircuit(graph, initial, reset, paths, exact_limit))
+  logging.info('Repaired the circuit: %d edge(s) removed, %d added, %d extra '
+               'run(s) dropped, %s extra weight', len(removed), len(added),
+               dropped, extra)
+  return list(IterEulerianCircuit(graph, initial, virtual_edges, edges))
+
+
+def _Covering(walk, edges):
+  """Returns the prefix of |walk| which ends at the last edge of |edges|."""
+  remaining = set(edges)
+  for i, edge in enumerate(walk):
+    remaining.discard(edge)
+    if not remaining:
+      return walk[:i + 1]
+  return walk
+
+
+def RiskFirstWalk(graph, initial, reset=False, paths=None, extra_cost=0,
+                  exact_limit=EXACT_LIMIT, limit=10):
+  """Returns a walk covering every edge which runs likely failures early.
+
+  Edges weigh their risk as their 'failure_rate' attribute, e.g. from
+  stl.history.History. The walk first goes to the riskiest edges in order of
+  risk along shortest paths, and then covers the remaining edges with
+  IterRequiredEdgeCover. Fewer of the riskiest edges are taken first until the
+  walk weighs at most |extra_cost| times more than the edge-covering circuit,
+  truncated at its last new edge. Otherwise the circuit is returned.
+
+  Args:
+    graph: nx MultiDiGraph to examine.
+    initial: Vertex to start from.
+    reset: Whether or not the system under test can be reset.
+    paths: Optional stl.traverse.ShortestPaths of |graph| to reuse. It must
+        have the reset edges if |reset| is set.
+    extra_cost: Fraction of the weight of the circuit the walk may add to run
+        risky edges earlier.
+    exact_limit: |exact_limit| of IterMinEdgeCoverCircuit.
+    limit: Maximum number of risky edges to run first.
+  Returns:
+    List of edges (source_node, target_node, edge_index), like those of
+    IterMinEdgeCoverCircuit.
+  """
+  if paths is None:
+    reset_edges = (initial, ResetWeight(graph)) if reset else None
+    paths = ShortestPaths(graph, reset_edges)
+  edges = list(graph.edges(keys=True))
+  circuit = _Covering(
+      list(IterMinEdgeCoverCircuit(graph, initial, reset, paths, exact_limit)),
+      edges)
+  bound = _WalkWeight(graph, circuit, paths) * (1 + extra_cost)
+  risky = sorted(
+      [e for e in edges if graph.edges[e].get('failure_rate')],
+      key=lambda e: -graph.edges[e]['failure_rate'])[:limit]
+  for k in range(len(risky), 0, -1):
+    walk = []
+    vertex = initial
+    for edge in risky[:k]:
+      if edge in walk:
+        continue  # Already on the way to a riskier edge.
+      path = paths.Path(vertex, edge[0])
+      if path is None:
+        break
+      walk.extend(path + [edge])
+      vertex = edge[1]
+    else:
+      covered = set(walk)
+      walk.extend(IterRequiredEdgeCover(
+          graph, vertex, [e for e in edges if e not in covered], paths))
+      if (set(edges) <= set(walk) and
+          _WalkWeight(graph, walk, paths) <= bound):
+        logging.info('Running %d risky edge(s) first', k)
+        return walk
+  return circuit
+
+
+def SplitCircuit(circuit, initial, k, paths):
+  """Splits a circuit into at most |k| walks which start at |initial|.
+
+  Solves the k-Chinese-postman problem approximately, like Frederickson's
+  tour splitting: each walk takes the shortest path from |initial| to the start
+  of a consecutive segment of the circuit, then runs the segment. A binary
+  search finds the smallest bound on the weight of a walk, e.g. its expected
+  run time with a history, for which cutting segments greedily gives at most
+  |k| walks.
+
+  Args:
+    circuit: List of edges (source_node, target_node, edge_index) of a circuit
+        from |initial|, e.g. of MinEdgeCoverCircuit.
+    initial: Vertex every walk starts from.
+    k: Maximum number of walks.
+    paths: stl.traverse.ShortestPaths of the graph.
+  Returns:
+    List of walks, each a list of edges. Together they cover every edge of
+    |circuit| except reset edges between segments.
+  """
+  weights = [_WalkWeight(paths.graph, [e], paths) for e in circuit]
+  # Weight of the path from |initial| to the start of each edge.
+  prefixes = {}
+  for edge in circuit:
+    if edge[0] not in prefixes:
+      prefixes[edge[0]] = paths.Distance(initial, edge[0])
+  starts = [prefixes[e[0]] if e[2] != RESET else 0 for e in circuit]
+
+  def Segments(bound):
+    segments = []
+    i = 0
+    while i < len(circuit):
+      # Leading reset edges are dropped from a walk.
+      j = i
+      while j < len(circuit) and circuit[j][2] == RESET:
+        j += 1
+      if j == len(circuit):
+        if segments:
+          segments[-1] = (segments[-1][0], j)
+        else:
+          segments.append((i, j))
         break
-    edge['visited'] = True
-    if 'sub_path' in edge:
-      # This particular edge is a pseudo-edge between s and t
-      # The path between s and t is a list of 2-tuples
-      path = edge['sub_path']
-      last = path[0]
-      for node in path[1:]:
-        # Find the smallest weight edge from 'last' to 'node'
-        best_index = 0
-        min_weight = float('inf')
-        for k, v in graph[last][node].items():
-          if v['weight'] < min_weight:
-            min_weight = v['weight']
-            best_index = k
-        expanded_circuit.append((last, node, best_index))
-        last = node
+      weight = starts[j] + weights[j]
+      if weight > bound:
+        return None
+      j += 1
+      while j < len(circuit) and weight + weights[j] <= bound:
+        weight += weights[j]
+        j += 1
+      segments.append((i, j))
+      i = j
+    return segments
+
+  low, high = 0.0, float(sum(weights))
+  while high - low > 1e-9 * max(1.0, high):
+    bound = (low + high) / 2
+    segments = Segments(bound)
+    if segments is not None and len(segments) <= k:
+      high = bound
     else:
-      expanded_circuit.append((s, t, edge_index))
+      low = bound
+
+  walks = []
+  for i, j in Segments(high):
+    segment = circuit[i:j]
+    # A new walk starts with a fresh system under test, and ends anywhere.
+    while segment and segment[0][2] == RESET:
+      segment.pop(0)
+    while segment and segment[-1][2] == RESET:
+      segment.pop()
+    if segment:
+      walks.append(paths.Path(initial, segment[0][0]) + segment)
+  return walks
+
+
+def IterSnapshotCover(graph, start, edges, restore_weight, snapshots,
+                      paths=None):
+  """Yields a walk from |start| which covers the given edges using snapshots.
+
+  Instead of walking back to a vertex which still has edges to cover, the walk
+  may restore a snapshot of a vertex and walk from there, whenever that is
+  cheaper. The walk is a tree of sequences from |start| which share prefixes:
+  a snapshot is taken at each branch vertex, i.e. before leaving a vertex with
+  more than one out-edge to cover, and at |start| if there is none yet.
+
+  The edges are covered greedily: out-edges of the current vertex first, and
+  then the cheapest way to a vertex with edges to cover, either walking or
+  restoring a snapshot.
+
+  Args:
+    graph: nx MultiDiGraph to examine.
+    start: Vertex to start from.
+    edges: List of edges (source_node, target_node, edge_index) to cover.
+        Edges with an infinite weight are left out.
+    restore_weight: Function returning the weight of a restore, which may
+        change as restores are measured.
+    snapshots: Set of vertexes with a snapshot. Vertexes are added to it as
+        snapshots are taken.
+    paths: Optional stl.traverse.ShortestPaths of |graph| to reuse.
+  Yields:
+    (source_node, target_node, edge_index) of the edges of the walk. Snapshots
+    are yielded as (node, node, SNAPSHOT), and restores as (source_node,
+    snapshot_node, RESTORE).
+  """
+  if paths is None:
+    paths = ShortestPaths(graph)
+  remaining = set(
+      e for e in edges if graph.edges[e]['weight'] != float('inf'))
+  vertex = start
+  if not snapshots:
+    snapshots.add(start)
+    yield (start, start, SNAPSHOT)
+  while remaining:
+    out_edges = [e for e in graph.out_edges(vertex, keys=True)
+                 if e in remaining]
+    if out_edges:
+      if len(out_edges) > 1 and vertex not in snapshots:
+        snapshots.add(vertex)
+        yield (vertex, vertex, SNAPSHOT)
+      edge = min(out_edges, key=lambda e: graph.edges[e]['weight'])
+      remaining.discard(edge)
+      yield edge
+      vertex = edge[1]
+      continue
 
-  return expanded_circuit
+    # Otherwise go to the closest vertex with edges to cover, from here or
+    # from a snapshot.
+    sources = collections.OrderedDict(
+        (e[0], True) for e in graph.edges(keys=True) if e in remaining)
+    best = None
+    for origin in [vertex] + sorted(snapshots - set([vertex]), key=str):
+      cost = 0 if origin == vertex else restore_weight()
+      distances = paths.Tree(origin)[0]
+      for node in sources:
+        if node in distances and (best is None or
+                                  cost + distances[node] < best[0]):
+          best = (cost + distances[node], origin, node)
+    if best is None:
+      logging.warning('%d edge(s) are not reachable from %s', len(remaining),
+                      vertex)
+      return
+    _, origin, target = best
+    if origin != vertex:
+      yield (vertex, origin, RESTORE)
+    for edge in paths.Path(origin, target):
+      remaining.discard(edge)
+      yield edge
+    vertex = target
@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for stl.traverse."""
+# pylint: disable=invalid-name
+
+import collections
+import itertools
+import random
+import unittest
+
+import networkx as nx
+import numpy as np
+
+import stl.traverse
+
+
+class TraverseTest(unittest.TestCase):
+
+  def _BruteForceMatching(self, weights):
+    n, m = weights.shape
+    return max(
+        sum(weights[x, y] for x, y in enumerate(columns))
+        for columns in itertools.permutations(range(m), n))
+
+  def _AssertCircuit(self, graph, initial, circuit):
+    self.assertEqual(initial, circuit[0][0])
+    self.assertEqual(initial, circuit[-1][1])
+    for (_, t, _), (s, _, _) in zip(circuit, circuit[1:]):
+      self.assertEqual(t, s)
+    for s, t, k in circuit:
+      self.assertIn(k, graph[s][t])
+    self.assertEqual(set(graph.edges(keys=True)), set(circuit))
+
+  def testMaxWeightMatching(self):
+    rand = np.random.RandomState(0)
+    for n, m in [(1, 1), (3, 3), (4, 6), (6, 6)]:
+      for _ in range(10):
+        weights = -rand.randint(0, 10, size=(n, m)).astype(float)
+        matches = stl.traverse.Context().MaxWeightMatching(weights)
+        self.assertEqual(n, len(set(matches)))
+        self.assertEqual(self._BruteForceMatching(weights),
+                         weights[np.arange(n), matches].sum())
+
+  def testMinCostFlow(self):
+    rand = np.random.RandomState(0)
+    for n, m in [(1, 1), (2, 3), (4, 2), (3, 3)]:
+      for _ in range(10):
+        costs = rand.randint(0, 10, size=(n, m)).astype(float)
+        supplies = 1 + rand.multinomial(7 - n, [1.0 / n] * n)
+        demands = 1 + rand.multinomial(7 - m, [1.0 / m] * m)
+        flows = stl.traverse.MinCostFlow(costs, supplies, demands)
+        self.assertEqual(supplies.tolist(), flows.sum(axis=1).tolist())
+        self.assertEqual(demands.tolist(), flows.sum(axis=0).tolist())
+        # Same as matching one copy of a source to one copy of a sink per unit.
+        left = np.repeat(np.arange(n), supplies)
+        right = np.repeat(np.arange(m), demands)
+        self.assertEqual(-self._BruteForceMatching(-costs[left][:, right]),
+                         (flows * costs).sum())
+
+  def testMaxBipartiteMatching(self):
+    b = nx.Graph()
+    b.add_nodes_from(['a', 'b'], bipartite=0)
+    b.add_nodes_from(['c', 'd'], bipartite=1)
+    b.add_weighted_edges_from([('a', 'c', -1), ('a', 'd', -5), ('b', 'c', -2),
+                               ('b', 'd', -9)])
+    self.assertEqual({'a': 'd', 'b': 'c'},
+                     stl.traverse.Context().MaxBipartiteMatching(b))
+
+  def testMinEdgeCoverCircuit(self):
+    rand = random.Random(0)
+    for _ in range(10):
+      graph = nx.MultiDiGraph()
+      nodes = ['s%d' % i for i in range(8)]
+      # A cycle through all nodes keeps the graph strongly connected.
+      for s, t in zip(nodes, nodes[1:] + nodes[:1]):
+        graph.add_edge(s, t, weight=1)
+      for _ in range(12):
+        graph.add_edge(rand.choice(nodes), rand.choice(nodes), weight=1)
+      circuit = stl.traverse.MinEdgeCoverCircuit(graph, 's0')
+      self._AssertCircuit(graph, 's0', circuit)
+      # Every extra edge balances in- and out-degree along a shortest path.
+      path_weights = nx.floyd_warshall(graph)
+      left = [n for n in graph for _ in range(graph.in_degree(n) -
+                                               graph.out_degree(n))]
+      right = [n for n in graph for _ in range(graph.out_degree(n) -
+                                                graph.in_degree(n))]
+      weights = -np.array([[path_weights[x][y] for y in right] for x in left])
+      self.assertEqual(
+          graph.number_of_edges() - self._BruteForceMatching(weights),
+          len(circuit))
+
+  def testMinEdgeCoverCircuitApproximate(self):
+    rand = random.Random(0)
+    for _ in range(10):
+      graph = nx.MultiDiGraph()
+      nodes = ['s%d' % i for i in range(20)]
+      for s, t in zip(nodes, nodes[1:] + nodes[:1]):
+        graph.add_edge(s, t, weight=1)
+      for _ in range(40):
+        graph.add_edge(rand.choice(nodes), rand.choice(nodes), weight=1)
+      exact = stl.traverse.MinEdgeCoverCircuit(graph, 's0', exact_limit=None)
+      circuit = stl.traverse.MinEdgeCoverCircuit(graph, 's0', exact_limit=0)
+      self._AssertCircuit(graph, 's0', circuit)
+      _, weight, lower_bound = stl.traverse._ApproximateBalancingPaths(
+          graph, list(graph.edges(keys=True)))
+      self.assertEqual(graph.number_of_edges() + weight, len(circuit))
+      self.assertLessEqual(lower_bound, len(exact) - graph.number_of_edges())
+      self.assertLessEqual(len(exact), len(circuit))
+
+  def testMinEdgeCoverCircuitApproximateWithReset(self):
+    graph = nx.MultiDiGraph()
+    graph.add_edge('s0', 's1', weight=1)
+    graph.add_edge('s1', 's2', weight=1)
+    graph.add_edge('s0', 's2', weight=1)
+    graph.add_edge('s2', 's2', weight=1)
+    circuit = stl.traverse.MinEdgeCoverCircuit(graph, 's0', reset=True,
+                                               exact_limit=0)
+    resets = [e for e in circuit if e[2] == stl.traverse.RESET]
+    self.assertEqual([('s2', 's0', stl.traverse.RESET)] * 2, resets)
+    self.assertEqual(set(graph.edges(keys=True)),
+                     set(circuit) - set(resets))
+
+  def testShortestPathTree(self):
+    graph = nx.MultiDiGraph()
+    graph.add_edge('s0', 's1', weight=1)
+    graph.add_edge('s1', 's2', weight=1)
+    graph.add_edge('s0', 's2', weight=1)
+    distances, predecessors = stl.traverse.ShortestPathTree(graph, 's0')
+    self.assertEqual({'s0': 0, 's1': 1, 's2': 1}, distances)
+    self.assertEqual([('s0', 's2', 0)],
+                     stl.traverse.PathFromTree(predecessors, 's0', 's2'))
+
+    # A failed transition is avoided once its weight is infinite.
+    graph['s0']['s2'][0]['weight'] = float('inf')
+    graph.add_edge('s0', 's2', weight=3)
+    distances, predecessors = stl.traverse.ShortestPathTree(graph, 's0')
+    self.assertEqual({'s0': 0, 's1': 1, 's2': 2}, distances)
+    self.assertEqual([('s0', 's1', 0), ('s1', 's2', 0)],
+                     stl.traverse.PathFromTree(predecessors, 's0', 's2'))
+
+  def testEulerianCircuit(self):
+    graph = nx.MultiDiGraph()
+    graph.add_edge('s0', 's1', weight=1)
+    graph.add_edge('s0', 's1', weight=1)
+    graph.add_edge('s1', 's0', weight=1)
+    virtual_edges = {'s1': [[('s1', 's0', 0)]]}
+    circuit = stl.traverse.EulerianCircuit(graph, 's0', virtual_edges)
+    self._AssertCircuit(graph, 's0', circuit)
+    self.assertEqual(4, len(circuit))
+    self.assertEqual(2, circuit.count(('s1', 's0', 0)))
+    edges = stl.traverse.IterEulerianCircuit(graph, 's0', virtual_edges)
+    self.assertEqual('s0', next(edges)[0])
+    # The graph is left untouched.
+    self.assertEqual(3, graph.number_of_edges())
+
+  def testMinEdgeCoverCircuitWithReset(self):
+    graph = nx.MultiDiGraph()
+    graph.add_edge('s0', 's1', weight=1)
+    graph.add_edge('s1', 's2', weight=1)
+    graph.add_edge('s0', 's2', weight=1)
+    graph.add_edge('s2', 's2', weight=1)
+    circuit = stl.traverse.MinEdgeCoverCircuit(graph, 's0', reset=True)
+    resets = [e for e in circuit if e[2] == stl.traverse.RESET]
+    self.assertEqual([('s2', 's0', stl.traverse.RESET)] * 2, resets)
+    self.assertEqual(set(graph.edges(keys=True)),
+                     set(circuit) - set(resets))
+    for (_, t, _), (s, _, _) in zip(circuit, circuit[1:]):
+      self.assertEqual(t, s)
+
+    # Resets are never needed in a strongly connected graph.
+    graph.add_edge('s2', 's0', weight=1)
+    circuit = stl.traverse.MinEdgeCoverCircuit(graph, 's0', reset=True)
+    self._AssertCircuit(graph, 's0', circuit)
+
+  def testMinEdgeCoverCircuitNotReachable(self):
+    graph = nx.MultiDiGraph()
+    graph.add_edge('s0', 's1', weight=1)
+    graph.add_edge('s2', 's1', weight=1)
+    with self.assertRaises(RuntimeError):
+      stl.traverse.MinEdgeCoverCircuit(graph, 's0', reset=True)
+
+  def _AssertWalk(self, start, walk):
+    self.assertEqual(start, walk[0][0])
+    for (_, t, _), (s, _, _) in zip(walk, walk[1:]):
+      self.assertEqual(t, s)
+
+  def testRequiredEdgeCover(self):
+    graph = nx.MultiDiGraph()
+    nodes = ['s%d' % i for i in range(6)]
+    for s, t in zip(nodes, nodes[1:] + nodes[:1]):
+      graph.add_edge(s, t, weight=1)
+    graph.add_edge('s3', 's1', weight=1)
+    # The walk may end anywhere, so it needs no extra edges.
+    required = [('s2', 's3', 0), ('s3', 's4', 0)]
+    walk = list(stl.traverse.IterRequiredEdgeCover(graph, 's2', required))
+    self.assertEqual(required, walk)
+
+    # Required edges which are not connected are reached by shortest paths.
+    required = [('s0', 's1', 0), ('s4', 's5', 0)]
+    walk = list(stl.traverse.IterRequiredEdgeCover(graph, 's2', required))
+    self._AssertWalk('s2', walk)
+    self.assertTrue(set(required) <= set(walk))
+    self.assertEqual(5, len(walk))
+
+    # Round trips to disconnected edges do not come back.
+    graph = nx.MultiDiGraph()
+    for s, t in [('s0', 's1'), ('s1', 's0'), ('s1', 's2'), ('s2', 's1')]:
+      graph.add_edge(s, t, weight=1)
+    required = [('s1', 's2', 0), ('s2', 's1', 0)]
+    walk = list(stl.traverse.IterRequiredEdgeCover(graph, 's0', required))
+    self.assertEqual([('s0', 's1', 0)] + required, walk)
+
+  def testRequiredEdgeCoverSkipsFailedEdges(self):
+    graph = nx.MultiDiGraph()
+    graph.add_edge('s0', 's1', weight=1)
+    graph.add_edge('s1', 's0', weight=float('inf'))
+    graph.add_edge('s1', 's2', weight=1)
+    graph.add_edge('s2', 's1', weight=1)
+    required = list(graph.edges(keys=True))
+    walk = list(stl.traverse.IterRequiredEdgeCover(graph, 's1', required))
+    self._AssertWalk('s1', walk)
+    self.assertEqual([('s1', 's2', 0), ('s2', 's1', 0)], walk)
+
+  def testRequiredEdgeCoverNearestEdges(self):
+    graph = nx.MultiDiGraph()
+    graph.add_edge('s0', 's1', weight=1)
+    graph.add_edge('s0', 's2', weight=1)
+    graph.add_edge('s1', 's3', weight=1)
+    graph.add_edge('s2', 's4', weight=1)
+    # Both branches cannot be covered, so the nearest edges are taken first.
+    required = [('s1', 's3', 0), ('s2', 's4', 0)]
+    walk = list(stl.traverse.IterRequiredEdgeCover(graph, 's0', required))
+    self.assertEqual([('s0', 's1', 0), ('s1', 's3', 0)], walk)
+
+  def testShortestPathsInvalidate(self):
+    graph = nx.MultiDiGraph()
+    graph.add_edge('s0', 's1', weight=1)
+    graph.add_edge('s1', 's2', weight=1)
+    graph.add_edge('s0', 's2', weight=1)
+    paths = stl.traverse.ShortestPaths(graph)
+    self.assertEqual(1, paths.Distance('s0', 's2'))
+    self.assertEqual(1, paths.Distance('s1', 's2'))
+    graph['s0']['s2'][0]['weight'] = float('inf')
+    paths.Invalidate(('s0', 's2', 0))
+    self.assertEqual(2, paths.Distance('s0', 's2'))
+    self.assertEqual([('s0', 's1', 0), ('s1', 's2', 0)],
+                     paths.Path('s0', 's2'))
+
+  def testMinEdgeCoverCircuitNotStronglyConnected(self):
+    graph = nx.MultiDiGraph()
+    graph.add_edge('s0', 's1', weight=1)
+    with self.assertRaises(RuntimeError):
+      stl.traverse.MinEdgeCoverCircuit(graph, 's0')
+
+  def testSnapshotCover(self):
+    # Both branches from s1 lead back to s0 through three edges.
+    graph = nx.MultiDiGraph()
+    for s, t in [('s0', 's1'), ('s1', 's2'), ('s2', 's3'), ('s3', 's0'),
+                 ('s1', 's4'), ('s4', 's5'), ('s5', 's0')]:
+      graph.add_edge(s, t, weight=1)
+    edges = list(graph.edges(keys=True))
+    snapshots = set()
+    walk = list(stl.traverse.IterSnapshotCover(graph, 's0', edges,
+                                               lambda: 0.5, snapshots))
+    self.assertEqual(set(['s0', 's1']), snapshots)
+    self.assertEqual([('s0', 's0', stl.traverse.SNAPSHOT), ('s0', 's1', 0),
+                      ('s1', 's1', stl.traverse.SNAPSHOT), ('s1', 's2', 0),
+                      ('s2', 's3', 0), ('s3', 's0', 0),
+                      ('s0', 's1', stl.traverse.RESTORE), ('s1', 's4', 0),
+                      ('s4', 's5', 0), ('s5', 's0', 0)], walk)
+
+    # Walking back is cheaper than a slow restore.
+    walk = list(stl.traverse.IterSnapshotCover(graph, 's0', edges,
+                                               lambda: 2, set()))
+    self.assertNotIn(stl.traverse.RESTORE, [e[2] for e in walk])
+    self.assertEqual(set(edges), set(walk) - set(
+        e for e in walk if e[2] == stl.traverse.SNAPSHOT))
+
+  def testRepairCircuit(self):
+    graph = nx.MultiDiGraph()
+    for s, t in [('s0', 's1'), ('s1', 's2'), ('s2', 's0'), ('s0', 's2')]:
+      graph.add_edge(s, t, weight=1)
+    circuit = stl.traverse.MinEdgeCoverCircuit(graph, 's0')
+    self.assertEqual(5, len(circuit))
+
+    # One extra path s0 -> s1 balances the new edge.
+    graph.add_edge('s1', 's0', weight=1)
+    repaired = stl.traverse.RepairCircuit(graph, 's0', circuit, extra_cost=0.5)
+    self._AssertCircuit(graph, 's0', repaired)
+    self.assertEqual(len(stl.traverse.MinEdgeCoverCircuit(graph, 's0')),
+                     len(repaired))
+
+    # Without the chord, s2 -> s0 which the circuit ran twice is kept once,
+    # so the repaired circuit is the minimum one.
+    graph.remove_edge('s0', 's2', 0)
+    graph.remove_edge('s1', 's0', 0)
+    for extra_cost in (0, 1):
+      repaired = stl.traverse.RepairCircuit(graph, 's0', circuit,
+                                            extra_cost=extra_cost)
+      self._AssertCircuit(graph, 's0', repaired)
+      self.assertEqual(3, len(repaired))
+
+  def testRepairCircuitKeepsUntouchedParts(self):
+    graph = nx.MultiDiGraph()
+    for s, t in [('s0', 'a1'), ('a1', 'a2'), ('a2', 's0'), ('s0', 'b1'),
+                 ('b1', 'b2'), ('b2', 's0')]:
+      graph.add_edge(s, t, weight=1)
+    # A circuit which runs the a loop twice, e.g. planned before a chord of
+    # the a loop was removed.
+    loop = [('s0', 'a1', 0), ('a1', 'a2', 0), ('a2', 's0', 0)]
+    circuit = loop + loop + [('s0', 'b1', 0), ('b1', 'b2', 0), ('b2', 's0', 0)]
+
+    # Only the b loop needs an extra path, for the new edge b2 -> b1.
+    graph.add_edge('b2', 'b1', weight=1)
+    repaired = stl.traverse.RepairCircuit(graph, 's0', circuit, extra_cost=1)
+    self._AssertCircuit(graph, 's0', repaired)
+    self.assertEqual(
+        collections.Counter(circuit + [('b2', 'b1', 0), ('b1', 'b2', 0)]),
+        collections.Counter(repaired))
+
+    # The extra path weighs more than it may add, so the circuit is planned
+    # again, without the second run of the a loop.
+    graph.edges['b1', 'b2', 0]['weight'] = 10
+    with self.assertLogs(level='INFO') as logs:
+      repaired = stl.traverse.RepairCircuit(graph, 's0', circuit,
+                                            extra_cost=0.5)
+    self.assertIn('Planning the circuit again', logs.output[0])
+    self.assertEqual(stl.traverse.MinEdgeCoverCircuit(graph, 's0'), repaired)
+    self.assertEqual(8, len(repaired))
+    with self.assertLogs(level='INFO') as logs:
+      repaired = stl.traverse.RepairCircuit(graph, 's0', circuit, extra_cost=1)
+    self.assertIn('Repaired the circuit', logs.output[0])
+    self.assertEqual(11, len(repaired))
+
+  def testSplitCircuit(self):
+    graph = nx.MultiDiGraph()
+    for s, t, weight in [('s0', 's1', 1), ('s1', 's0', 1), ('s0', 's2', 1),
+                         ('s2', 's0', 1), ('s0', 's3', 10), ('s3', 's0', 10)]:
+      graph.add_edge(s, t, weight=weight)
+    circuit = [('s0', 's3', 0), ('s3', 's0', 0), ('s0', 's1', 0),
+               ('s1', 's0', 0), ('s0', 's2', 0), ('s2', 's0', 0)]
+    paths = stl.traverse.ShortestPaths(graph)
+    walks = stl.traverse.SplitCircuit(circuit, 's0', 2, paths)
+    self.assertEqual(2, len(walks))
+    self.assertEqual(set(circuit), set(itertools.chain(*walks)))
+    # Walks are balanced by weight: four edges and two would take 22.
+    self.assertEqual(20, max(
+        sum(graph.edges[e]['weight'] for e in walk) for walk in walks))
+    self.assertEqual([circuit], stl.traverse.SplitCircuit(circuit, 's0', 1,
+                                                          paths))
+
+  def testRiskFirstWalk(self):
+    graph = nx.MultiDiGraph()
+    for s, t in [('s0', 's1'), ('s1', 's2'), ('s2', 's0'), ('s1', 's0'),
+                 ('s2', 's1')]:
+      graph.add_edge(s, t, weight=1)
+    graph.edges['s1', 's0', 0]['failure_rate'] = 0.5
+    walk = stl.traverse.RiskFirstWalk(graph, 's0', extra_cost=1)
+    self.assertEqual([('s0', 's1', 0), ('s1', 's0', 0)], walk[:2])
+    self.assertTrue(set(graph.edges(keys=True)) <= set(walk))
+    for (_, t, _), (s, _, _) in zip(walk, walk[1:]):
+      self.assertEqual(t, s)
+
+    circuit = stl.traverse.MinEdgeCoverCircuit(graph, 's0')
+    walk = stl.traverse.RiskFirstWalk(graph, 's0')
+    self.assertLessEqual(len(walk), len(circuit))
+
+
+if __name__ == '__main__':
+  unittest.main()
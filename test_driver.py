@@ -20,21 +20,41 @@ To run:
 
 import argparse
 import ast
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import importlib
 import itertools
+import json
 import logging
+import multiprocessing
 import os
+import re
 import sys
+import time
 
 import networkx as nx
 
+import stl.base
 import stl.graph
+import stl.history
+import stl.ledger
 import stl.levenshtein
+import stl.lib
 import stl.parser
+import stl.strategy
+import stl.symmetry
 import stl.traverse
 
 
-def ParseArgs():
-  """Returns the parsed command line args."""
+def ParseArgs(argv=None):
+  """Returns the parsed command line args.
+
+  Args:
+    argv: List of args to parse. Defaults to sys.argv.
+  """
   parser = argparse.ArgumentParser()
 
   parser.add_argument('manifest', help='The manifest (*.test) file to run.')
@@ -55,8 +75,91 @@ def ParseArgs():
       '-g',
       '--graph',
       help='Continuously draw the state graph image to the specified file.')
+  parser.add_argument(
+      '--symmetry',
+      help=('Infer interchangeable instances of parameterized states and '
+            'explore only one of their permutations.'),
+      action='store_true')
+  parser.add_argument(
+      '-s',
+      '--strategy',
+      help=('The strategy to walk the state graph with: %s. Overrides the '
+            'manifest.' % stl.base.GetCSV(sorted(stl.strategy.STRATEGIES))))
+  parser.add_argument(
+      '-p',
+      '--parallel',
+      help=('Split the transitions into one walk per instance of the system '
+            'under test in the manifest, and run the walks in parallel.'),
+      action='store_true')
+  parser.add_argument(
+      '--history',
+      help=('A JSON file of the run times and failures of transitions. The '
+            'state graph is walked to minimize the expected run time and to '
+            'run transitions which failed before first, and the file is '
+            'updated with the results.'))
+  parser.add_argument(
+      '--fail-fast',
+      help='Stop at the first failed transition.',
+      action='store_true')
+  parser.add_argument(
+      '--timeout',
+      help=('Milliseconds after which an event fails, unless the manifest '
+            'gives it a timeout of its own.'),
+      type=int)
+  parser.add_argument(
+      '--asyncio',
+      help=('Run the test in an asyncio event loop, which awaits the events of '
+            'stl.lib.AsyncEvent and runs other events in a thread executor.'),
+      action='store_true')
+  parser.add_argument(
+      '--concurrency',
+      help=('Run up to this many upcoming transitions of a walk at once if '
+            'they have neither a state nor a role in common, and independent '
+            'state machines without a role in common in up to this many '
+            'lanes.'),
+      type=int,
+      default=1)
+  parser.add_argument(
+      '--ledger',
+      help=('A JSON file of the transitions which passed against each build '
+            'of the system under test, which is updated with the results.'))
+  parser.add_argument(
+      '--build',
+      help='Id of the build of the system under test in the --ledger.',
+      default='')
+  parser.add_argument(
+      '--window',
+      help='Hours a pass in the --ledger covers a transition for.',
+      type=float,
+      default=24)
+  parser.add_argument(
+      '--rest',
+      help=('Only cover the transitions which did not pass against the same '
+            'spec and build within the --window, according to the --ledger.'),
+      action='store_true')
+  parser.add_argument(
+      '--select',
+      help=('Only cover the transitions whose name matches this regular '
+            'expression, e.g. "Tls[12]$".'))
+  parser.add_argument(
+      '--select-states',
+      help=('Only cover the transitions which touch one of these states, e.g. '
+            'sTlsState or sTlsState(1).'),
+      nargs='+')
+  parser.add_argument(
+      '--select-roles',
+      help='Only cover the transitions with events of one of these roles.',
+      nargs='+')
+  parser.add_argument(
+      '--baseline',
+      help=('A JSON file of the transitions which passed in earlier runs. Only '
+            'the transitions added or changed since are covered, and the file '
+            'is updated with those which pass.'))
 
-  return parser.parse_args()
+  args = parser.parse_args(argv)
+  if args.concurrency < 1:
+    parser.error('--concurrency must be at least 1')
+  return args
 
 
 def AddManifestRootToPath(manifest_filename):
@@ -216,6 +319,195 @@ def InitializeStates(transitions):
   return states
 
 
+def GetSymmetry(modules, manifest, transitions, states, infer=False):
+  """Returns the symmetry reduction to build the transition graph with.
+
+  Interchangeable states are declared in the manifest as a list of groups of
+  states permuted together, e.g. [['example::sTlsState']]. A group can also be
+  a single state name.
+
+  Args:
+    modules: Dictionary of stl.module.Module's.
+    manifest: Test manifest.
+    transitions: Dictionary of resolved stl.state.Transition's.
+    states: Dictionary of stl.state.StateResolved's.
+    infer: Whether or not to infer groups for states not declared.
+  Returns:
+    stl.symmetry.Symmetry, or None if there are no interchangeable states.
+  """
+  groups = []
+  for group in manifest.get('symmetric_states', []):
+    if stl.base.IsString(group):
+      group = [group]
+    names = []
+    for s in group:
+      module, name = s.split('::', 1)
+      if module not in modules:
+        did_you_mean = stl.levenshtein.closest_candidate(module, modules.keys())
+        raise NameError('Cannot find module "%s" referenced by "%s".'
+                        ' Did you mean %s?' % (module, s, did_you_mean))
+      if name not in modules[module].states:
+        did_you_mean = stl.levenshtein.closest_candidate(
+            name, modules[module].states.keys())
+        raise NameError('Cannot find a state in module "%s": %s.'
+                        ' Did you mean %s?' % (module, name, did_you_mean))
+      names.append(name)
+    groups.append(names)
+  if infer:
+    groups.extend(
+        stl.symmetry.InferSymmetry(states, transitions,
+                                   list(itertools.chain(*groups))))
+  symmetry = stl.symmetry.BuildSymmetry(groups, states, transitions)
+  logging.debug(str(symmetry))
+  return symmetry
+
+
+def GetReset(modules, manifest, transitions, roles_to_test):
+  """Returns the function resetting the system under test, if any.
+
+  The manifest declares a reset either as a transition, e.g.
+  'example::tRestart', or as an external stl.lib.Reset class, e.g.
+  'foo.bar.Restart'. A reset transition is run for its events only and is not
+  covered as part of the transition graph.
+
+  Args:
+    modules: Dictionary of stl.module.Module's.
+    manifest: Test manifest.
+    transitions: Dictionary of resolved stl.state.Transition's. A reset
+        transition is removed from it.
+    roles_to_test: List of stl.base.Role's under test.
+  Returns:
+    A function which returns True if the system under test was reset, or None
+    if the manifest does not declare a reset.
+  """
+  if 'reset' not in manifest:
+    return None
+  reset = manifest['reset']
+  if '::' not in reset:
+    module, name = reset.rsplit('.', 1)
+    external = importlib.import_module(module).__getattribute__(name)()
+    if not isinstance(external, stl.lib.Reset):
+      raise RuntimeError('Reset is not a stl.lib.Reset: ' + reset)
+    return functools.partial(external.Reset, roles_to_test)
+
+  module, name = reset.split('::', 1)
+  if module not in modules:
+    did_you_mean = stl.levenshtein.closest_candidate(module, modules.keys())
+    raise NameError('Cannot find module "%s" referenced by "%s".'
+                    ' Did you mean %s?' % (module, reset, did_you_mean))
+  if name not in modules[module].transitions:
+    did_you_mean = stl.levenshtein.closest_candidate(
+        name, modules[module].transitions.keys())
+    raise NameError('Cannot find a transition in module "%s": %s.'
+                    ' Did you mean %s?' % (module, name, did_you_mean))
+  if name not in transitions:
+    raise RuntimeError('Reset transition has no events to test: ' + name)
+  return transitions.pop(name).Run
+
+
+def GetSnapshot(manifest, roles_to_test):
+  """Returns the functions saving and restoring the system under test, if any.
+
+  The manifest declares them as an external stl.lib.Snapshot class, e.g.
+  'foo.bar.Emulator'.
+
+  Args:
+    manifest: Test manifest.
+    roles_to_test: List of stl.base.Role's under test.
+  Returns:
+    A 2-tuple (function returning the handle of a new snapshot, function
+    restoring the snapshot of a handle), or None if the manifest does not
+    declare a snapshot.
+  """
+  if 'snapshot' not in manifest:
+    return None
+  module, name = manifest['snapshot'].rsplit('.', 1)
+  external = importlib.import_module(module).__getattribute__(name)()
+  if not isinstance(external, stl.lib.Snapshot):
+    raise RuntimeError('Snapshot is not a stl.lib.Snapshot: ' +
+                       manifest['snapshot'])
+  return (functools.partial(external.Snapshot, roles_to_test),
+          functools.partial(external.Restore, roles_to_test))
+
+
+def GetStrategy(manifest, args=None):
+  """Returns the strategy to walk the transition graphs with.
+
+  The manifest declares either the name of a strategy, or a dictionary of its
+  name and options, e.g. {'name': 'random', 'length': 100, 'seed': 1}. The
+  --strategy option overrides the name.
+
+  Args:
+    manifest: Test manifest.
+    args: Parsed command line args.
+  Returns:
+    A 2-tuple (name, dictionary of options) of the strategy.
+  """
+  strategy = manifest.get('strategy', 'circuit')
+  if stl.base.IsString(strategy):
+    strategy = {'name': strategy}
+  options = dict(strategy)
+  name = options.pop('name', 'circuit')
+  if args and args.strategy:
+    name = args.strategy
+  return name, options
+
+
+class Report(object):
+  """Results of running transitions against the system under test.
+
+  Attributes:
+    passed: collections.Counter of the names of passed transitions.
+    failed: collections.Counter of the names of failed transitions.
+    resets: Number of times the system under test was reset.
+    restores: Number of times the system under test was restored to a
+        snapshot.
+    skipped: collections.Counter of the names of transitions the strategy did
+        not run, e.g. because they did not fit in its budget.
+    durations: Dictionary of lists of the milliseconds each passed run took,
+        keyed on transition names.
+    estimated_ms: Sum of the expected run times of the transitions run which
+        have an estimate.
+    actual_ms: Sum of the measured run times of the same transitions.
+  """
+
+  def __init__(self):
+    self.passed = collections.Counter()
+    self.failed = collections.Counter()
+    self.resets = 0
+    self.restores = 0
+    self.skipped = collections.Counter()
+    self.durations = collections.defaultdict(list)
+    self.estimated_ms = 0.0
+    self.actual_ms = 0.0
+
+  def Merge(self, other):
+    """Adds the results of |other|, e.g. of another instance."""
+    self.passed.update(other.passed)
+    self.failed.update(other.failed)
+    self.resets += other.resets
+    self.restores += other.restores
+    self.skipped.update(other.skipped)
+    for name, runs in other.durations.items():
+      self.durations[name].extend(runs)
+    self.estimated_ms += other.estimated_ms
+    self.actual_ms += other.actual_ms
+
+  def Log(self):
+    logging.info('%d transition(s) passed, %d failed, %d reset(s), '
+                 '%d restore(s)', sum(self.passed.values()),
+                 sum(self.failed.values()), self.resets, self.restores)
+    if self.estimated_ms:
+      logging.info('Estimated %.0f ms for the transitions run, took %.0f ms',
+                   self.estimated_ms, self.actual_ms)
+    for name, count in sorted(self.failed.items()):
+      logging.error('\033[91m[ FAILED ]\033[0m: %s (%d time(s))', name, count)
+    if self.skipped:
+      logging.warning('%d transition(s) skipped: %s',
+                      sum(self.skipped.values()),
+                      stl.base.GetCSV(sorted(self.skipped)))
+
+
 class Visualizer(object):
 
   def __init__(self, transition_graph, graph_file=None):
@@ -249,71 +541,559 @@ class Visualizer(object):
     self.a_graph.draw(self.graph_file)
 
 
-def TraverseGraph(transitions, states, args=None):
-  """Does that actual graph traversal, going through all transitions."""
-  transition_graph, initial_vertex = stl.graph.BuildTransitionGraph(
-      transitions, states)
+def BuildTransitionGraphs(transitions, states, symmetry=None, history=None):
+  """Builds the transition graph of each group of independent states.
+
+  Args:
+    transitions: Dictionary of resolved stl.state.Transition's.
+    states: Dictionary of stl.state.StateResolved's.
+    symmetry: Optional stl.symmetry.Symmetry to reduce the graphs with.
+    history: Optional stl.history.History to weigh the edges by. Without it,
+        edges are weighed by the cost_ms hints of their transitions.
+  Returns:
+    List of 2-tuples (transition graph, initial vertex id).
+  """
+  if not transitions:
+    raise RuntimeError('No transitions to test')
+  graphs = []
+  for component_transitions, component_states in (
+      stl.graph.SplitIndependentTransitions(transitions, states)):
+    graphs.append(
+        stl.graph.BuildTransitionGraph(component_transitions, component_states,
+                                       symmetry))
+  # Without a history, the cost_ms hints of the spec still weigh the edges.
+  history = history or stl.history.History()
+  for transition_graph, _ in graphs:
+    history.WeighGraph(transition_graph)
+  return graphs
+
+
+def TraverseGraph(*args, **kwargs):
+  """Does that actual graph traversal, going through all transitions.
+
+  Takes the arguments of _TraversalLanes(), and runs the transitions of a lane
+  one batch after another. Several lanes run at once in a thread pool.
+
+  Returns:
+    Whether or not all transitions passed.
+  """
+  lanes, fail_fast = _TraversalLanes(*args, **kwargs)
+  if len(lanes) > 1:
+    return _RunLanes(lanes, fail_fast)
+  steps = lanes[0]
+  try:
+    transitions = next(steps)
+    while True:
+      transitions = steps.send(_RunTransitions(transitions))
+  except StopIteration as e:
+    return e.value
+
+
+def _RunTransitions(transitions):
+  """Runs a batch of |transitions| at once in a thread pool.
+
+  Returns:
+    List of 2-tuples (whether or not the transition passed, milliseconds it
+    took), one per transition.
+  """
+
+  def Timed(transition):
+    start = time.time()
+    passed = transition.Run()
+    return passed, (time.time() - start) * 1000
+
+  if len(transitions) == 1:
+    return [Timed(transitions[0])]
+  with concurrent.futures.ThreadPoolExecutor(len(transitions)) as executor:
+    return list(executor.map(Timed, transitions))
+
+
+async def _AwaitTransitions(transitions):
+  """Like _RunTransitions(), but awaits the transitions at once."""
+
+  async def Timed(transition):
+    start = time.time()
+    passed = await transition.RunAsync()
+    return passed, (time.time() - start) * 1000
+
+  return await asyncio.gather(*[Timed(t) for t in transitions])
+
+
+async def TraverseGraphAsync(*args, **kwargs):
+  """Like TraverseGraph(), but awaits the transitions in the running loop.
+
+  Events of stl.lib.AsyncEvent are awaited, and other events run in a thread
+  executor, so the test can share its event loop with other tasks. Several
+  lanes are awaited at once.
+  """
+  lanes, fail_fast = _TraversalLanes(*args, **kwargs)
+  stop = []
+  results = await asyncio.gather(
+      *[_AwaitLane(lane, fail_fast, stop) for lane in lanes])
+  return all(results)
+
+
+async def _AwaitLane(steps, fail_fast, stop):
+  """Awaits the transitions of one lane.
+
+  With |fail_fast|, a failed lane appends to |stop|, and other lanes stop
+  before their next transition.
+  """
+  try:
+    transitions = next(steps)
+    while not stop:
+      transitions = steps.send(await _AwaitTransitions(transitions))
+    steps.close()
+    return False
+  except StopIteration as e:
+    if fail_fast and not e.value:
+      stop.append(steps)
+    return e.value
+
+
+def _RunLanes(lanes, fail_fast=False):
+  """Runs the transitions of several lanes at once in a thread pool.
+
+  The lanes are stepped in this thread, so the report, the strategies and the
+  graph image are only updated from one thread, and only the batches of
+  transitions run concurrently. With |fail_fast|, no batch starts after a
+  transition failed.
+
+  Returns:
+    Whether or not all transitions passed.
+  """
+  success = True
+  with concurrent.futures.ThreadPoolExecutor(len(lanes)) as executor:
+    running = {}
+    results = [(steps, None) for steps in lanes]
+    while results:
+      for steps, outcomes in results:
+        try:
+          transitions = (next(steps) if outcomes is None else
+                         steps.send(outcomes))
+        except StopIteration as e:
+          success = success and e.value
+          continue
+        running[executor.submit(_RunTransitions, transitions)] = steps
+      if not running or (fail_fast and not success):
+        break
+      done, _ = concurrent.futures.wait(
+          running, return_when=concurrent.futures.FIRST_COMPLETED)
+      results = [(running.pop(f), f.result()) for f in done]
+  return success
+
+
+def _Roles(transitions):
+  """Returns the names of the roles of the events of |transitions|."""
+  roles = set()
+  for t in transitions.values():
+    for e in t.events:
+      roles.update(r.name for r in (e.context.source, e.context.target) if r)
+  return roles
+
+
+def _GroupLanes(components, concurrency):
+  """Groups independent state machines into lanes which can run at once.
+
+  The state machines of |components| never share a state, but two of them
+  which have events of the same role run in the same lane, one after another,
+  since the role is one endpoint of the system under test. The groups are
+  spread over at most |concurrency| lanes, the largest group first into the
+  lane with the fewest transitions. Transitions within one state machine are
+  never split over lanes, even if they touch different states.
+
+  Args:
+    components: List of (transitions, states) tuples of
+        stl.graph.SplitIndependentTransitions().
+    concurrency: Maximum number of lanes.
+  Returns:
+    List of lanes, each a list of indexes of |components| in order.
+  """
+  groups = []
+  for i, (transitions, _) in enumerate(components):
+    roles = _Roles(transitions)
+    shared = [g for g in groups if g[0] & roles]
+    group = (roles.union(*[g[0] for g in shared]),
+             sorted(sum([g[1] for g in shared], [i])))
+    groups = [g for g in groups if g not in shared] + [group]
+  sizes = dict((i, len(t)) for i, (t, _) in enumerate(components))
+  lanes = [[] for _ in range(min(concurrency, len(groups)) or 1)]
+  for _, indexes in sorted(groups,
+                           key=lambda g: -sum(sizes[i] for i in g[1])):
+    lane = min(lanes, key=lambda indexes: sum(sizes[i] for i in indexes))
+    lane.extend(indexes)
+  return [sorted(lane) for lane in lanes]
+
+
+def _TraversalLanes(transitions,
+                    states,
+                    args=None,
+                    symmetry=None,
+                    reset=None,
+                    walks=None,
+                    report=None,
+                    strategy=None,
+                    history=None,
+                    snapshot=None,
+                    selected=None):
+  """Returns generators of the transitions of the graph traversal to run.
+
+  Groups of states which never appear together in a transition are independent
+  state machines, so the transition graph of each group is built and covered
+  separately. By default they are covered one after another in one lane. With
+  --concurrency, state machines without a role in common are covered in
+  separate lanes, which can run at once. Within a walk, upcoming transitions
+  which have neither a state nor a role in common run at once as well, see
+  _IterTraverseComponent(), if the strategy plans its walk ahead and there is
+  no symmetry.
 
-  graph_file = None
-  if args:
-    graph_file = args.graph
-  visualizer = Visualizer(transition_graph, graph_file)
+  Without a reset, each transition graph must be strongly connected. With a
+  reset, transitions which cannot be undone are covered in several walks from
+  the initial vertex.
 
-  circuit_stack = stl.traverse.MinEdgeCoverCircuit(transition_graph,
-                                                   initial_vertex)
-  circuit_stack.reverse()
+  The online strategy does not build the transition graphs up front, but
+  explores them while running transitions, so there is no graph to draw.
+
+  Args:
+    transitions: Dictionary of resolved stl.state.Transition's.
+    states: Dictionary of stl.state.StateResolved's.
+    args: Parsed command line args.
+    symmetry: Optional stl.symmetry.Symmetry to reduce the graphs with.
+    reset: Optional function resetting the system under test.
+    walks: Optional list of the walk to run in each transition graph, instead
+        of covering all transitions. Vertex ids are only unique within a
+        process, so the edges of a walk are (str(source StateVertex),
+        str(target StateVertex), edge_index).
+    report: Optional Report to add the results to.
+    strategy: Optional 2-tuple (name, dictionary of options) of the
+        stl.strategy.Strategy to walk each transition graph with. Defaults to
+        the circuit strategy.
+    history: Optional stl.history.History to weigh the edges by.
+    snapshot: Optional 2-tuple (snapshot function, restore function) of
+        GetSnapshot.
+    selected: Optional set of names of the transitions to cover, instead of
+        all. The circuit strategy reaches them along shortest paths.
+  Returns:
+    A 2-tuple (list of lanes, whether or not to stop at the first failed
+    transition). Each lane is a generator yielding lists of
+    stl.state.Transition's to run at once, to which a list of 2-tuples
+    (whether or not the transition passed, milliseconds it took) is sent back,
+    and which returns whether or not all its transitions passed.
+  Raises:
+    RuntimeError: if |selected| is set for another strategy, or if lanes would
+        run at once with a reset or a snapshot of the whole system under
+        test.
+  """
+  strategy_name, strategy_options = strategy or ('circuit', {})
+  if selected is not None and strategy_name != 'circuit':
+    raise RuntimeError('Only the circuit strategy can cover selected '
+                       'transitions')
+  components = stl.graph.SplitIndependentTransitions(transitions, states)
+  if strategy_name == 'online':
+    lazy_graphs = [
+        stl.graph.LazyTransitionGraph(t, s, symmetry) for t, s in components
+    ]
+    graphs = [(g.graph, g.initial) for g in lazy_graphs]
+    visualizer = None
+  else:
+    lazy_graphs = None
+    graphs = BuildTransitionGraphs(transitions, states, symmetry, history)
+    graph_file = None
+    if args:
+      graph_file = args.graph
+    visualizer = Visualizer(nx.union_all([g for g, _ in graphs]), graph_file)
+
+  concurrency = (args and args.concurrency) or 1
+  lanes = _GroupLanes(components, concurrency)
+  lookahead = concurrency
+  if lookahead > 1 and symmetry:
+    # Permutations compose in the order of the walk.
+    logging.info('Running the transitions of a walk one at a time with '
+                 'symmetry')
+    lookahead = 1
+  if len(lanes) > 1:
+    if reset or strategy_name == 'snapshot':
+      raise RuntimeError('Transitions cannot run concurrently with a reset or '
+                         'a snapshot')
+    logging.info('Running %d independent state machine(s) in %d lane(s)',
+                 len(graphs), len(lanes))
+
+  if report is None:
+    report = Report()
+  fail_fast = bool(args and args.fail_fast)
+  traverse = functools.partial(
+      _IterTraverseLane, graphs, lazy_graphs, visualizer,
+      symmetry=symmetry, reset=reset, walks=walks, report=report,
+      strategy=(strategy_name, strategy_options), snapshot=snapshot,
+      selected=selected, fail_fast=fail_fast, lookahead=lookahead)
+  return [traverse(lane) for lane in lanes], fail_fast
+
+
+def _IterTraverseLane(graphs, lazy_graphs, visualizer, lane, symmetry, reset,
+                      walks, report, strategy, snapshot, selected, fail_fast,
+                      lookahead):
+  """Yields the batches of transitions of the transition graphs |lane| to run.
+
+  Covers the transition graphs of |graphs| at the indexes |lane| one after
+  another, with the arguments of _TraversalLanes(). Returns whether or not all
+  transitions passed.
+  """
+  strategy_name, strategy_options = strategy
+  success = True
+  for i in lane:
+    transition_graph, initial_vertex = graphs[i]
+    if strategy_name == 'online':
+      component_strategy = stl.strategy.OnlineStrategy(
+          transition_graph, initial_vertex, bool(reset),
+          lazy_graphs[i].Explore)
+    elif walks is None:
+      options = strategy_options
+      if selected is not None:
+        options = dict(strategy_options,
+                       edges=_SelectedEdges(transition_graph, selected,
+                                            symmetry))
+      component_strategy = stl.strategy.CreateStrategy(
+          strategy_name, transition_graph, initial_vertex, bool(reset),
+          **options)
+    else:
+      ids = dict((str(v), n) for n, v in transition_graph.nodes(data='vertex'))
+      component_strategy = stl.strategy.CircuitStrategy(
+          transition_graph, initial_vertex, bool(reset),
+          [(ids[s], ids[t], k) for s, t, k in walks[i]])
+    if (isinstance(component_strategy, stl.strategy.SnapshotStrategy) and
+        not snapshot):
+      raise RuntimeError('The snapshot strategy needs a snapshot in the '
+                         'manifest')
+    if not (yield from _IterTraverseComponent(
+        transition_graph, initial_vertex, visualizer, symmetry,
+        component_strategy, reset, report, snapshot, fail_fast, lookahead)):
+      success = False
+    for edge in component_strategy.uncovered:
+      report.skipped[transition_graph.edges[edge]['label']] += 1
+    if not success and fail_fast:
+      break
+  return success
+
+
+def _SelectedEdges(transition_graph, selected, symmetry=None):
+  """Returns the edges whose transition is in |selected|.
+
+  With |symmetry|, an edge stands for every transition of its orbit, so a
+  selected transition which is not a representative selects its edges too.
+  """
+  matches = {}
+  edges = []
+  for s, t, k, transition in transition_graph.edges(keys=True,
+                                                    data='transition'):
+    if transition.name not in matches:
+      names = symmetry.Orbit(transition) if symmetry else {transition.name}
+      matches[transition.name] = bool(names & selected)
+    if matches[transition.name]:
+      edges.append((s, t, k))
+  logging.info('Covering %d of %d selected transition(s)', len(edges),
+               transition_graph.number_of_edges())
+  return edges
+
+
+def _IterTraverseComponent(transition_graph, initial_vertex, visualizer,
+                           symmetry, strategy, reset=None, report=None,
+                           snapshot=None, fail_fast=False, lookahead=1):
+  """Goes through the transitions of the graph of one independent group.
+
+  Yields batches of the transitions of the edges yielded by |strategy| to run
+  at once, and feeds back the results sent back in the order of the walk. A
+  batch takes up to |lookahead| edges the walk runs next, as long as they have
+  neither a state nor a role in common, so they lead to the same vertex in any
+  order. If one of them fails, the ones after it ran from its error vertex,
+  and the strategy plans the rest of its walk from where they led. With
+  |fail_fast|, stops at the first batch with a failed transition. Returns
+  whether or not all transitions passed.
+  """
+  if report is None:
+    report = Report()
 
   success = True
-  while circuit_stack:
-    edge = circuit_stack.pop()
+  # With symmetry reduction, the permutation mapping the current vertex to the
+  # state the system under test is actually in.
+  permutation = {}
+  # Handles and permutations of the snapshots, keyed on their vertexes.
+  snapshots = {}
+  walk = strategy.Walk()
+  for edge in walk:
     source, target, edge_i = edge
-    attr = transition_graph[source][target][edge_i]
-    transition = attr['transition']
-    visualizer.TransitionRunning(edge)
-    if attr['weight'] != float('inf'):
+    if edge_i == stl.traverse.SNAPSHOT:
+      logging.info('\033[93m[ SNAPSHOT ]\033[0m')
+      handle = snapshot[0]()
+      if handle is None:
+        logging.warning('Cannot take a snapshot')
+      else:
+        snapshots[source] = (handle, permutation)
+      strategy.Feedback(edge, handle is not None, source)
+      continue
+    if edge_i == stl.traverse.RESTORE:
+      logging.info('\033[93m[ RESTORING ]\033[0m')
+      report.restores += 1
+      handle, permutation = snapshots[target]
+      if not snapshot[1](handle):
+        logging.error('\033[91m[ FAILED ]\033[0m: restore')
+        return False
+      strategy.Feedback(edge, True, target)
+      continue
+    if edge_i == stl.traverse.RESET:
+      logging.info('\033[93m[ RESETTING ]\033[0m')
+      report.resets += 1
+      if not reset():
+        logging.error('\033[91m[ FAILED ]\033[0m: reset')
+        return False
+      permutation = {}
+      strategy.Feedback(edge, True, initial_vertex)
+      continue
+    attr = transition_graph.edges[edge]
+    if attr['weight'] == float('inf'):
+      # The transition failed before, and is only on the way.
+      if visualizer:
+        visualizer.TransitionRunning(edge)
+        visualizer.TransitionFailed(edge, attr['error_vertex_id'])
+      strategy.Feedback(edge, False, attr['error_vertex_id'])
+      if fail_fast:
+        return False
+      continue
+    batch = [edge]
+    if lookahead > 1:
+      batch.extend(_IndependentEdges(transition_graph, edge,
+                                     strategy.Peek(lookahead - 1)))
+      for _ in batch[1:]:
+        next(walk)
+    transitions = []
+    for e in batch:
+      transition = transition_graph.edges[e]['transition']
+      if symmetry:
+        transition = symmetry.PermuteTransition(transition, permutation)
+      if visualizer:
+        visualizer.TransitionRunning(e)
       logging.info('\033[93m[ RUNNING ]\033[0m: %s', transition.name)
-      if transition.Run():
+      transitions.append(transition)
+    outcomes = yield transitions
+    vertex = source
+    batch_passed = True
+    for e, transition, (passed, duration_ms) in zip(batch, transitions,
+                                                    outcomes):
+      if e[0] != vertex:
+        # A transition before it failed, so it ran from another vertex.
+        e = _EdgeOfTransition(transition_graph, vertex, transition.name)
+      attr = transition_graph.edges[e]
+      if passed:
         logging.info('\033[92m[ PASSED ]\033[0m: %s', transition.name)
-        visualizer.TransitionPassed(edge)
-        continue
+        report.passed[transition.name] += 1
+        report.durations[transition.name].append(duration_ms)
+        if attr.get('cost_ms') is not None:
+          report.estimated_ms += attr['cost_ms']
+          report.actual_ms += duration_ms
+        if visualizer:
+          visualizer.TransitionPassed(e)
+        if symmetry:
+          permutation = symmetry.Compose(permutation, attr['permutation'])
+        vertex = e[1]
       else:
         logging.error('\033[91m[ FAILED ]\033[0m: %s', transition.name)
-        success = False
-        attr['weight'] = float('inf')
-    error_vertex_id = attr['error_vertex_id']
-    visualizer.TransitionFailed(edge, error_vertex_id)
-    new_path = nx.shortest_path(
-        transition_graph, error_vertex_id, target, weight='weight')
-    path_stack = []
-    for i in range(len(new_path) - 1):
-      s = new_path[i]
-      t = new_path[i + 1]
-      # Get the edge-index with the smallest weight
-      multi_edge = transition_graph[s][t]
-      min_weight = float('inf')
-      min_edge_i = 0
-      for key, value in multi_edge.items():
-        if value['weight'] < min_weight:
-          min_weight = value['weight']
-          min_edge_i = key
-      if transition_graph[s][t][min_edge_i]['weight'] == float('inf'):
-        return success
-      path_stack.append((s, t, min_edge_i))
-    # TODO(seantopping): Implement a better error recovery algorithm.
-    circuit_stack.extend(reversed(path_stack))
+        report.failed[transition.name] += 1
+        success = batch_passed = False
+        if symmetry:
+          permutation = symmetry.Compose(permutation,
+                                         attr['error_permutation'])
+        vertex = attr['error_vertex_id']
+        if visualizer:
+          visualizer.TransitionFailed(e, vertex)
+      strategy.Feedback(e, passed, vertex)
+    if fail_fast and not batch_passed:
+      return False
   return success
 
 
-def RunTest(manifest_filename, manifest_arg_dict, args=None):
-  AddManifestRootToPath(manifest_filename)
+def _Footprint(transition):
+  """Returns the names of the states and roles |transition| touches.
 
-  manifest = LoadManifest(manifest_filename, manifest_arg_dict)
+  States are told apart from roles by a 'state:' or 'role:' prefix.
+  """
+  values = itertools.chain(itertools.chain(*transition.pre_states),
+                           transition.post_states, transition.error_states)
+  footprint = set('state:%s' % v.state for v in values)
+  for e in transition.events:
+    footprint.update('role:%s' % r.name
+                     for r in (e.context.source, e.context.target) if r)
+  return footprint
+
+
+def _IndependentEdges(transition_graph, edge, upcoming):
+  """Returns the edges of |upcoming| which can run at once with |edge|.
 
+  Takes the edges of |upcoming| in order until one has a state or a role in
+  common with |edge| or an edge taken before it, or is not a transition which
+  can run.
+  """
+  footprint = _Footprint(transition_graph.edges[edge]['transition'])
+  independent = []
+  for e in upcoming:
+    if (e[2] in (stl.traverse.RESET, stl.traverse.SNAPSHOT,
+                 stl.traverse.RESTORE) or
+        transition_graph.edges[e]['weight'] == float('inf')):
+      break
+    other = _Footprint(transition_graph.edges[e]['transition'])
+    if footprint & other:
+      break
+    footprint |= other
+    independent.append(e)
+  return independent
+
+
+def _EdgeOfTransition(transition_graph, vertex, name):
+  """Returns the edge from |vertex| of the transition |name|.
+
+  A transition independent of one which failed can still run from its error
+  vertex, so the edge is in the graph.
+  """
+  for e in transition_graph.out_edges(vertex, keys=True):
+    if transition_graph.edges[e]['label'] == name:
+      return e
+  raise RuntimeError('No transition %s from %s' % (name, vertex))
+
+
+def SetTimeouts(transitions, manifest, args=None):
+  """Sets the timeouts of the events of |transitions|.
+
+  The manifest 'timeouts' field maps names of external events, e.g.
+  'noop.NoOp', to milliseconds, and 'default' to the timeout of other events.
+  The --timeout option overrides the default.
+
+  Args:
+    transitions: Dictionary of resolved stl.state.Transition's.
+    manifest: Test manifest.
+    args: Parsed command line args.
+  """
+  timeouts = dict(manifest.get('timeouts', {}))
+  if args and args.timeout:
+    timeouts['default'] = args.timeout
+  for t in transitions.values():
+    for e in t.events:
+      e.timeout_ms = timeouts.get(e.name, timeouts.get('default'))
+
+
+def LoadTest(manifest, manifest_filename, args=None):
+  """Loads the transitions to test from the STL files of |manifest|.
+
+  Args:
+    manifest: Test manifest.
+    manifest_filename: Name of the manifest file.
+    args: Parsed command line args.
+  Returns:
+    A 5-tuple (transitions, states, symmetry, reset, snapshot) of the arguments
+    of TraverseGraph, or None if the STL files have errors.
+  """
   global_env = {}
   modules = LoadModules(manifest, manifest_filename, global_env)
 
   if 'error' in global_env and global_env['error']:
-    return False
+    return None
 
   FillInModuleRoles(modules, manifest)
   FillInConstants(modules, manifest)
@@ -321,10 +1101,270 @@ def RunTest(manifest_filename, manifest_arg_dict, args=None):
   roles_to_test = GetRolesToTest(modules, manifest)
 
   transitions = ResolveTransitions(modules, roles_to_test)
+  SetTimeouts(transitions, manifest, args)
+
+  reset = GetReset(modules, manifest, transitions, roles_to_test)
 
   states = InitializeStates(transitions)
 
-  return TraverseGraph(transitions, states, args)
+  symmetry = GetSymmetry(modules, manifest, transitions, states,
+                         args and args.symmetry)
+
+  snapshot = GetSnapshot(manifest, roles_to_test)
+
+  return transitions, states, symmetry, reset, snapshot
+
+
+def RunTest(manifest_filename, manifest_arg_dict, args=None):
+  AddManifestRootToPath(manifest_filename)
+
+  manifest = LoadManifest(manifest_filename, manifest_arg_dict)
+
+  if args and args.parallel:
+    return RunTestInParallel(manifest_filename, manifest, args)
+
+  test = LoadTest(manifest, manifest_filename, args)
+  if test is None:
+    return False
+  transitions, states, symmetry, reset, snapshot = test
+
+  history = GetHistory(args)
+  ledger, spec = GetLedger(manifest, manifest_filename, args)
+  selected = SelectTransitions(transitions, args)
+  if ledger and args.rest:
+    selected = ((set(transitions) if selected is None else selected) -
+                ledger.Covered(spec, args.build))
+  report = Report()
+  traverse_args = dict(report=report, strategy=GetStrategy(manifest, args),
+                       history=history, snapshot=snapshot, selected=selected)
+  if args and args.asyncio:
+    success = asyncio.run(TraverseGraphAsync(
+        transitions, states, args, symmetry, reset, **traverse_args))
+  else:
+    success = TraverseGraph(transitions, states, args, symmetry, reset,
+                            **traverse_args)
+  report.Log()
+  SaveHistory(history, report)
+  if ledger:
+    ledger.Record(spec, args.build, report.passed)
+    ledger.Save()
+  if args and args.baseline:
+    SaveBaseline(args.baseline, transitions, report.passed)
+  return success
+
+
+def _Fingerprint(transition):
+  """Returns a hash of a resolved transition, which changes with its spec."""
+  return hashlib.sha1(str(transition).encode('utf-8')).hexdigest()
+
+
+def _TouchesState(transition, names):
+  """Whether or not |transition| reads or writes one of the states |names|."""
+  names = set(n.split('::')[-1] for n in names)
+  values = itertools.chain(itertools.chain(*transition.pre_states),
+                           transition.post_states, transition.error_states)
+  for v in values:
+    resolved_name = '%s(%s)' % (v.state.name,
+                                stl.base.GetCSV(v.state.resolved_params))
+    if v.state.name in names or resolved_name in names:
+      return True
+  return False
+
+
+def _HasRole(transition, names):
+  """Whether or not |transition| has an event of one of the roles |names|."""
+  names = set(n.split('::')[-1] for n in names)
+  for e in transition.events:
+    if e.context.source.name in names or e.context.target.name in names:
+      return True
+  return False
+
+
+def SelectTransitions(transitions, args):
+  """Returns the names of the transitions selected by |args|.
+
+  A transition is selected if it matches every option given: --select,
+  --select-states, --select-roles, and --baseline.
+
+  Args:
+    transitions: Dictionary of resolved stl.state.Transition's.
+    args: Parsed command line args.
+  Returns:
+    Set of names of transitions, or None if no option selects transitions.
+  """
+  if not args or not (args.select or args.select_states or args.select_roles or
+                      args.baseline):
+    return None
+  baseline = None
+  if args.baseline and os.path.exists(args.baseline):
+    with open(args.baseline) as baseline_file:
+      baseline = json.load(baseline_file)
+  selected = set()
+  for name, t in transitions.items():
+    if args.select and not re.search(args.select, name):
+      continue
+    if args.select_states and not _TouchesState(t, args.select_states):
+      continue
+    if args.select_roles and not _HasRole(t, args.select_roles):
+      continue
+    if baseline is not None and baseline.get(name) == _Fingerprint(t):
+      continue
+    selected.add(name)
+  logging.info('Selected %d of %d transition(s)', len(selected),
+               len(transitions))
+  return selected
+
+
+def SaveBaseline(filename, transitions, passed):
+  """Updates the baseline |filename| with the transitions which passed.
+
+  Args:
+    filename: Name of the JSON file of --baseline.
+    transitions: Dictionary of resolved stl.state.Transition's.
+    passed: Names of the transitions which passed. Others keep their
+        fingerprints from the last baseline.
+  """
+  baseline = {}
+  if os.path.exists(filename):
+    with open(filename) as baseline_file:
+      baseline = json.load(baseline_file)
+  baseline = dict((name, baseline[name]) for name in transitions
+                  if name in baseline)
+  for name in passed:
+    if name in transitions:
+      baseline[name] = _Fingerprint(transitions[name])
+  with open(filename, 'w') as baseline_file:
+    json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+
+
+def GetHistory(args):
+  """Returns the stl.history.History of --history, or None."""
+  if args and args.history:
+    return stl.history.History(args.history)
+  return None
+
+
+def SaveHistory(history, report):
+  """Adds the run times measured in |report| to |history| and saves it."""
+  if history:
+    history.Update(report.durations, report.failed)
+    history.Save()
+
+
+def SpecHash(manifest, manifest_filename):
+  """Returns a hash of the manifest and the contents of its STL files."""
+  spec = hashlib.sha1(repr(manifest).encode('utf-8'))
+  manifest_root = os.path.dirname(manifest_filename)
+  for f in manifest.get('stl_files', []):
+    with open(os.path.join(manifest_root, f), 'rb') as stl_file:
+      spec.update(stl_file.read())
+  return spec.hexdigest()
+
+
+def GetLedger(manifest, manifest_filename, args):
+  """Returns the stl.ledger.Ledger of --ledger and the spec hash, or Nones.
+
+  Raises:
+    RuntimeError: if --rest is set without --ledger.
+  """
+  if args and args.rest and not args.ledger:
+    raise RuntimeError('--rest needs a --ledger')
+  if args and args.ledger:
+    return (stl.ledger.Ledger(args.ledger, args.window * 3600),
+            SpecHash(manifest, manifest_filename))
+  return None, None
+
+
+def RunTestInParallel(manifest_filename, manifest, args):
+  """Runs the transitions against several instances of the system under test.
+
+  The manifest lists the role information of each instance in 'instances'. The
+  edge-covering circuit of each transition graph is split into one walk per
+  instance, minimizing the weight of the longest walk, i.e. its expected run
+  time with --history, and each instance runs its walks in its own process.
+
+  Args:
+    manifest_filename: Name of the manifest file.
+    manifest: Test manifest.
+    args: Parsed command line args.
+  Returns:
+    Whether or not all transitions passed on all instances.
+  """
+  instances = manifest.get('instances')
+  if not instances:
+    raise RuntimeError('No instances to run in parallel')
+  strategy_name, strategy_options = GetStrategy(manifest, args)
+  if strategy_name != 'circuit':
+    raise RuntimeError('Only the circuit strategy can run in parallel')
+  if (args.rest or args.select or args.select_states or args.select_roles or
+      args.baseline):
+    raise RuntimeError('Selected transitions cannot run in parallel')
+  test = LoadTest(dict(manifest, roles=instances[0]), manifest_filename, args)
+  if test is None:
+    return False
+  transitions, states, symmetry, reset, _ = test
+
+  history = GetHistory(args)
+  walks = [[] for _ in instances]
+  for transition_graph, initial_vertex in BuildTransitionGraphs(
+      transitions, states, symmetry, history):
+    reset_edges = None
+    if reset:
+      reset_edges = (initial_vertex,
+                     stl.traverse.ResetWeight(transition_graph))
+    paths = stl.traverse.ShortestPaths(transition_graph, reset_edges)
+    circuit = list(
+        stl.traverse.IterMinEdgeCoverCircuit(
+            transition_graph, initial_vertex, bool(reset), paths,
+            strategy_options.get('exact_limit', stl.traverse.EXACT_LIMIT)))
+    component_walks = stl.traverse.SplitCircuit(circuit, initial_vertex,
+                                                len(instances), paths)
+    logging.info('Split %d transition(s) into walks of %s', len(circuit),
+                 stl.base.GetCSV([len(w) for w in component_walks]))
+    # Vertex ids differ between processes, so walks go by vertex states.
+    names = dict((n, str(v)) for n, v in transition_graph.nodes(data='vertex'))
+    for i, instance_walks in enumerate(walks):
+      walk = component_walks[i] if i < len(component_walks) else []
+      instance_walks.append([(names[s], names[t], k) for s, t, k in walk])
+
+  pool = multiprocessing.Pool(len(instances))
+  try:
+    results = pool.map(_RunInstance, [(manifest_filename, manifest, args, i,
+                                       walks[i]) for i in range(len(walks))])
+  finally:
+    pool.close()
+    pool.join()
+
+  report = Report()
+  success = True
+  for instance_success, instance_report in results:
+    success = success and instance_success
+    report.Merge(instance_report)
+  report.Log()
+  SaveHistory(history, report)
+  return success
+
+
+def _RunInstance(params):
+  """Runs walks against one instance of the system under test.
+
+  Args:
+    params: 5-tuple (manifest_filename, manifest, args, index of the instance,
+        list of the walk in each transition graph).
+  Returns:
+    A 2-tuple (whether or not all transitions passed, Report).
+  """
+  manifest_filename, manifest, args, i, walks = params
+  test = LoadTest(dict(manifest, roles=manifest['instances'][i]),
+                  manifest_filename, args)
+  report = Report()
+  if test is None:
+    return False, report
+  transitions, states, symmetry, reset, _ = test
+  # Instances do not share the graph image.
+  success = TraverseGraph(transitions, states, None, symmetry, reset, walks,
+                          report, history=GetHistory(args))
+  return success, report
 
 
 def Main():
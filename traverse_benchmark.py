@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""Benchmark for the balancing step of stl.traverse.MinEdgeCoverCircuit.
+
+The imbalance size is the total in-degree surplus of the transition graph, i.e.
+the number of vertex copies on each side of a bipartite matching. The min-cost
+flow ships the same surplus from a tenth as many imbalanced vertices. Path
+weights are random integers, as returned by shortest path search.
+
+With --strategies, it instead simulates runs of traversal strategies on a
+random transition graph where each transition fails with a given probability
+and leaves the state unchanged, and compares how many transitions they run.
+Strategies may reset the simulated system under test, e.g. when a failed
+transition was the only way out of a state.
+
+With --circuit_sizes, it instead plans the circuit of random transition graphs
+with that many vertexes, exactly and approximately, and compares their length
+and planning time.
+
+To run:
+  $ python ./traverse_benchmark.py --sizes 10 100 1000 10000
+  $ python ./traverse_benchmark.py --strategies circuit smoke weighted
+  $ python ./traverse_benchmark.py --circuit_sizes 100 1000 10000
+"""
+
+import argparse
+import sys
+import time
+
+import networkx as nx
+import numpy as np
+
+import stl.strategy
+import stl.traverse
+
+
+def ParseArgs(argv=None):
+  """Returns the parsed command line args.
+
+  Args:
+    argv: List of command line args, or None to use sys.argv.
+  """
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      '--sizes',
+      type=int,
+      nargs='+',
+      default=[10, 100, 1000, 10000],
+      help='Imbalance sizes to benchmark.')
+  parser.add_argument(
+      '--max_weight',
+      type=int,
+      default=20,
+      help='Largest path weight between two vertex copies.')
+  parser.add_argument(
+      '--seed', type=int, default=0, help='Seed of the random path weights.')
+  parser.add_argument(
+      '--strategies',
+      nargs='+',
+      choices=sorted(stl.strategy.STRATEGIES),
+      help='Traversal strategies to compare instead.')
+  parser.add_argument(
+      '--vertexes',
+      type=int,
+      default=100,
+      help='Number of vertexes of the simulated transition graph.')
+  parser.add_argument(
+      '--edges',
+      type=int,
+      default=400,
+      help='Number of edges of the simulated transition graph.')
+  parser.add_argument(
+      '--failure_rate',
+      type=float,
+      default=0.05,
+      help='Probability of a simulated transition to fail.')
+  parser.add_argument(
+      '--circuit_sizes',
+      type=int,
+      nargs='+',
+      help=('Numbers of vertexes of random transition graphs, with four times '
+            'as many edges, to plan exact and approximate circuits for '
+            'instead. Exact circuits are skipped above 1000 vertexes.'))
+  return parser.parse_args(argv)
+
+
+def BenchmarkMatching(size, max_weight, rand):
+  """Returns the seconds spent matching |size| random vertex copies."""
+  weights = -rand.randint(1, max_weight + 1, size=(size, size)).astype(float)
+  start = time.time()
+  matches = stl.traverse.Context().MaxWeightMatching(weights)
+  elapsed = time.time() - start
+  assert len(set(matches)) == size
+  return elapsed
+
+
+def BenchmarkFlow(size, max_weight, rand):
+  """Returns the seconds spent shipping |size| units between random vertexes."""
+  vertexes = max(1, size // 10)
+  costs = rand.randint(1, max_weight + 1, size=(vertexes, vertexes))
+  supplies = rand.multinomial(size, [1.0 / vertexes] * vertexes)
+  demands = rand.multinomial(size, [1.0 / vertexes] * vertexes)
+  start = time.time()
+  flows = stl.traverse.MinCostFlow(costs, supplies, demands)
+  elapsed = time.time() - start
+  assert flows.sum() == size
+  return elapsed
+
+
+def RandomTransitionGraph(vertexes, edges, rand):
+  """Returns a random strongly connected transition graph."""
+  graph = nx.MultiDiGraph()
+  nodes = ['s%d' % i for i in range(vertexes)]
+  # A cycle through all vertexes keeps the graph strongly connected.
+  pairs = list(zip(nodes, nodes[1:] + nodes[:1]))
+  pairs.extend((nodes[rand.randint(vertexes)], nodes[rand.randint(vertexes)])
+               for _ in range(edges - len(pairs)))
+  for s, t in pairs:
+    graph.add_edge(s, t, weight=1, error_vertex_id=s)
+  return graph
+
+
+def BenchmarkStrategy(name, graph, failure_rate, rand):
+  """Returns the edges run, the fraction covered and the seconds spent."""
+  graph = graph.copy()
+  options = {}
+  if name in ('random', 'weighted'):
+    options = {'length': 10 * graph.number_of_edges(), 'seed': 0}
+  strategy = stl.strategy.CreateStrategy(name, graph, 's0', True, **options)
+  start = time.time()
+  runs = 0
+  for edge in strategy.Walk():
+    runs += 1
+    if edge[2] in (stl.traverse.RESET, stl.traverse.SNAPSHOT,
+                   stl.traverse.RESTORE):
+      strategy.Feedback(edge, True, edge[1])
+    elif rand.random_sample() < failure_rate:
+      strategy.Feedback(edge, False, graph.edges[edge]['error_vertex_id'])
+    else:
+      strategy.Feedback(edge, True, edge[1])
+  elapsed = time.time() - start
+  covered = 1 - float(len(strategy.uncovered)) / graph.number_of_edges()
+  return runs, covered, elapsed
+
+
+def CompareStrategies(args, rand):
+  graph = RandomTransitionGraph(args.vertexes, args.edges, rand)
+  print('%10s %12s %12s %12s' % ('strategy', 'edges', 'covered', 'seconds'))
+  for name in args.strategies:
+    runs, covered, elapsed = BenchmarkStrategy(name, graph, args.failure_rate,
+                                               np.random.RandomState(args.seed))
+    print('%10s %12d %12.3f %12.3f' % (name, runs, covered, elapsed))
+  return True
+
+
+def BenchmarkCircuit(graph, exact_limit):
+  """Returns the length of the circuit and the seconds spent planning it."""
+  start = time.time()
+  circuit = stl.traverse.MinEdgeCoverCircuit(graph, 's0',
+                                             exact_limit=exact_limit)
+  return len(circuit), time.time() - start
+
+
+def CompareCircuits(args, rand):
+  print('%10s %12s %12s %12s %12s' % ('vertexes', 'exact', 'seconds',
+                                      'approximate', 'seconds'))
+  for size in args.circuit_sizes:
+    graph = RandomTransitionGraph(size, 4 * size, rand)
+    exact = '%12s %12s' % ('-', '-')
+    if size <= 1000:
+      exact = '%12d %12.3f' % BenchmarkCircuit(graph, None)
+    print('%10d %s %12d %12.3f' % ((size, exact) + BenchmarkCircuit(graph, 0)))
+    sys.stdout.flush()
+  return True
+
+
+def Main():
+  args = ParseArgs()
+  rand = np.random.RandomState(args.seed)
+  if args.strategies:
+    return CompareStrategies(args, rand)
+  if args.circuit_sizes:
+    return CompareCircuits(args, rand)
+  print('%10s %12s %12s' % ('size', 'matching', 'flow'))
+  for size in args.sizes:
+    matching = BenchmarkMatching(size, args.max_weight, rand)
+    flow = BenchmarkFlow(size, args.max_weight, rand)
+    print('%10d %12.3f %12.3f' % (size, matching, flow))
+    sys.stdout.flush()
+  return True
+
+
+if __name__ == '__main__':
+  sys.exit(0 if Main() else 1)